@@ -1,8 +1,10 @@
 import re
 import json
 import sqlite3
+import tempfile
+import threading
+import time
 from datetime import datetime, timedelta, timezone
-from collections import Counter
 import numpy as np
 
 import pandas as pd
@@ -12,8 +14,21 @@ import matplotlib
 import matplotlib.pyplot as plt
 
 import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from cooccur import NORMALIZATIONS, cooccurrence, doc_term_matrix, normalize
+from db import MESSAGE_COLUMNS, ROLLUP_UTC_OFFSET_SEC, message_filters, message_rows_query, to_epoch
+from export import ExportFilters, available_formats, export_messages, export_mime
+
 DB_PATH = os.getenv("STREAMLIT_DB_PATH", "./db/osint_tele.db")
 
+# 正規表現の記号を含まない検索語は SQL（FTS5）側で絞り込む
+_REGEX_META_RE = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
 matplotlib.rcParams['font.family'] = [
     'Noto Sans CJK JP',   # 日本語
     'Noto Sans Arabic',   # アラビア語
@@ -50,151 +65,313 @@ st.caption("テレグラム収集結果の可視化")
 # -----------------------------
 # DB utils
 # -----------------------------
-@st.cache_data(show_spinner=False, ttl=60)
-def load_messages(limit:int=10000, dt_from:str|None=None, dt_to:str|None=None,
-                  min_score:int=0, chat_query:str|None=None) -> pd.DataFrame:
-    where = ["1=1"]
+@st.cache_resource
+def get_conn() -> sqlite3.Connection:
+    """再実行・セッションをまたいで使い回す読み取り専用接続（スレッド間は _db_lock で直列化）"""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.execute("PRAGMA query_only=ON;")
+    return conn
+
+@st.cache_resource
+def _db_lock() -> threading.Lock:
+    return threading.Lock()
+
+def _keyword_scope(dt_from:str|None, dt_to:str|None, where:str, alias:str="k") -> tuple[str, list]:
+    """
+    message_keywords k（または message_tokens t）を messages 側の絞り込みに合わせる WHERE 句
+    （alias.ts で索引を使う）。
+    """
+    clause = [f"({alias}.chat_id, {alias}.message_id) IN "
+              f"(SELECT chat_id, message_id FROM messages WHERE {where})"]
     params: list = []
-
     if dt_from:
-        where.append("date >= ?")
-        params.append(dt_from)
+        clause.append(f"{alias}.ts >= ?")
+        params.append(to_epoch(dt_from))
     if dt_to:
-        where.append("date <= ?")
-        params.append(dt_to)
-    if min_score:
-        where.append("score >= ?")
-        params.append(min_score)
-    if chat_query:
-        where.append("(LOWER(chat_title) LIKE ? OR LOWER(chat_username) LIKE ?)")
-        like = f"%{chat_query.lower()}%"
-        params += [like, like]
+        clause.append(f"{alias}.ts <= ?")
+        params.append(to_epoch(dt_to))
+    return " AND ".join(clause), params
+
+@st.cache_data(show_spinner=False, ttl=60)
+def load_keyword_counts(top:int=20, dt_from:str|None=None, dt_to:str|None=None,
+                        min_score:int=0, chat_query:str|None=None,
+                        text_query:str|None=None, langs:list[str]|None=None) -> pd.DataFrame:
+    """キーワード別ヒット件数（message_keywords の集計。取得件数上限に依らず期間全体）"""
+    with _db_lock():
+        conn = get_conn()
+        where, params = message_filters(conn, dt_from, dt_to, min_score, chat_query, text_query, langs)
+        scope, scope_params = _keyword_scope(dt_from, dt_to, where)
+        q = f"""
+          SELECT k.keyword AS keyword, COUNT(*) AS count
+          FROM message_keywords k
+          WHERE {scope}
+          GROUP BY k.keyword
+          ORDER BY count DESC
+          LIMIT ?
+        """
+        return pd.read_sql(q, conn, params=params + scope_params + [top])
+
+@st.cache_data(show_spinner=False, ttl=60)
+def load_keyword_daily(keywords:list[str], dt_from:str|None=None, dt_to:str|None=None,
+                       min_score:int=0, chat_query:str|None=None,
+                       text_query:str|None=None, langs:list[str]|None=None) -> pd.DataFrame:
+    """選択キーワードの日次件数（JST 日付 × keyword）"""
+    if not keywords:
+        return pd.DataFrame(columns=["day", "keyword", "count"])
+    with _db_lock():
+        conn = get_conn()
+        where, params = message_filters(conn, dt_from, dt_to, min_score, chat_query, text_query, langs)
+        scope, scope_params = _keyword_scope(dt_from, dt_to, where)
+        q = f"""
+          SELECT DATE(k.ts, 'unixepoch', '+9 hours') AS day, k.keyword AS keyword, COUNT(*) AS count
+          FROM message_keywords k
+          WHERE k.keyword IN ({','.join('?' * len(keywords))}) AND {scope}
+          GROUP BY day, k.keyword
+          ORDER BY day
+        """
+        df = pd.read_sql(q, conn, params=list(keywords) + params + scope_params)
+    if not df.empty:
+        df["day"] = pd.to_datetime(df["day"]).dt.date
+    return df
 
+def _jst_day(iso:str|None) -> str|None:
+    """ISO 日時 → rollup_* の day（JST の YYYY-MM-DD）"""
+    ts = to_epoch(iso)
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts + ROLLUP_UTC_OFFSET_SEC, tz=timezone.utc).strftime("%Y-%m-%d")
+
+@st.cache_data(show_spinner=False, ttl=60)
+def load_rollup_daily(day_from:str|None, day_to:str|None, min_score:int=0,
+                      langs:list[str]|None=None) -> pd.DataFrame:
+    """rollup_daily を (day, chat_id, score) 単位で返す。件数は日数×チャネル数で、メッセージ数に依らない"""
+    where = ["hits > 0"]
+    params: list = []
+    if day_from:
+        where.append("day >= ?"); params.append(day_from)
+    if day_to:
+        where.append("day <= ?"); params.append(day_to)
+    if min_score:
+        where.append("score >= ?"); params.append(min_score)
+    if langs:
+        where.append(f"lang IN ({','.join('?' * len(langs))})"); params += list(langs)
     q = f"""
-      SELECT date, chat_title, chat_username, message_id,
-             text, text_ja, lang, matched_keywords, score, url
-      FROM messages
+      SELECT day, chat_id, MAX(chat_label) AS chat_label, score, SUM(hits) AS hits
+      FROM rollup_daily
       WHERE {' AND '.join(where)}
-      ORDER BY date DESC
-      LIMIT ?
+      GROUP BY day, chat_id, score
     """
-    params.append(limit)
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql(q, conn, params=params)
-    conn.close()
+    with _db_lock():
+        df = pd.read_sql(q, get_conn(), params=params)
+    if not df.empty:
+        df["day"] = pd.to_datetime(df["day"]).dt.date
+    return df
 
+@st.cache_data(show_spinner=False, ttl=60)
+def load_rollup_keywords(day_from:str|None, day_to:str|None,
+                         langs:list[str]|None=None) -> pd.DataFrame:
+    """rollup_daily_kw を (day, keyword) 単位で返す"""
+    where = ["hits > 0"]
+    params: list = []
+    if day_from:
+        where.append("day >= ?"); params.append(day_from)
+    if day_to:
+        where.append("day <= ?"); params.append(day_to)
+    if langs:
+        where.append(f"lang IN ({','.join('?' * len(langs))})"); params += list(langs)
+    q = f"""
+      SELECT day, keyword, SUM(hits) AS count
+      FROM rollup_daily_kw
+      WHERE {' AND '.join(where)}
+      GROUP BY day, keyword
+    """
+    with _db_lock():
+        df = pd.read_sql(q, get_conn(), params=params)
     if not df.empty:
-        df["dt"] = pd.to_datetime(df["date"], errors="coerce", utc=True)
-        df["dt_local"] = df["dt"].dt.tz_convert("Asia/Tokyo")
-        df["day"] = df["dt_local"].dt.date
-
-        def parse_mk(x):
-            if x is None:
-                return []
-            s = str(x).strip()
-            if s.startswith("["):
-                try:
-                    return json.loads(s)
-                except Exception:
-                    pass
-            return [w.strip() for w in re.split(r"[,\s]+", s) if w.strip()]
-
-        df["kw_list"] = df["matched_keywords"].apply(parse_mk)
-        df["kw_flat"] = df["kw_list"].apply(lambda xs: [str(x).lower() for x in xs])
+        df["day"] = pd.to_datetime(df["day"]).dt.date
     return df
 
-# -----------------------------
-# Sudachi トークナイザ（フォールバック付）
-# -----------------------------
-_SUDACHI_AVAILABLE = False
-try:
-    from sudachipy import tokenizer as _tok
-    from sudachipy import dictionary as _dict
-    _SUDACHI_AVAILABLE = True
-    _SUDACHI = _dict.Dictionary().create()
-    _SPLIT_MODE = _tok.Tokenizer.SplitMode.B  # A:短, B:中, C:長
-except Exception:
-    _SUDACHI_AVAILABLE = False
-    _SUDACHI = None
-    _SPLIT_MODE = None
-
-
-_JA_TOKEN_RE = re.compile(r"[一-龥々〆ヵヶぁ-んァ-ヴーｦ-ﾟーA-Za-z0-9]+")
-
-_DEFAULT_STOPWORDS = {
-    "の","に","は","を","が","と","て","で","も","や","から","まで","より","へ",
-    "です","ます","でした","だ","な","ない","いる","ある","する","なる","できる",
-    "こと","これ","それ","あれ","ため","よう","さん","など","そして","しかし","また",
-    "として","について","により","に対して","または","および","及び","もの","ために",
-    "下さい","ください","すること","でき","できた","した","しています","している","して"
-}
-
-_ALLOWED_POS = {
-    "名詞", "固有名詞", "動詞", "形容詞", "外来語"
-}
-
-def _tokenize_ja_sudachi(text: str,
-                         stopwords: set[str],
-                         min_len: int) -> list[str]:
-    if not isinstance(text, str) or not text:
-        return []
-    tokens = []
-    for m in _SUDACHI.tokenize(text, _SPLIT_MODE):
-        surf = m.surface().strip().lower()
-        if len(surf) < min_len:
-            continue
-        pos = m.part_of_speech()[0] if m.part_of_speech() else ""
-        if pos not in _ALLOWED_POS:
-            continue
-        if surf in stopwords:
-            continue
-        tokens.append(surf)
-    return tokens
-
-def _tokenize_ja_fallback(text: str,
-                          stopwords: set[str],
-                          min_len: int) -> list[str]:
-    if not isinstance(text, str) or not text:
-        return []
-    toks = _JA_TOKEN_RE.findall(text)
-    out = []
-    for t in toks:
-        t = t.strip().lower()
-        if len(t) < min_len:
-            continue
-        if t in stopwords:
-            continue
-        out.append(t)
-    return out
-
-def tokenize_ja(text: str,
-                stopwords: set[str] = _DEFAULT_STOPWORDS,
-                min_len: int = 2) -> list[str]:
-    if _SUDACHI_AVAILABLE and _SUDACHI is not None:
-        return _tokenize_ja_sudachi(text, stopwords, min_len)
-    else:
-        return _tokenize_ja_fallback(text, stopwords, min_len)
+def _prepare_messages(df: pd.DataFrame) -> pd.DataFrame:
+    """日時の JST 変換とキーワード列の展開（新しく読んだ行だけに適用する）"""
+    if df.empty:
+        return df
+    df["dt"] = pd.to_datetime(df["date"], errors="coerce", utc=True)
+    df["dt_local"] = df["dt"].dt.tz_convert("Asia/Tokyo")
+    df["day"] = df["dt_local"].dt.date
+
+    def parse_mk(x):
+        if x is None:
+            return []
+        s = str(x).strip()
+        if s.startswith("["):
+            try:
+                return json.loads(s)
+            except Exception:
+                pass
+        return [w.strip() for w in re.split(r"[,\s]+", s) if w.strip()]
+
+    df["kw_list"] = df["matched_keywords"].apply(parse_mk)
+    df["kw_flat"] = df["kw_list"].apply(lambda xs: [str(x).lower() for x in xs])
+    return df
 
-@st.cache_data(show_spinner=False, ttl=60)
-def build_token_stats(df: pd.DataFrame,
-                      text_col: str = "text_ja",
-                      min_len: int = 2,
-                      limit_docs: int = 20000) -> tuple[Counter, dict]:
+# 訳待ち（text_ja が空）の行を再実行ごとに読み直す期間。過ぎたら翻訳されない行とみなす
+TEXT_JA_RECHECK_S = 600
+
+def _query_messages(limit:int, dt_from:str|None, dt_to:str|None, min_score:int,
+                    chat_query:str|None, text_query:str|None, langs:list[str]|None,
+                    after_id:int|None=None) -> pd.DataFrame:
+    with _db_lock():
+        conn = get_conn()
+        q, params = message_rows_query(conn, limit, dt_from, dt_to, min_score,
+                                       chat_query, text_query, langs, after_id=after_id)
+        df = pd.read_sql(q, conn, params=params)
+    return _prepare_messages(df)
+
+def _query_translated(ids:list[int]) -> pd.DataFrame:
+    """ids のうち text_ja が埋まった行の (id, text_ja)"""
+    q = """
+      SELECT id, text_ja FROM messages
+      WHERE id IN (SELECT value FROM json_each(?)) AND text_ja <> ''
+    """
+    with _db_lock():
+        return pd.read_sql(q, get_conn(), params=[json.dumps(ids)])
+
+def _untranslated(df: pd.DataFrame) -> pd.Series:
+    return (df["text_ja"].fillna("") == "") & ~df["lang"].fillna("").str.startswith("ja")
+
+def load_messages(limit:int=10000, dt_from:str|None=None, dt_to:str|None=None,
+                  min_score:int=0, chat_query:str|None=None,
+                  text_query:str|None=None, langs:list[str]|None=None,
+                  days:int|None=None) -> pd.DataFrame:
     """
-    日本語訳カラムからトークン頻度と各ポストのトークンを構築
-    return: (freq_counter, {doc_index: [tokens...]})
+    セッション内に前回の結果を持ち、以降の再実行では id（rowid）が前回より大きい行だけを id 順に読んで追記し、
+    並べ替えは pandas 側で行う。差分が limit を超えたら全件を読み直す。
+    期間外に出た行と limit を超えた古い行は落とす。絞り込み条件が変わったときだけ全件を読み直す。
+    訳待ちの行は TEXT_JA_RECHECK_S 秒まで再実行ごとに text_ja を読み直す（訳は翻訳ワーカーが後から埋める）。
     """
-    if df.empty or text_col not in df.columns:
-        return Counter(), {}
-    sub = df.head(min(limit_docs, len(df))).copy()
-    doc_tokens = {}
-    freq = Counter()
-    for i, txt in enumerate(sub[text_col].fillna("").astype(str)):
-        toks = tokenize_ja(txt, min_len=min_len)
-        if toks:
-            doc_tokens[i] = toks
-            freq.update(toks)
-    return freq, doc_tokens
+    key = (limit, days, min_score, chat_query, text_query, tuple(langs or ()))
+    cache = st.session_state.get("msg_cache")
+    now = time.monotonic()
+    new = None
+    if cache is not None and cache["key"] == key:
+        new = _query_messages(limit + 1, dt_from, dt_to, min_score, chat_query, text_query, langs,
+                              after_id=cache["max_id"])
+    if new is None or len(new) > limit:
+        df = _query_messages(limit, dt_from, dt_to, min_score, chat_query, text_query, langs)
+        max_id = int(df["id"].max()) if not df.empty else 0
+        pending = {}
+        new = df
+    else:
+        df, max_id, pending = cache["df"], cache["max_id"], cache["pending"]
+        pending = {i: t for i, t in pending.items() if now - t < TEXT_JA_RECHECK_S}
+        if pending:
+            done = _query_translated(list(pending))
+            if not done.empty:
+                text_ja = dict(zip(done["id"], done["text_ja"]))
+                hit = df["id"].isin(text_ja.keys())
+                df.loc[hit, "text_ja"] = df.loc[hit, "id"].map(text_ja)
+                for i in text_ja:
+                    pending.pop(i, None)
+        if not new.empty:
+            df = pd.concat([new, df], ignore_index=True).sort_values("ts", ascending=False)
+            max_id = max(max_id, int(new["id"].max()))
+        ts_from = to_epoch(dt_from)
+        if ts_from is not None:
+            df = df[df["ts"] >= ts_from]
+        df = df.head(limit).reset_index(drop=True)
+    if not new.empty:
+        pending.update((int(i), now) for i in new.loc[_untranslated(new), "id"])
+    shown = set(df["id"].tolist())
+    pending = {i: t for i, t in pending.items() if i in shown}
+    st.session_state["msg_cache"] = {"key": key, "df": df, "max_id": max_id, "pending": pending}
+    return df
+
+# 頻出語として SQL から返す語数の上限（Top N・トレンドの選択肢・共起 Top N の最大値）
+TOKEN_TOP_MAX = 200
+
+@st.cache_data(show_spinner=False, ttl=60)
+def load_token_counts(top:int=TOKEN_TOP_MAX, min_len:int=1, dt_from:str|None=None, dt_to:str|None=None,
+                      min_score:int=0, chat_query:str|None=None,
+                      text_query:str|None=None, langs:list[str]|None=None) -> pd.DataFrame:
+    """text_ja のトークン別出現回数の上位（message_tokens を絞り込み後のメッセージで集計）"""
+    with _db_lock():
+        conn = get_conn()
+        where, params = message_filters(conn, dt_from, dt_to, min_score, chat_query, text_query, langs)
+        scope, scope_params = _keyword_scope(dt_from, dt_to, where, alias="t")
+        q = f"""
+          SELECT t.token AS token, SUM(t.tf) AS count
+          FROM message_tokens t
+          WHERE LENGTH(t.token) >= ? AND {scope}
+          GROUP BY t.token
+          ORDER BY count DESC, token
+          LIMIT ?
+        """
+        return pd.read_sql(q, conn, params=[min_len] + params + scope_params + [top])
+
+@st.cache_data(show_spinner=False, ttl=60)
+def load_token_daily(tokens:list[str], dt_from:str|None=None, dt_to:str|None=None,
+                     min_score:int=0, chat_query:str|None=None,
+                     text_query:str|None=None, langs:list[str]|None=None) -> pd.DataFrame:
+    """選択トークンを含むメッセージの日次件数（JST 日付 × token）"""
+    if not tokens:
+        return pd.DataFrame(columns=["day", "token", "count"])
+    with _db_lock():
+        conn = get_conn()
+        where, params = message_filters(conn, dt_from, dt_to, min_score, chat_query, text_query, langs)
+        scope, scope_params = _keyword_scope(dt_from, dt_to, where, alias="t")
+        q = f"""
+          SELECT DATE(t.ts, 'unixepoch', '+9 hours') AS day, t.token AS token, COUNT(*) AS count
+          FROM message_tokens t
+          WHERE t.token IN ({','.join('?' * len(tokens))}) AND {scope}
+          GROUP BY day, t.token
+          ORDER BY day
+        """
+        df = pd.read_sql(q, conn, params=list(tokens) + params + scope_params)
+    if not df.empty:
+        df["day"] = pd.to_datetime(df["day"]).dt.date
+    return df
+
+@st.cache_data(show_spinner=False, ttl=60)
+def load_postings(tokens:list[str], dt_from:str|None=None, dt_to:str|None=None,
+                  min_score:int=0, chat_query:str|None=None,
+                  text_query:str|None=None, langs:list[str]|None=None) -> pd.DataFrame:
+    """共起用に、指定トークンの postings（chat_id, message_id, token, JST 日付）だけを読む"""
+    if not tokens:
+        return pd.DataFrame(columns=["chat_id", "message_id", "token", "day"])
+    with _db_lock():
+        conn = get_conn()
+        where, params = message_filters(conn, dt_from, dt_to, min_score, chat_query, text_query, langs)
+        scope, scope_params = _keyword_scope(dt_from, dt_to, where, alias="t")
+        q = f"""
+          SELECT t.chat_id AS chat_id, t.message_id AS message_id, t.token AS token,
+                 DATE(t.ts, 'unixepoch', '+9 hours') AS day
+          FROM message_tokens t
+          WHERE t.token IN ({','.join('?' * len(tokens))}) AND {scope}
+        """
+        df = pd.read_sql(q, conn, params=list(tokens) + params + scope_params)
+    if not df.empty:
+        df["day"] = pd.to_datetime(df["day"]).dt.date
+    return df
+
+@st.cache_data(show_spinner=False, ttl=60)
+def load_token_docs(dt_from:str|None=None, dt_to:str|None=None,
+                    min_score:int=0, chat_query:str|None=None,
+                    text_query:str|None=None, langs:list[str]|None=None) -> pd.DataFrame:
+    """トークンを持つメッセージ数の日次（JST）。共起の正規化（pmi/lift）の文書数に使う"""
+    with _db_lock():
+        conn = get_conn()
+        where, params = message_filters(conn, dt_from, dt_to, min_score, chat_query, text_query, langs)
+        scope, scope_params = _keyword_scope(dt_from, dt_to, where, alias="t")
+        q = f"""
+          SELECT day, COUNT(*) AS docs
+          FROM (SELECT DISTINCT t.chat_id, t.message_id, DATE(t.ts, 'unixepoch', '+9 hours') AS day
+                FROM message_tokens t WHERE {scope})
+          GROUP BY day
+        """
+        df = pd.read_sql(q, conn, params=params + scope_params)
+    if not df.empty:
+        df["day"] = pd.to_datetime(df["day"]).dt.date
+    return df
 
 # -----------------------------
 # Sidebar filters
@@ -221,6 +398,7 @@ with st.sidebar:
 
     if manual_btn:
         st.cache_data.clear()
+        st.session_state.pop("msg_cache", None)
 
     st.markdown("---")
     st.caption("日本語訳の可視化（Sudachi対応）")
@@ -254,13 +432,16 @@ else:
 # -----------------------------
 # Load
 # -----------------------------
-df = load_messages(limit=limit, dt_from=dt_from, dt_to=dt_to,
-                   min_score=min_score, chat_query=chat_query or None)
+kw_term = kw_filter.strip()
+kw_in_sql = bool(kw_term) and not _REGEX_META_RE.search(kw_term)
 
-if show_langs:
-    df = df[df["lang"].isin(show_langs)]
+filters = dict(dt_from=dt_from, dt_to=dt_to, min_score=min_score,
+               chat_query=chat_query or None,
+               text_query=kw_term if kw_in_sql else None,
+               langs=show_langs or None)
+df = load_messages(limit=limit, days=days, **filters)
 
-if kw_filter.strip():
+if kw_term and not kw_in_sql:
     pat = re.compile(kw_filter, re.IGNORECASE)
     df = df[
         df["text"].fillna("").str.contains(pat)
@@ -269,27 +450,45 @@ if kw_filter.strip():
     ]
 
 st.success(
-    f"読み込み: {len(df):,} 件（期間: {dt_from[:10]}–{dt_to[:10]} / score≥{min_score} / "
-    f"Sudachi={'ON' if _SUDACHI_AVAILABLE else 'OFF'}）"
+    f"読み込み: {len(df):,} 件（期間: {dt_from[:10]}–{dt_to[:10]} / score≥{min_score}）"
 )
 
 # -----------------------------
 # Summary
 # -----------------------------
+# チャネル/本文の絞り込みが無ければ、件数・日次・チャネル別・キーワードは日次集計（rollup_*）から読む。
+# 日単位なので期間の端は日ごと丸まる。
+use_rollup = not (chat_query or kw_term)
+day_from, day_to = _jst_day(dt_from), _jst_day(dt_to)
+if use_rollup:
+    ru = load_rollup_daily(day_from, day_to, min_score, show_langs or None)
+    total_hits = int(ru["hits"].sum()) if not ru.empty else 0
+    n_channels = ru["chat_id"].nunique() if not ru.empty else 0
+    avg_score = (ru["score"] * ru["hits"]).sum() / total_hits if total_hits else None
+else:
+    total_hits = len(df)
+    n_channels = df['chat_username'].nunique() or df['chat_title'].nunique()
+    avg_score = df['score'].mean() if not df.empty else None
+# キーワードは score 軸を持たないので、しきい値が全ヒット相当（≤1）のときだけ集計表を使う
+kw_rollup = use_rollup and min_score <= 1
+
 c1, c2, c3, c4 = st.columns(4)
 with c1:
-    st.metric("総ヒット件数", f"{len(df):,}")
+    st.metric("総ヒット件数", f"{total_hits:,}")
 with c2:
-    st.metric("ユニークチャネル", f"{df['chat_username'].nunique() or df['chat_title'].nunique():,}")
+    st.metric("ユニークチャネル", f"{n_channels:,}")
 with c3:
-    st.metric("平均スコア", f"{df['score'].mean():.2f}" if not df.empty else "–")
+    st.metric("平均スコア", f"{avg_score:.2f}" if avg_score is not None else "–")
 with c4:
     last_dt = df["dt_local"].max() if not df.empty else None
     st.metric("最新検知（JST）", last_dt.strftime("%Y-%m-%d %H:%M") if last_dt is not None else "–")
 
 if not df.empty:
     st.subheader("日次ヒット推移")
-    daily = df.groupby("day").size().reset_index(name="count")
+    if use_rollup:
+        daily = ru.groupby("day")["hits"].sum().reset_index(name="count")
+    else:
+        daily = df.groupby("day").size().reset_index(name="count")
     fig = plt.figure(figsize=FIG_1)
     plt.plot(daily["day"], daily["count"])
     plt.title("Daily Hits (JST)")
@@ -299,9 +498,13 @@ if not df.empty:
         st.pyplot(fig)
 
     st.subheader("チャネル別ヒット（Top 15）")
-    chan = (df.assign(chan=lambda x: x["chat_username"].where(x["chat_username"].ne(""),
-                                                              other=x["chat_title"]))
-              .groupby("chan").size().sort_values(ascending=False).head(15))
+    if use_rollup:
+        chan = (ru.groupby("chat_id").agg(chan=("chat_label", "max"), hits=("hits", "sum"))
+                  .set_index("chan")["hits"].sort_values(ascending=False).head(15))
+    else:
+        chan = (df.assign(chan=lambda x: x["chat_username"].where(x["chat_username"].ne(""),
+                                                                  other=x["chat_title"]))
+                  .groupby("chan").size().sort_values(ascending=False).head(15))
     fig = plt.figure(figsize=FIG_1)
     chan.sort_values().plot(kind="barh")
     plt.title("Top Channels")
@@ -310,15 +513,46 @@ if not df.empty:
         st.pyplot(fig)
 
     st.subheader("キーワード頻度（Top 20）")
-    kw_series = pd.Series([k for ks in df["kw_flat"] for k in (ks or [])])
-    if not kw_series.empty:
+    if kw_rollup:
+        kw_days = load_rollup_keywords(day_from, day_to, show_langs or None)
+        topkw = (kw_days.groupby("keyword")["count"].sum().sort_values(ascending=False).head(20).sort_values()
+                 if not kw_days.empty else pd.Series(dtype=int))
+    elif kw_term and not kw_in_sql:
+        # 正規表現の絞り込みは pandas 側なので、読み込んだ行から数える
+        kw_series = pd.Series([k for ks in df["kw_flat"] for k in (ks or [])])
         topkw = kw_series.value_counts().head(20).sort_values()
+    else:
+        kw_counts = load_keyword_counts(top=20, **filters)
+        topkw = kw_counts.set_index("keyword")["count"].sort_values()
+    if not topkw.empty:
         fig = plt.figure(figsize=FIG_1)
         topkw.plot(kind="barh")
         plt.title("Top Keywords")
         plt.xlabel("Count"); plt.ylabel("Keyword")
         with _plot_slot(plot_width_pct, plot_align):
             st.pyplot(fig)
+
+        st.subheader("キーワード別の日次推移（JST）")
+        kw_options = list(topkw.sort_values(ascending=False).index)
+        kw_chosen = st.multiselect("キーワードを選択（最大5）", options=kw_options,
+                                   default=kw_options[:3], max_selections=5)
+        if kw_chosen:
+            if kw_rollup:
+                kw_daily = kw_days[kw_days["keyword"].isin(kw_chosen)]
+            else:
+                kw_daily = load_keyword_daily(kw_chosen, **filters)
+            if not kw_daily.empty:
+                pivot = kw_daily.pivot(index="day", columns="keyword", values="count").fillna(0)
+                fig = plt.figure(figsize=FIG_2)
+                for kw in kw_chosen:
+                    if kw in pivot.columns:
+                        plt.plot(pivot.index, pivot[kw], label=kw)
+                plt.title("Keyword Daily Trend (JST)")
+                plt.xlabel("Date"); plt.ylabel("Hits")
+                plt.xticks(rotation=45)
+                plt.legend()
+                with _plot_slot(plot_width_pct, plot_align):
+                    st.pyplot(fig)
     else:
         st.info("キーワード情報がありません。")
 
@@ -332,12 +566,14 @@ if not df.empty:
 
 if not df.empty:
     st.subheader("日本語訳の頻出語（Top N）")
-    freq, doc_tokens = build_token_stats(df, text_col="text_ja", min_len=ja_min_len)
+    # トークンは保存時に計算済み（message_tokens）。頻度・日次は SQL で集計し、postings は共起の語だけ読む
+    tok_counts = load_token_counts(TOKEN_TOP_MAX, ja_min_len, **filters)
 
-    if freq:
-        top_items = freq.most_common(ja_topn)
-        labels = [w for w, _ in top_items][::-1]
-        values = [c for _, c in top_items][::-1]
+    if not tok_counts.empty:
+        freq = tok_counts.set_index("token")["count"]
+        top_items = freq.head(ja_topn)
+        labels = list(top_items.index)[::-1]
+        values = list(top_items.values)[::-1]
 
         fig = plt.figure(figsize=FIG_1)
         plt.barh(range(len(values)), values)
@@ -348,25 +584,18 @@ if not df.empty:
             st.pyplot(fig)
 
         st.subheader("選択トークンの日次トレンド（JST）")
-        all_top = [w for w, _ in freq.most_common(min(50, len(freq)))]
+        all_top = list(freq.head(50).index)
         default_sel = all_top[:3]
         chosen = st.multiselect("トークンを選択（最大5）", options=all_top, default=default_sel, max_selections=5)
         if chosen:
-            daily_tok = df.groupby("day").size().reset_index(name="__dummy__")[["day"]].copy()
-            for tok in chosen:
-                hit = []
-                for txt in df["text_ja"].fillna("").astype(str):
-                    toks = tokenize_ja(txt, min_len=ja_min_len)
-                    hit.append(1 if tok in toks else 0)
-                tmp = df.copy()
-                tmp["__hit__"] = hit
-                g = tmp.groupby("day")["__hit__"].sum().reset_index(name=tok)
-                daily_tok = daily_tok.merge(g, on="day", how="left")
-            daily_tok = daily_tok.fillna(0)
+            days_all = sorted(df["day"].unique())
+            daily_tok = (load_token_daily(chosen, **filters)
+                         .pivot_table(index="day", columns="token", values="count", fill_value=0)
+                         .reindex(index=days_all, columns=chosen, fill_value=0))
 
             fig = plt.figure(figsize=FIG_2)
             for tok in chosen:
-                plt.plot(daily_tok["day"], daily_tok[tok], label=tok)
+                plt.plot(daily_tok.index, daily_tok[tok], label=tok)
             plt.title("Token Daily Trend (JST)")
             plt.xlabel("Date"); plt.ylabel("Count")
             plt.xticks(rotation=45)
@@ -375,39 +604,66 @@ if not df.empty:
                 st.pyplot(fig)
 
         st.subheader("上位語の共起ヒートマップ")
-        top_for_co = [w for w, _ in freq.most_common(min(20, len(freq)))]
-        idx = {w:i for i, w in enumerate(top_for_co)}
-        mat = np.zeros((len(top_for_co), len(top_for_co)), dtype=int)
-
-        for toks in doc_tokens.values():
-            present = [w for w in set(toks) if w in idx]
-            for i in range(len(present)):
-                for j in range(i+1, len(present)):
-                    a, b = idx[present[i]], idx[present[j]]
-                    mat[a, b] += 1
-                    mat[b, a] += 1
-
-        if len(top_for_co) > 0:
+        co1, co2, co3 = st.columns(3)
+        with co1:
+            co_topn = st.slider("共起 Top N", 10, 200, 20, step=10)
+        with co2:
+            co_norm = st.selectbox("正規化", list(NORMALIZATIONS), index=0,
+                                   help="count=共起文書数 / pmi=log(P(i,j)/P(i)P(j)) / lift=P(i,j)/P(i)P(j)")
+        with co3:
+            co_window = st.selectbox("対象", ["全期間", "直近7日", "7日より前"], index=0)
+        top_for_co = list(freq.head(co_topn).index)
+
+        # 文書×語彙の疎行列 X を作り、共起は X.T @ X の1回の積で求める
+        post = load_postings(top_for_co, **filters)
+        docs = load_token_docs(**filters)
+        co_post = post
+        if co_window != "全期間":
+            cut = (datetime.now(timezone.utc) + timedelta(hours=9)).date() - timedelta(days=7)
+            recent = co_window == "直近7日"
+            co_post = post[post["day"] > cut] if recent else post[post["day"] <= cut]
+            docs = docs[docs["day"] > cut] if recent else docs[docs["day"] <= cut]
+        doc_ids = co_post.groupby(["chat_id", "message_id"]).ngroup().to_numpy()
+        X, _ = doc_term_matrix(doc_ids, co_post["token"].tolist(), top_for_co)
+        # 文書数は上位語を含まない文書も数える（postings は上位語の分しか読まないので別に集計）
+        n_docs = int(docs["docs"].sum()) if not docs.empty else 0
+        mat = normalize(cooccurrence(X), n_docs, co_norm)
+
+        if len(top_for_co) > 0 and n_docs > 0:
             fig = plt.figure(figsize=FIG_3)
             plt.imshow(mat, aspect="auto")
-            plt.title("Co-occurrence (Top tokens in text_ja)")
-            plt.xticks(range(len(top_for_co)), top_for_co, rotation=90)
-            plt.yticks(range(len(top_for_co)), top_for_co)
+            plt.title(f"Co-occurrence [{co_norm}] (Top {len(top_for_co)} tokens, docs={n_docs:,})")
+            if len(top_for_co) <= 50:
+                plt.xticks(range(len(top_for_co)), top_for_co, rotation=90)
+                plt.yticks(range(len(top_for_co)), top_for_co)
             plt.xlabel("Token")
             plt.ylabel("Token")
             plt.colorbar()
             with _plot_slot(plot_width_pct, plot_align):
                 st.pyplot(fig)
 
-        freq_df = pd.DataFrame(freq.most_common(), columns=["token","count"])
-        st.download_button(
-            "頻度表（CSV）をダウンロード",
-            data=freq_df.to_csv(index=False).encode("utf-8"),
-            file_name="ja_token_freq.csv",
-            mime="text/csv"
-        )
+            # 上位の組（ラベルが読めない大きな行列でも確認できるように）
+            iu = np.triu_indices(len(top_for_co), k=1)
+            pairs = pd.DataFrame({
+                "token_a": np.asarray(top_for_co)[iu[0]],
+                "token_b": np.asarray(top_for_co)[iu[1]],
+                co_norm: mat[iu],
+            }).sort_values(co_norm, ascending=False).head(30)
+            st.dataframe(pairs, height=240)
+        else:
+            st.info("対象期間にトークンを持つ文書がありません。")
+
+        if st.checkbox(f"頻度表（上位 {TOKEN_TOP_MAX} 語、CSV）を用意"):
+            freq_df = freq.rename("count").rename_axis("token").reset_index()
+            st.download_button(
+                "頻度表（CSV）をダウンロード",
+                data=freq_df.to_csv(index=False).encode("utf-8"),
+                file_name="ja_token_freq.csv",
+                mime="text/csv"
+            )
     else:
-        st.info("日本語訳（text_ja）からトークンを抽出できませんでした。")
+        st.info("日本語訳（text_ja）のトークンがありません。既存データは "
+                "`tele_osint_cli.py --rebuild-tokens` でトークン化できます。")
 
 # -----------------------------
 # Table
@@ -437,7 +693,59 @@ else:
 # -----------------------------
 # Export
 # -----------------------------
+EXPORT_PREFIX = "osint_export_"
+# 作成したエクスポートを受け取り待ちで保持する時間（過ぎたら消し、自動更新の再実行でも読まない）
+EXPORT_TTL_S = 600
+
+def _drop_export() -> None:
+    """受け取り待ちのエクスポートを破棄する（ダウンロード後・絞り込み変更・期限切れ）"""
+    exp = st.session_state.pop("export_file", None)
+    if exp and os.path.exists(exp["path"]):
+        os.remove(exp["path"])
+
+def _purge_exports(max_age_s:int) -> None:
+    """他のセッションや落ちたプロセスが残した古いエクスポートの一時ファイルを消す"""
+    cutoff = time.time() - max_age_s
+    for p in Path(tempfile.gettempdir()).glob(EXPORT_PREFIX + "*"):
+        try:
+            if p.stat().st_mtime < cutoff:
+                p.unlink()
+        except OSError:
+            pass
+
 st.sidebar.markdown("---")
-if not df.empty:
-    csv = df.to_csv(index=False).encode("utf-8")
-    st.sidebar.download_button("CSVをダウンロード", data=csv, file_name="osint_hits.csv", mime="text/csv")
+st.sidebar.caption("エクスポート（現在の絞り込み・件数上限なし）")
+exp_fmt = st.sidebar.selectbox("形式", list(available_formats()), index=0)
+exp_filters = ExportFilters(dt_from=dt_from, dt_to=dt_to, min_score=min_score,
+                            chat_query=chat_query or None,
+                            text_query=kw_term if kw_in_sql else None,
+                            langs=show_langs or [])
+exp_key = (days, min_score, chat_query, kw_term, tuple(show_langs), exp_fmt)
+exp = st.session_state.get("export_file")
+if exp and (exp["key"] != exp_key or time.time() - exp["created"] > EXPORT_TTL_S
+            or not os.path.exists(exp["path"])):
+    _drop_export()
+
+if st.sidebar.button("エクスポートを作成"):
+    # 押されたときだけ DB からチャンク単位で一時ファイルへ書き出す（DataFrame は経由しない）
+    # 正規表現の絞り込みは SQL にできないため対象外
+    _drop_export()
+    _purge_exports(EXPORT_TTL_S)
+    # 長く掛かりうるので共有接続（_db_lock）は使わず専用の接続で読む
+    tmp = tempfile.NamedTemporaryFile(prefix=EXPORT_PREFIX, suffix=f".{exp_fmt}", delete=False)
+    exp_conn = sqlite3.connect(DB_PATH)
+    try:
+        with tmp:
+            n_rows = export_messages(exp_conn, tmp, fmt=exp_fmt, filters=exp_filters)
+    finally:
+        exp_conn.close()
+    st.session_state["export_file"] = {"path": tmp.name, "fmt": exp_fmt, "rows": n_rows,
+                                       "key": exp_key, "created": time.time()}
+
+# ファイルを読むのは受け取り待ちの間だけ。ダウンロードしたら on_click で破棄する
+exp = st.session_state.get("export_file")
+if exp:
+    with open(exp["path"], "rb") as fh:
+        st.sidebar.download_button(f"{exp['fmt'].upper()} をダウンロード（{exp['rows']:,} 件）", data=fh,
+                                   file_name=f"osint_hits.{exp['fmt']}", mime=export_mime(exp["fmt"]),
+                                   on_click=_drop_export)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 import argparse
 import asyncio
+import datetime as dt
 from pathlib import Path
 import signal
 import sys
@@ -9,6 +10,71 @@ ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "src"))
 
 from app import create_app
+from config import load_config
+from db import open_db, rebuild_rollups
+from export import EXPORT_FORMATS, ExportFilters, export_messages, format_for
+from ingest import ingest_files, parse_naive_tz
+from tokens import rebuild_tokens
+
+
+def _run_ingest(args):
+    """Telegram に接続せず、エクスポート/ダンプを取り込むだけのモード。"""
+    cfg = load_config(args.config)
+    Path(cfg.sqlite_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = open_db(cfg.sqlite_path)
+    try:
+        print(f"[ingest] {len(args.ingest)} file(s), format={args.ingest_format}")
+        st = ingest_files(cfg, conn, args.ingest, fmt=args.ingest_format,
+                          workers=args.workers, naive_tz=parse_naive_tz(args.ingest_tz),
+                          debug=args.debug)
+        rate = st.total / st.elapsed if st.elapsed else 0.0
+        print(f"[ingest] done: scanned={st.total} hits={st.hits} "
+              f"elapsed={st.elapsed:.1f}s ({rate:,.0f} msg/s)")
+    finally:
+        conn.close()
+
+
+def _run_rebuild_rollups(args):
+    """ダッシュボード用の日次集計（rollup_*）を messages から作り直す。"""
+    cfg = load_config(args.config)
+    conn = open_db(cfg.sqlite_path)
+    try:
+        rebuild_rollups(conn)
+        n = conn.execute("SELECT COUNT(*) FROM rollup_daily").fetchone()[0]
+        print(f"[rollup] rebuilt: {n} rows")
+    finally:
+        conn.close()
+
+
+def _run_rebuild_tokens(args):
+    """既存の text_ja を全件トークン化し直す（message_tokens）。"""
+    cfg = load_config(args.config)
+    conn = open_db(cfg.sqlite_path)
+    try:
+        n = rebuild_tokens(conn, debug=args.debug)
+        print(f"[tokens] rebuilt: {n} messages")
+    finally:
+        conn.close()
+
+
+def _run_export(args):
+    """ビューアと同じ絞り込みで messages を CSV / NDJSON / Parquet に書き出す（チャンク単位で逐次）。"""
+    cfg = load_config(args.config)
+    conn = open_db(cfg.sqlite_path)
+    now = dt.datetime.now(dt.timezone.utc)
+    filters = ExportFilters(
+        dt_from=(now - dt.timedelta(days=args.days)).isoformat() if args.days else None,
+        min_score=args.min_score,
+        chat_query=args.chat or None,
+        text_query=args.text or None,
+        langs=args.lang or [],
+    )
+    fmt = format_for(args.export, args.export_format)
+    try:
+        n = export_messages(conn, args.export, fmt=fmt, filters=filters)
+        print(f"[export] {n} rows -> {args.export} ({fmt})")
+    finally:
+        conn.close()
 
 
 async def _async_main(args):
@@ -71,7 +137,34 @@ def main():
     p.add_argument("--run", action="store_true")
     p.add_argument("--debug", action="store_true")
     p.add_argument("--new-only", action="store_true")
+    p.add_argument("--ingest", nargs="+", metavar="PATH",
+                   help="Telegram Desktop の result.json / JSONL ダンプをオフラインで取り込む")
+    p.add_argument("--ingest-format", choices=["auto", "tdesktop", "jsonl"], default="auto")
+    p.add_argument("--ingest-tz", default="local",
+                   help="tdesktop エクスポートの tz なし date の解釈（local / UTC / Asia/Tokyo など。既定: local）")
+    p.add_argument("--workers", type=int, default=None, help="--ingest のスコアリング並列数（既定: CPU数）")
+    p.add_argument("--rebuild-rollups", action="store_true", help="日次集計テーブルを既存データから再構築して終了")
+    p.add_argument("--rebuild-tokens", action="store_true", help="日本語訳のトークン索引を既存データから再構築して終了")
+    p.add_argument("--export", metavar="PATH", help="ヒットをファイルに書き出して終了（.csv / .ndjson / .parquet）")
+    p.add_argument("--export-format", choices=("auto",) + EXPORT_FORMATS, default="auto")
+    p.add_argument("--days", type=int, default=0, help="--export: 直近 N 日（0=全期間）")
+    p.add_argument("--min-score", type=int, default=0, help="--export: スコアしきい値")
+    p.add_argument("--chat", default="", help="--export: チャネル名/ユーザ名（部分一致）")
+    p.add_argument("--text", default="", help="--export: 本文/日本語訳/キーワード（部分一致）")
+    p.add_argument("--lang", action="append", help="--export: 言語（複数指定可）")
     args = p.parse_args()
+    if args.export:
+        _run_export(args)
+        return
+    if args.rebuild_rollups:
+        _run_rebuild_rollups(args)
+        return
+    if args.rebuild_tokens:
+        _run_rebuild_tokens(args)
+        return
+    if args.ingest:
+        _run_ingest(args)
+        return
     asyncio.run(_async_main(args))
 
 
@@ -0,0 +1,57 @@
+"""
+共起行列の計算時間比較。
+- loop:   従来のビューアの二重ループ（dense np.zeros への加算）
+- sparse: 文書×語彙の CSR 行列を作って X.T @ X
+語彙サイズ（上位 N 語）と文書数を変えて測り、両者の結果が一致することも確認する。
+
+    python bench/bench_cooccur.py [文書数]
+"""
+from __future__ import annotations
+from pathlib import Path
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from cooccur import cooccurrence, cooccurrence_loop, doc_term_matrix, normalize
+
+
+def _docs(n: int, vocab_size: int = 5000) -> list[list[str]]:
+    rng = random.Random(11)
+    words = [f"w{i}" for i in range(vocab_size)]
+    # 出現頻度に偏りを持たせる（上位語ほど多い）
+    weights = [1.0 / (i + 1) for i in range(vocab_size)]
+    return [rng.choices(words, weights=weights, k=rng.randint(5, 40)) for _ in range(n)]
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    docs = _docs(n)
+    keys = [i for i, toks in enumerate(docs) for _ in toks]
+    toks = [t for d in docs for t in d]
+    print(f"docs={n} postings={len(toks):,}")
+    print(f"{'top N':>6} | {'loop s':>8} | {'sparse s':>8} | {'speedup':>7} | same")
+    for top in (20, 50, 200):
+        vocab = [f"w{i}" for i in range(top)]
+
+        t0 = time.perf_counter()
+        dense = cooccurrence_loop(docs, vocab)
+        t_loop = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        X, n_docs = doc_term_matrix(keys, toks, vocab)
+        C = cooccurrence(X)
+        normalize(C, n_docs, "pmi")
+        t_sparse = time.perf_counter() - t0
+
+        off = C.copy()
+        np.fill_diagonal(off, 0)
+        print(f"{top:>6} | {t_loop:>8.2f} | {t_sparse:>8.2f} | {t_loop / t_sparse:>6.1f}x | {np.array_equal(off, dense)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+クロール優先度の比較（合成した言及ネットワーク上で discover_by_crawl を実行する）。
+- base:  従来の優先度（親のヒット率・深さ・seed）
+- graph: 言及グラフの personalized PageRank / ヒット元入次数を加えた優先度
+関連チャンネルの集団は互いを何度も言及し、無関係なチャンネル（広告・雑談）は散発的に言及される。
+合格チャンネル max_channels 件を見つけるまでの履歴取得（iter_messages）回数を比べる。
+Telegram には接続しない（get_entity / iter_messages を返すだけの偽クライアント）。
+
+    python bench/bench_crawl_graph.py [チャンネル数]
+"""
+from __future__ import annotations
+from pathlib import Path
+import asyncio
+import random
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from telethon import types
+
+from config import Config
+from crawl import discover_by_crawl
+import discovery
+import discovery_guard
+from scoring import init_keywords_fast_pattern
+
+
+def _world(n: int, seed: int = 5) -> tuple[dict, set]:
+    """{username: [本文, ...]} と関連チャンネル集合。"""
+    rng = random.Random(seed)
+    names = [f"chan{i:05d}" for i in range(n)]
+    good = set(names[: n // 10])
+    good_l, all_l = sorted(good), names
+    posts = {}
+    for u in names:
+        msgs = []
+        for j in range(200):
+            if u in good:
+                body = "new attack report on the victim network" if rng.random() < 0.4 else "daily news digest and more"
+                # 関連チャンネルは主に集団内を言及し（転載元・相互紹介）、一部は無関係なチャンネルを宣伝する
+                if rng.random() < 0.25:
+                    ref = rng.choice(good_l) if rng.random() < 0.6 else rng.choice(all_l)
+                    body += f" via @{ref}"
+            else:
+                body = "buy cheap followers now and join our chat" if rng.random() < 0.5 else "funny pictures every day"
+                if rng.random() < 0.1:
+                    body += f" @{rng.choice(all_l)}"
+            msgs.append(body)
+        posts[u] = msgs
+    return posts, good
+
+
+class _Msg:
+    def __init__(self, text: str):
+        self.message = text
+        self.raw_text = text
+
+
+class _Client:
+    def __init__(self, posts: dict):
+        self.posts = posts
+        self.history_calls = 0
+
+    async def get_entity(self, ref: str):
+        u = ref.lstrip("@").split("t.me/")[-1].lower()
+        if u not in self.posts:
+            raise ValueError(u)
+        return types.Channel(id=int(u[4:]) + 1, title=u, photo=types.ChatPhotoEmpty(), date=None,
+                             username=u, access_hash=1)
+
+    def iter_messages(self, entity, limit: int):
+        self.history_calls += 1
+        msgs = self.posts[entity.username][:limit]
+
+        async def gen():
+            for m in msgs:
+                yield _Msg(m)
+        return gen()
+
+    async def __call__(self, req):
+        return None
+
+
+def _reset() -> None:
+    """前の実行の低品質クールダウン・参加済みキャッシュを持ち越さない。"""
+    discovery_guard._LOW_QUALITY_UNTIL.clear()
+    discovery.DIALOG_CACHE.clear()
+
+
+def _cfg(graph: bool, max_channels: int) -> Config:
+    return Config.model_validate({
+        "api_id": 1, "api_hash": "x", "session": "bench",
+        "keywords": {"en": ["attack"]},
+        "collect": {"rate_per_sec": 0},
+        # 優先度の比較なので順序が決まるよう1ワーカーで回す
+        "discovery": {"crawl": {
+            "enabled": True, "max_depth": 4, "max_channels": max_channels,
+            "global_time_limit_s": 3600, "graph_priority": graph, "graph_refresh_every": 5,
+            "concurrency": 1,
+        }},
+    })
+
+
+async def _run(posts: dict, good: set, graph: bool, max_channels: int, seeds: list[str]) -> tuple[int, int]:
+    _reset()
+    client = _Client(posts)
+    found = await discover_by_crawl(client, _cfg(graph, max_channels), seeds=seeds)
+    return len([f for f in found if f.lstrip("@") in good]), client.history_calls
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    posts, good = _world(n)
+    init_keywords_fast_pattern(_cfg(False, 1).keywords)
+    seeds = [f"@{u}" for u in sorted(good)[-3:]]
+    print(f"channels={n} relevant={len(good)} seeds={len(seeds)}")
+    print(f"{'budget':>6} | {'mode':>5} | {'found':>5} | {'history calls':>13} | found/call")
+    for budget in (20, 50, 100):
+        for graph in (False, True):
+            hits, calls = asyncio.run(_run(posts, good, graph, budget, seeds))
+            print(f"{budget:>6} | {'graph' if graph else 'base':>5} | {hits:>5} | {calls:>13} | {hits / max(1, calls):.2f}")
+
+
+if __name__ == "__main__":
+    main()
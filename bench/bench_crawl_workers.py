@@ -0,0 +1,106 @@
+"""
+クロールのワーカー数と参加タイミングの比較（bench_crawl_graph と同じ合成ネットワーク）。
+- legacy:  1ワーカー、評価前に参加（従来の動作）
+- K=N:     N ワーカーが frontier を共有、参加せずにプローブ（参加は合格したものだけ後で行う）
+API 1回ごとに固定の遅延を入れ、全体の流量は共有の RateLimiter で抑える。
+所要時間、API 呼び出し数、JoinChannelRequest の数を比べる。
+
+    python bench/bench_crawl_workers.py [チャンネル数] [API 遅延 ms]
+"""
+from __future__ import annotations
+from pathlib import Path
+import asyncio
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from config import Config
+from crawl import discover_by_crawl
+from scoring import init_keywords_fast_pattern
+
+from bench_crawl_graph import _Client, _reset, _world
+
+RATE_PER_SEC = 20.0
+MAX_CHANNELS = 40
+
+
+class _SlowClient(_Client):
+    def __init__(self, posts: dict, latency_s: float):
+        super().__init__(posts)
+        self.latency_s = latency_s
+        self.api_calls = 0
+        self.joins = 0
+
+    async def get_entity(self, ref: str):
+        self.api_calls += 1
+        await asyncio.sleep(self.latency_s)
+        return await super().get_entity(ref)
+
+    def iter_messages(self, entity, limit: int):
+        inner = super().iter_messages(entity, limit)
+        latency = self.latency_s
+
+        async def gen():
+            n = 0
+            async for m in inner:
+                # iter_messages は 100 件ごとに1リクエスト
+                if n % 100 == 0:
+                    self.api_calls += 1
+                    await asyncio.sleep(latency)
+                n += 1
+                yield m
+        return gen()
+
+    async def __call__(self, req):
+        self.api_calls += 1
+        if type(req).__name__ == "JoinChannelRequest":
+            self.joins += 1
+        await asyncio.sleep(self.latency_s)
+        return None
+
+
+def _cfg(concurrency: int, join_accepted_only: bool) -> Config:
+    return Config.model_validate({
+        "api_id": 1, "api_hash": "x", "session": "bench",
+        "keywords": {"en": ["attack"]},
+        "collect": {"rate_per_sec": RATE_PER_SEC, "rate_burst": 5},
+        "discovery": {"crawl": {
+            "enabled": True, "max_depth": 4, "max_channels": MAX_CHANNELS,
+            "global_time_limit_s": 3600, "concurrency": concurrency,
+            "join_accepted_only": join_accepted_only,
+            # 不合格チャンネルへの参加の差を見たいので、グラフ優先度は切って従来の順序で辿る
+            "graph_priority": False,
+        }},
+    })
+
+
+async def _run(posts: dict, latency_s: float, concurrency: int, join_accepted_only: bool,
+               seeds: list[str]) -> tuple[int, float, int, int]:
+    _reset()
+    client = _SlowClient(posts, latency_s)
+    t0 = time.perf_counter()
+    found = await discover_by_crawl(client, _cfg(concurrency, join_accepted_only), seeds=seeds)
+    elapsed = time.perf_counter() - t0
+    # join_accepted_only では合格したものだけ呼び出し側（join_targets）が参加する
+    joins = client.joins if not join_accepted_only else len(found)
+    return len(found), elapsed, client.api_calls + (len(found) if join_accepted_only else 0), joins
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    latency_s = (int(sys.argv[2]) if len(sys.argv) > 2 else 150) / 1000.0
+    posts, good = _world(n)
+    init_keywords_fast_pattern(_cfg(1, True).keywords)
+    seeds = [f"@{u}" for u in sorted(good)[-3:]]
+    print(f"channels={n} latency={latency_s * 1000:.0f}ms rate={RATE_PER_SEC}/s max_channels={MAX_CHANNELS}")
+    print(f"{'mode':>8} | {'found':>5} | {'time s':>7} | {'api calls':>9} | {'joins':>5}")
+    runs = [("legacy", 1, False), ("K=1", 1, True), ("K=4", 4, True), ("K=8", 8, True)]
+    for name, k, deferred in runs:
+        found, elapsed, calls, joins = asyncio.run(_run(posts, latency_s, k, deferred, seeds))
+        print(f"{name:>8} | {found:>5} | {elapsed:>7.1f} | {calls:>9} | {joins:>5}")
+
+
+if __name__ == "__main__":
+    main()
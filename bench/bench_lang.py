@@ -0,0 +1,89 @@
+"""
+言語判定の精度とスループット比較。
+- langdetect: 従来の detect() のみ
+- script+fallback (cold): 文字種判定 → langdetect フォールバック（キャッシュ無効）
+- script+fallback (warm): 同上、転載の多いチャンネルを想定して同一本文を再判定
+
+    python bench/bench_lang.py
+"""
+from __future__ import annotations
+from pathlib import Path
+import random
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from langdetect import LangDetectException, detect
+
+import scoring
+
+SAMPLES = {
+    "ja": ["大規模なフィッシング攻撃が確認されました。", "サーバーへの不正侵入について調査中です。",
+           "新しいマルウェアが国内の企業を標的にしています。", "流出したデータが掲示板で販売されている。"],
+    "zh-cn": ["黑客组织对政府网站发动了网络攻击。", "这个漏洞已经被用于攻击多个服务器。",
+              "数据泄露事件影响了数百万用户。", "我们发现了新的勒索软件样本。"],
+    "zh-tw": ["駭客組織對政府網站發動了網路攻擊。", "這個漏洞已經被用於攻擊多個伺服器。",
+              "資料外洩事件影響了數百萬用戶。", "我們發現了新的勒索軟體樣本。"],
+    "ru": ["Хакеры атаковали серверы крупной компании.", "Эта уязвимость уже используется в атаках.",
+           "Утечка данных затронула миллионы пользователей.", "Мы обнаружили новый образец вымогателя."],
+    "ar": ["شن القراصنة هجوما على مواقع الحكومة.", "تم استغلال هذه الثغرة في مهاجمة الخوادم.",
+           "أثر تسريب البيانات على ملايين المستخدمين.", "اكتشفنا عينة جديدة من برامج الفدية."],
+    "ko": ["해커들이 정부 웹사이트를 공격했습니다.", "이 취약점은 이미 여러 서버 공격에 사용되었습니다.",
+           "데이터 유출로 수백만 명의 사용자가 피해를 입었습니다.", "새로운 랜섬웨어 샘플을 발견했습니다."],
+    "en": ["Hackers launched an attack on government websites.", "This vulnerability is already exploited.",
+           "The data breach affected millions of users.", "We found a new ransomware sample."],
+    "es": ["Los piratas informáticos atacaron sitios del gobierno.", "Esta vulnerabilidad ya se está explotando.",
+           "La filtración de datos afectó a millones de usuarios.", "Encontramos una nueva muestra de ransomware."],
+}
+
+
+def _corpus(n: int) -> list[tuple[str, str]]:
+    rng = random.Random(3)
+    out = []
+    langs = sorted(SAMPLES)
+    for i in range(n):
+        lang = langs[i % len(langs)]
+        body = " ".join(rng.sample(SAMPLES[lang], k=rng.randint(1, 3)))
+        extra = rng.choice(["", f" #{rng.randint(1, 999)}", f" https://t.me/example/{rng.randint(1, 9999)}"])
+        out.append((lang, body + extra))
+    return out
+
+
+def _langdetect(text: str) -> str:
+    try:
+        return detect(text)
+    except LangDetectException:
+        return "und"
+
+
+def _run(fn, corpus) -> tuple[float, float]:
+    t0 = time.perf_counter()
+    ok = sum(1 for lang, text in corpus if fn(text) == lang)
+    dt = time.perf_counter() - t0
+    return ok / len(corpus), len(corpus) / dt
+
+
+def main() -> None:
+    corpus = _corpus(2000)
+    _langdetect("warm up profiles")
+
+    rows = [("langdetect", _run(_langdetect, corpus))]
+
+    size = scoring.LANG_CACHE_SIZE
+    scoring.LANG_CACHE_SIZE = 0
+    scoring._LANG_CACHE.clear()
+    rows.append(("script+fallback (cold)", _run(scoring.detect_lang_safe, corpus)))
+    scoring.LANG_CACHE_SIZE = size
+    scoring._LANG_CACHE.clear()
+    _run(scoring.detect_lang_safe, corpus)
+    rows.append(("script+fallback (warm)", _run(scoring.detect_lang_safe, corpus)))
+
+    print(f"{'path':<24} | {'accuracy':>8} | {'msg/s':>10}")
+    for name, (acc, rate) in rows:
+        print(f"{name:<24} | {acc:>8.3f} | {rate:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
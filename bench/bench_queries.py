@@ -0,0 +1,104 @@
+"""
+ビューアの一覧（load_messages → db.message_rows_query）と同じクエリの実行計画と所要時間を確認する。
+- 期間 / score / チャネル / 本文（FTS5）/ 言語の絞り込みを db.message_filters そのままで組み立てる
+- 各ケースで期待する索引が計画に出ること、全表走査（"SCAN messages"）が無いことを確認する
+  （スコアしきい値で候補が少ないときは idx_messages_score_ts を引いて並べ替える）
+- score はほとんどが 1〜2 の偏った分布で作る。既定は 20 万件。件数を増やすと 10M 規模の傾向も見られる
+
+    python bench/bench_queries.py [件数]
+"""
+from __future__ import annotations
+from pathlib import Path
+import datetime as dt
+import random
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from db import message_rows_query, open_db, persist_messages
+
+DAY = 86400
+NOW = 1_760_000_000
+LIMIT = 10000
+
+
+def _iso(ts: int) -> str:
+    return dt.datetime.fromtimestamp(ts, tz=dt.timezone.utc).isoformat()
+
+
+PERIOD = dict(dt_from=_iso(NOW - 30 * DAY), dt_to=_iso(NOW))
+YEAR = dict(dt_from=_iso(NOW - 365 * DAY), dt_to=_iso(NOW))
+
+# ケース名 -> (message_rows_query の絞り込み, 計画に出るべき文字列)
+QUERIES = {
+    "period": (dict(PERIOD, min_score=1), "idx_messages_ts"),
+    "period+score": (dict(PERIOD, min_score=4), "idx_messages_score_ts"),
+    # 候補が limit の2倍を超えるしきい値は ts の降順に辿る
+    "year+score2": (dict(YEAR, min_score=2), "idx_messages_ts"),
+    "period+lang": (dict(PERIOD, min_score=1, langs=["ru"]), "idx_messages_ts"),
+    "channel": (dict(PERIOD, min_score=1, chat_query="chan7"), "messages_fts"),
+    "keyword": (dict(PERIOD, min_score=1, text_query="attack"), "messages_fts"),
+    # 再実行時の差分（id が前回より大きい行）は rowid の範囲で引く
+    "delta": (dict(YEAR, min_score=2, langs=["ru"], after_id=lambda n: n - 1000), "INTEGER PRIMARY KEY (rowid>?)"),
+}
+
+BAD_PLAN = "SCAN messages"
+
+
+def _populate(conn, n: int) -> None:
+    rng = random.Random(5)
+    rows = []
+    for i in range(n):
+        ts = NOW - rng.randint(0, 365 * DAY)
+        chat = rng.randint(1, 200)
+        # score = 一致したキーワード数。多くは1つだけ
+        score = 1
+        while score < 10 and rng.random() < 0.35:
+            score += 1
+        kw = "attack" if rng.random() < 0.05 else "report"
+        rows.append({
+            "chat_id": chat, "title": f"Channel {chat}", "username": f"chan{chat}",
+            "msg_id": i, "date_utc": _iso(ts),
+            "text": f"sample {kw} text", "lang": "ru" if rng.random() < 0.2 else "en",
+            "matched_keywords_json": f'["{kw}"]', "score": score, "url": "",
+        })
+        if len(rows) >= 10000:
+            persist_messages(conn, rows)
+            rows = []
+    persist_messages(conn, rows)
+    conn.commit()
+    conn.execute("ANALYZE")
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    ok = True
+    with tempfile.TemporaryDirectory() as d:
+        conn = open_db(str(Path(d) / "bench.db"))
+        t0 = time.perf_counter()
+        _populate(conn, n)
+        print(f"rows={n} populate={time.perf_counter() - t0:.1f}s")
+        for name, (filters, expect) in QUERIES.items():
+            f = dict(dict(chat_query=None, text_query=None, langs=None, after_id=None), **filters)
+            if callable(f["after_id"]):
+                f["after_id"] = f["after_id"](n)
+            t0 = time.perf_counter()
+            sql, params = message_rows_query(conn, LIMIT, f["dt_from"], f["dt_to"], f["min_score"],
+                                             f["chat_query"], f["text_query"], f["langs"],
+                                             after_id=f["after_id"])
+            got = len(conn.execute(sql, params).fetchall())
+            ms = (time.perf_counter() - t0) * 1000
+            plan = [r[-1] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+            bad = any(p.startswith(BAD_PLAN) and "INDEX" not in p for p in plan)
+            good = not bad and any(expect in p for p in plan)
+            ok &= good
+            print(f"{name:<14} {ms:8.1f} ms  rows={got:<6} {'ok' if good else 'NG'}  {' / '.join(plan)}")
+        conn.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
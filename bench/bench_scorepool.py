@@ -0,0 +1,64 @@
+"""
+ScoringPool のスループット計測（スコアリング＋言語判定）。
+scoring_workers を 0（ループ内）→ 1 → 2 → … → CPU 数 と増やし、msg/s の伸びを見る。
+live 相当（score() を並行に await）と backfill 相当（score_many() をページ単位）の両方を測る。
+
+    python bench/bench_scorepool.py [件数]
+"""
+from __future__ import annotations
+from pathlib import Path
+import asyncio
+import os
+import random
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from config import Config
+from scorepool import ScoringPool
+
+_WORDS = ["attack", "breach", "phishing", "server", "update", "leak", "group", "report",
+          "credentials", "exploit", "patch", "network", "access", "sale", "database"]
+
+
+def _texts(n: int) -> list[str]:
+    rng = random.Random(7)
+    return [" ".join(rng.choice(_WORDS) for _ in range(40)) for _ in range(n)]
+
+
+async def _live(pool: ScoringPool, texts: list[str]) -> float:
+    t0 = time.perf_counter()
+    await asyncio.gather(*(pool.score(t) for t in texts))
+    return time.perf_counter() - t0
+
+
+async def _backfill(pool: ScoringPool, texts: list[str], page: int = 100) -> float:
+    t0 = time.perf_counter()
+    pages = [texts[i:i + page] for i in range(0, len(texts), page)]
+    await asyncio.gather(*(pool.score_many(p) for p in pages))
+    return time.perf_counter() - t0
+
+
+async def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    cfg = Config(api_id=0, api_hash="", session="",
+                 keywords={"en": ["attack", "breach", "phishing"]})
+    texts = _texts(n)
+    cores = os.cpu_count() or 1
+    counts = sorted({0, 1, 2, 4, cores})
+    print(f"messages={n} cores={cores}")
+    print(f"{'workers':>7} | {'live msg/s':>10} | {'backfill msg/s':>14}")
+    for w in counts:
+        pool = ScoringPool(cfg, workers=w)
+        pool.start()
+        await pool.score_many(texts[:w * 4])  # プロセス起動と langdetect プロファイル読み込みを除外
+        live = await _live(pool, texts)
+        bf = await _backfill(pool, texts)
+        pool.close()
+        print(f"{w:>7} | {n / live:>10,.0f} | {n / bf:>14,.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""
+score_text のキーワード数スケーリング計測。
+キーワード数を 10 → 10,000 に増やしても 1 メッセージあたりのコストが
+ほぼ一定であることを確認する（旧実装: キーワードごとの re.search との比較付き）。
+
+    python bench/bench_scoring.py
+"""
+from __future__ import annotations
+from pathlib import Path
+import random
+import re
+import string
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from config import Keywords
+from scoring import HASHTAG_RE, init_keywords_fast_pattern, score_text
+
+
+def _legacy_score(text: str, kws: Keywords) -> list[str]:
+    body = HASHTAG_RE.sub(" ", text).casefold()
+    hits = []
+    for w in kws.ja + kws.en + kws.zh + kws.ru + kws.ar:
+        if w and re.search(re.escape(w.casefold()), body):
+            hits.append(w)
+    return sorted(set(hits))
+
+
+def _rand_word(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 12)))
+
+
+def _messages(rng: random.Random, words: list[str], n: int) -> list[str]:
+    out = []
+    for _ in range(n):
+        body = " ".join(_rand_word(rng) for _ in range(60))
+        if words and rng.random() < 0.3:
+            body += " " + rng.choice(words)
+        out.append(body)
+    return out
+
+
+def _per_msg_us(fn, msgs: list[str]) -> float:
+    t0 = time.perf_counter()
+    for m in msgs:
+        fn(m)
+    return (time.perf_counter() - t0) / len(msgs) * 1e6
+
+
+def main() -> None:
+    rng = random.Random(42)
+    msgs_n = 300
+    print(f"{'keywords':>9} | {'matcher us/msg':>15} | {'legacy us/msg':>14}")
+    for n_kw in (10, 100, 1000, 10000):
+        words = sorted({_rand_word(rng) for _ in range(n_kw)})
+        kws = Keywords(en=words)
+        init_keywords_fast_pattern(kws)
+        msgs = _messages(rng, words, msgs_n)
+
+        for m in msgs:
+            assert score_text(m, kws, []).matched == _legacy_score(m, kws)
+
+        fast = _per_msg_us(lambda m: score_text(m, kws, []), msgs)
+        legacy = _per_msg_us(lambda m: _legacy_score(m, kws), msgs[:50])
+        print(f"{n_kw:>9} | {fast:>15.1f} | {legacy:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,22 @@ from typing import List, Optional
 import time
 
 from telethon import TelegramClient
+from telethon.errors import FloodWaitError
 
 from config import Config, load_config
 from db import open_db
 from scoring import init_keywords_fast_pattern
-from discovery import build_dialog_cache, discover_public_channels, get_entity_safe
+from discovery import (
+    build_dialog_cache, cached_dialog, discover_public_channels, get_entity_safe, pause_for_flood,
+)
 from crawl import ensure_join, discover_by_crawl
-from backfill import backfill_channel
+from backfill import backfill_many
 from stream import LiveStream
+from translate import TranslationWorker
+from writer import MessageWriter
+from ratelimit import RateLimiter
+from scorepool import ScoringPool
+from tokens import TokenWorker
 
 
 class TeleOsintApp:
@@ -31,41 +39,84 @@ class TeleOsintApp:
 
         self._maint_task: Optional[asyncio.Task] = None
 
+        self.writer = MessageWriter(conn, cfg)
+        self.limiter = RateLimiter(cfg.collect.rate_per_sec, cfg.collect.rate_burst)
+        self.scorer = ScoringPool(cfg)
+        self.translator = TranslationWorker(cfg, conn, writer=self.writer)
+        self.tokenizer: Optional[TokenWorker] = None
+        if cfg.collect.tokenize_text_ja:
+            self.tokenizer = TokenWorker(cfg, self.writer)
+            self.writer.tokenizer = self.tokenizer
+
     async def init_runtime(self, debug: bool = False):
+        self.writer.debug = debug
+        self.translator.debug = debug
+        self.writer.start()
+        self.translator.start()
+        if self.tokenizer:
+            self.tokenizer.debug = debug
+            self.tokenizer.start()
+        self.scorer.start()
         await build_dialog_cache(self.client, debug=debug)
 
     async def discover(self, debug: bool = False) -> List[str]:
-        return await discover_public_channels(self.client, self.cfg)
+        return await discover_public_channels(self.client, self.cfg, conn=self.conn, limiter=self.limiter)
 
     async def crawl(self, seeds: List[str], debug: bool = False) -> List[str]:
-        return await discover_by_crawl(self.client, self.cfg, seeds=seeds, debug=debug)
+        return await discover_by_crawl(self.client, self.cfg, seeds=seeds, debug=debug, conn=self.conn,
+                                      limiter=self.limiter)
 
     async def join_targets(self, targets: List[str], debug: bool = False) -> None:
-        for ref in targets:
-            await ensure_join(self.client, ref, self.cfg, debug=debug)
+        """
+        未参加のものだけ join_sleep_ms 間隔で参加する（参加済みはダイアログのキャッシュで判定）。
+        FloodWait は共有の limiter を止めて（他のタスクも待たせて）その ref を1回だけやり直す。
+        """
+        todo = [ref for ref in targets if cached_dialog(ref) is None]
+        if debug:
+            print(f"[join] {len(todo)}/{len(targets)} not joined yet")
+        sleep_s = max(0, int(self.cfg.discovery.crawl.join_sleep_ms)) / 1000.0
+        for i, ref in enumerate(todo):
+            if i and sleep_s:
+                await asyncio.sleep(sleep_s)
+            for attempt in range(2):
+                await self.limiter.acquire()
+                try:
+                    await ensure_join(self.client, ref, self.cfg, debug=debug)
+                    break
+                except FloodWaitError as e:
+                    if attempt or not await pause_for_flood(self.cfg, e, self.limiter, ref, "join"):
+                        break
 
     async def entities_from_refs(self, refs: List[str], debug: bool = False) -> List[object]:
         ents: List[object] = []
         for ref in refs:
-            ent = await get_entity_safe(self.client, ref, self.cfg, debug=debug)
+            ent = None
+            for attempt in range(2):
+                if cached_dialog(ref) is None:
+                    await self.limiter.acquire()
+                try:
+                    ent = await get_entity_safe(self.client, ref, self.cfg, debug=debug)
+                    break
+                except FloodWaitError as e:
+                    if attempt or not await pause_for_flood(self.cfg, e, self.limiter, ref, "entity"):
+                        break
             if ent:
                 ents.append(ent)
         return ents
 
     async def backfill_targets(self, refs: List[str], new_only: bool, debug: bool = False) -> None:
         mode = "new-only" if new_only else "all"
-        for ref in refs:
-            try:
-                print(f"[backfill-{mode}] {ref}")
-                await backfill_channel(self.client, self.cfg, self.conn, ref, new_only=new_only, debug=debug)
-            except Exception as e:
-                print(f"[backfill] skip {ref}: {e}")
+        print(f"[backfill-{mode}] {len(refs)} targets, concurrency={self.cfg.collect.backfill_concurrency}")
+        await backfill_many(self.client, self.cfg, self.conn, refs, new_only=new_only, debug=debug,
+                            translator=self.translator, writer=self.writer, limiter=self.limiter,
+                            scorer=self.scorer)
 
     async def start_live(self, entities: Optional[List[object]] = None, debug: bool = False):
         if self._live_task and not self._live_task.done():
             return
         self._live_entities = entities
-        self._live_obj = LiveStream(self.client, self.cfg, self.conn, target_entities=entities, debug=debug)
+        self._live_obj = LiveStream(self.client, self.cfg, self.conn, target_entities=entities, debug=debug,
+                                    translator=self.translator, writer=self.writer, scorer=self.scorer)
         self._live_task = asyncio.create_task(self._live_obj.start())
 
     async def stop_live(self):
@@ -148,8 +199,13 @@ class TeleOsintApp:
             self._maint_task.cancel()
             try:
                 await self._maint_task
-            except Exception:
+            except (asyncio.CancelledError, Exception):
                 pass
+        await self.translator.stop()
+        if self.tokenizer:
+            await self.tokenizer.stop()
+        await self.writer.stop()
+        self.scorer.close()
 
 
 async def create_app(config_path: str) -> TeleOsintApp:
@@ -1,15 +1,82 @@
 from __future__ import annotations
 
+import asyncio
 import datetime as dt
 import sqlite3
-from typing import Any, Dict
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from telethon.errors import FloodWaitError
 
 from config import Config
-from db import get_last_seen, persist_message, is_already_scored
-from scoring import extract_text, score_text, detect_lang_safe, matched_to_json
-from translate import translate_to_ja
+from db import get_scan_watermark, scored_ids_in_range
+from scoring import Scored, extract_text, matched_to_json
+from scorepool import ScoringPool
+from translate import TranslationWorker, translate_to_ja
 from discovery import get_entity_safe
 from util_channels import is_blocked
+from writer import MessageWriter
+from ratelimit import RateLimiter
+
+# iter_messages の1ページ（Telethon の GetHistory 上限）と揃える
+BACKFILL_PAGE_SIZE = 100
+# FloodWait を受けたチャネルを同じ実行内でやり直す回数
+BACKFILL_FLOOD_RETRIES = 3
+
+
+@dataclass
+class BackfillStats:
+    total: int = 0
+    hits: int = 0
+    skipped_scored: int = 0
+    low_score: int = 0
+
+
+async def _rate_limited(messages, limiter: Optional[RateLimiter],
+                        page_size: int = BACKFILL_PAGE_SIZE) -> AsyncIterator[Any]:
+    """iter_messages が次ページを取りに行く前に limiter のトークンを1つ取る。"""
+    if limiter is None:
+        async for msg in messages:
+            yield msg
+        return
+    await limiter.acquire()
+    n = 0
+    async for msg in messages:
+        yield msg
+        n += 1
+        if n % page_size == 0:
+            await limiter.acquire()
+
+
+async def _with_scored_flags(conn: sqlite3.Connection, chat_id: int, messages, scorer: ScoringPool,
+                             skip_upto: int = 0, page_size: int = BACKFILL_PAGE_SIZE
+                             ) -> AsyncIterator[Tuple[Any, bool, str, Optional[Tuple[Scored, str]]]]:
+    """
+    メッセージをページ単位に溜めて (msg, スコア済みか, 本文, (Scored, lang)) を順に返す。
+    - 既存 message_id は (chat_id, min_id..max_id) の1クエリで引く
+    - 未スコアで本文のあるものだけ、ページ分まとめて scorer に投げる
+    - id <= skip_upto のものはスコアしない（new_only の取りこぼし対策）
+    """
+    page: List[Any] = []
+
+    async def _flush():
+        ids = [m.id for m in page]
+        known = scored_ids_in_range(conn, chat_id, min(ids), max(ids))
+        texts = {m.id: extract_text(m) for m in page if m.id not in known and m.id > skip_upto}
+        todo = [mid for mid, t in texts.items() if t]
+        scored = dict(zip(todo, await scorer.score_many([texts[mid] for mid in todo])))
+        return [(m, m.id in known, texts.get(m.id, ""), scored.get(m.id)) for m in page]
+
+    async for msg in messages:
+        page.append(msg)
+        if len(page) >= page_size:
+            for item in await _flush():
+                yield item
+            page = []
+    if page:
+        for item in await _flush():
+            yield item
 
 
 async def backfill_channel(
@@ -19,14 +86,27 @@ async def backfill_channel(
     chat: str,
     new_only: bool = False,
     debug: bool = False,
-) -> None:
+    translator: Optional[TranslationWorker] = None,
+    writer: Optional[MessageWriter] = None,
+    limiter: Optional[RateLimiter] = None,
+    scorer: Optional[ScoringPool] = None,
+) -> Optional[BackfillStats]:
     """
     指定チャネルの履歴取得。
-    - new_only=True の場合は state.last_msg_id 以降のみ取得
-    - 既にDBにあるメッセージ（=スコア済み）は is_already_scored でスキップ
+    - new_only=True の場合は走査ウォーターマーク（ヒット有無を問わず走査済みの最大 id）以降のみ取得。
+      ウォーターマークの先は古い順（min_id, reverse=True）に backfill_limit 件まで読み、
+      読んだところまでだけウォーターマークを進める（残りは次回に続きから読む）
+    - 既にDBにあるメッセージ（=スコア済み）はページごとの範囲クエリでまとめて判定しスキップ
     - スコア閾値未満は保存しない
+    - translator があれば翻訳はキュー経由で後から text_ja に反映
+    - ヒットは writer にまとめて書く（未指定ならこの呼び出し内で作って最後に flush）
+    - limiter があれば entity 解決と履歴の1ページごとにトークンを取る
+    - スコアリング/言語判定はページ単位で scorer に投げる（未指定ならループ内で計算）
+    - FloodWaitError はそのまま上げる（待ち方は backfill_many がまとめて決める）
     """
 
+    if limiter is not None:
+        await limiter.acquire()
     entity = await get_entity_safe(client, chat, cfg, debug=debug)
     if not entity:
         if debug:
@@ -40,35 +120,49 @@ async def backfill_channel(
         if debug:
             print(f"[backfill] skip @{username}: blocked")
         return
-    last_seen = get_last_seen(conn, entity.id) if new_only else 0
+    last_seen = get_scan_watermark(conn, entity.id) if new_only else 0
     kwargs: Dict[str, Any] = {"limit": cfg.collect.backfill_limit}
-    if new_only and last_seen > 0:
+    forward = new_only and last_seen > 0
+    if forward:
         kwargs["min_id"] = last_seen
+        kwargs["reverse"] = True
+
+    own_writer = writer is None
+    if writer is None:
+        writer = MessageWriter(conn, cfg, debug=debug)
+    if scorer is None:
+        scorer = ScoringPool(cfg, workers=0)
 
     count_total = 0
     count_hits = 0
     count_skipped_scored = 0
     count_low_score = 0
+    max_scanned = 0
 
-    async for msg in client.iter_messages(entity, **kwargs):
+    messages = _rate_limited(client.iter_messages(entity, **kwargs), limiter)
+    async for msg, scored, text, result in _with_scored_flags(conn, entity.id, messages, scorer,
+                                                              skip_upto=last_seen if new_only else 0):
+        if forward and max_scanned:
+            # 古い順なので、直前の id までは抜けなく処理済み（例外で止まってもそこから続ける）
+            writer.mark_scanned(entity.id, max_scanned)
         count_total += 1
+        max_scanned = max(max_scanned, msg.id)
 
         if new_only and last_seen and msg.id <= last_seen:
             if debug:
                 print(f"[skip-old] chat={title} id={msg.id} <= last_seen={last_seen}")
             continue
 
-        if is_already_scored(conn, entity.id, msg.id):
+        if scored:
             count_skipped_scored += 1
             if debug:
                 print(f"[skip-bf] already-scored chat={title} id={msg.id}")
             continue
 
-        text = extract_text(msg)
-        if not text:
+        if not text or result is None:
             continue
 
-        s = score_text(text, cfg.keywords, cfg.negatives)
+        s, lang_hint = result
         if s.score < cfg.score_threshold:
             count_low_score += 1
             if debug:
@@ -78,40 +172,120 @@ async def backfill_channel(
         url = f"https://t.me/{username}/{msg.id}" if username else ""
         date_utc = msg.date.replace(tzinfo=dt.timezone.utc).isoformat()
 
-        try:
-            lang_hint = detect_lang_safe(text)
-        except Exception:
-            lang_hint = "und"
-
-        try:
-            text_ja = translate_to_ja(text, lang_hint, cfg)
-        except Exception:
-            text_ja = ""
-
-        try:
-            persist_message(
-                conn,
-                entity.id,
-                title,
-                username or "",
-                msg.id,
-                date_utc,
-                text,
-                lang_hint,
-                matched_to_json(s),
-                s.score,
-                url,
-                text_ja,
-            )
-            conn.commit()
-            count_hits += 1
-            if debug:
-                print(f"[HIT] score={s.score} kw={s.matched} chat={title} id={msg.id} url={url}")
-        except sqlite3.IntegrityError:
-            pass
+        row = dict(
+            chat_id=entity.id,
+            title=title,
+            username=username or "",
+            msg_id=msg.id,
+            date_utc=date_utc,
+            text=text,
+            lang=lang_hint,
+            matched_keywords_json=matched_to_json(s),
+            score=s.score,
+            url=url,
+        )
+
+        text_ja = ""
+        if translator is None:
+            try:
+                text_ja = await asyncio.to_thread(translate_to_ja, text, lang_hint, cfg)
+            except Exception:
+                text_ja = ""
+
+        writer.add(row, text_ja)
+        count_hits += 1
+        if debug:
+            print(f"[HIT] score={s.score} kw={s.matched} chat={title} id={msg.id} url={url}")
+
+        if translator is not None:
+            await translator.submit(row)
+
+    # 新しい順の走査は途中で例外が出たら進めない（最後まで見て初めて確定）
+    if max_scanned:
+        writer.mark_scanned(entity.id, max_scanned)
+    if own_writer:
+        writer.flush()
 
     if debug:
         print(
             f"[backfill-summary] chat={title} total={count_total} "
             f"hits={count_hits} skipped_scored={count_skipped_scored} low_score={count_low_score}"
         )
+    return BackfillStats(total=count_total, hits=count_hits,
+                         skipped_scored=count_skipped_scored, low_score=count_low_score)
+
+
+def _fmt_eta(seconds: float) -> str:
+    seconds = max(0, int(seconds))
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+async def backfill_many(
+    client,
+    cfg: Config,
+    conn: sqlite3.Connection,
+    refs: List[str],
+    new_only: bool = False,
+    debug: bool = False,
+    translator: Optional[TranslationWorker] = None,
+    writer: Optional[MessageWriter] = None,
+    limiter: Optional[RateLimiter] = None,
+    scorer: Optional[ScoringPool] = None,
+    concurrency: Optional[int] = None,
+) -> Dict[str, Optional[BackfillStats]]:
+    """
+    複数チャネルを concurrency 本並列でバックフィルする。
+    - API 呼び出しは共有の limiter（トークンバケット）で全体の流量を制御
+    - どれかが FloodWaitError を受けたら limiter.pause() で全タスクを待たせ、そのチャネルをやり直す
+      （待ち時間が max_wait_on_flood_s を超えるならそのチャネルは諦める）
+    - チャネルの完了ごとに進捗と残り時間の見積もりを出す
+    """
+    mode = "new-only" if new_only else "all"
+    if limiter is None:
+        limiter = RateLimiter(cfg.collect.rate_per_sec, cfg.collect.rate_burst)
+    own_writer = writer is None
+    if writer is None:
+        writer = MessageWriter(conn, cfg, debug=debug)
+    n = max(1, int(concurrency or cfg.collect.backfill_concurrency))
+    sem = asyncio.Semaphore(n)
+    crawl = cfg.discovery.crawl
+    results: Dict[str, Optional[BackfillStats]] = {}
+    total = len(refs)
+    start = time.monotonic()
+
+    async def _one(ref: str) -> None:
+        async with sem:
+            stats: Optional[BackfillStats] = None
+            for attempt in range(BACKFILL_FLOOD_RETRIES + 1):
+                try:
+                    stats = await backfill_channel(
+                        client, cfg, conn, ref, new_only=new_only, debug=debug,
+                        translator=translator, writer=writer, limiter=limiter, scorer=scorer,
+                    )
+                    break
+                except FloodWaitError as e:
+                    wait_s = int(e.seconds)
+                    if wait_s > crawl.max_wait_on_flood_s or attempt == BACKFILL_FLOOD_RETRIES:
+                        print(f"[backfill-{mode}] skip {ref}: floodwait {wait_s}s")
+                        break
+                    print(f"[backfill-{mode}] floodwait {wait_s}s on {ref}, pausing all tasks")
+                    limiter.pause(wait_s + crawl.floodwait_padding_s)
+                except Exception as e:
+                    print(f"[backfill] skip {ref}: {e}")
+                    break
+            results[ref] = stats
+
+        done = len(results)
+        elapsed = time.monotonic() - start
+        eta = elapsed / done * (total - done)
+        detail = (f"total={stats.total} hits={stats.hits} skipped={stats.skipped_scored}"
+                  if stats else "skipped")
+        print(f"[backfill-{mode}] {done}/{total} {ref} {detail} "
+              f"elapsed={_fmt_eta(elapsed)} eta={_fmt_eta(eta)}")
+
+    try:
+        await asyncio.gather(*(_one(r) for r in refs))
+    finally:
+        if own_writer:
+            writer.flush()
+    return results
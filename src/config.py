@@ -23,6 +23,19 @@ class CrawlConfig(BaseModel):
     floodwait_padding_s: int = 2
     max_wait_on_flood_s: int = 120
     global_time_limit_s: int = 600
+    sample_messages: int = 50        # 品質プローブに使う直近メッセージ数
+    neighbor_messages: int = 200     # 近傍（@mention / t.me）を拾う直近メッセージ数
+    window_cache_size: int = 256     # 取得済み履歴ウィンドウを覚えておくチャンネル数（1回のクロール実行の中だけ）
+    probe_ttl_s: int = 259200        # 評価結果の有効期間。これより新しい評価のあるチャンネルは再プローブしない
+    frontier_max_rows: int = 5000    # 次回に持ち越す frontier の上限（優先度上位から）
+    graph_priority: bool = True      # 言及グラフ（crawl_edges）の PageRank / ヒット元入次数を優先度に足す
+    w_pagerank: float = -1.0
+    w_hit_indegree: float = -1.0
+    pagerank_alpha: float = 0.85
+    graph_refresh_every: int = 10    # この数のチャンネルを評価するごとにグラフ指標を計算し直す
+    graph_edge_max_age_s: int = 2592000  # これより古い言及の辺は使わない（30日）
+    concurrency: int = 4             # frontier を共有して同時に評価するワーカー数（API は collect.rate_per_sec で共有制限）
+    join_accepted_only: bool = True  # 参加せずにプローブし、合格したチャンネルだけ後で参加する
 
 class DiscoveryFilters(BaseModel):
     min_members: Optional[int] = None
@@ -32,12 +45,25 @@ class DiscoveryFilters(BaseModel):
 class Discovery(BaseModel):
     queries: List[str] = Field(default_factory=list)
     limit_per_query: int = 25
+    search_concurrency: int = 3    # 同時に投げる検索クエリ数（API は collect.rate_per_sec で共有制限）
+    meta_ttl_s: int = 604800       # channel_meta（参加者数など）の有効期間（7日）
     crawl: CrawlConfig = Field(default_factory=CrawlConfig)
     filters: DiscoveryFilters = Field(default_factory=DiscoveryFilters)
 
 class CollectParams(BaseModel):
     backfill_limit: int = 1000
     poll_interval_sec: int = 5
+    write_batch_size: int = 200    # この件数たまったらまとめて書き込み
+    write_flush_ms: int = 1000     # 件数に達しなくてもこの間隔で書き込み
+    backfill_concurrency: int = 4  # 同時にバックフィルするチャネル数
+    rate_per_sec: float = 2.0      # 全タスク共有の API リクエスト上限（0 で無制限）
+    rate_burst: int = 5
+    scoring_workers: int = 0       # スコアリング/言語判定のプロセス数（0 ならループ内で実行）
+    scoring_batch_size: int = 64
+    scoring_batch_ms: int = 5
+    tokenize_text_ja: bool = True  # 保存された text_ja をバックグラウンドでトークン化（message_tokens）
+    token_batch_size: int = 64
+    token_queue_size: int = 5000
 
 class Alerts(BaseModel):
     slack_webhook: str = ""
@@ -48,6 +74,16 @@ class TranslationCfg(BaseModel):
     timeout_sec: int = 8
     deepl_api_key: str = ""
     deepl_api_url: str = ""        # https://api-free.deepl.com/v2/translate など
+    workers: int = 2               # 翻訳ワーカー数（スレッド）
+    queue_size: int = 1000         # 翻訳待ちキューの上限
+    batch_size: int = 25           # DeepL 1リクエストあたりの初期テキスト数（最大50、自動調整）
+    batch_wait_ms: int = 200       # バッチが埋まるまで待つ最大時間
+    retry_max: int = 4             # DeepL の 429/5xx を再送する回数
+    retry_max_wait_s: int = 60     # 再送前に待つ時間の上限（Retry-After もこれで打ち切る）
+    stop_cooldown_s: int = 3600    # DeepL 456/403 のあと送信を休む秒数（明けたら再開を試す）
+    cache_mem_size: int = 5000     # プロセス内 LRU の件数
+    cache_max_rows: int = 200000   # translations テーブルの件数上限
+    cache_max_age_days: int = 90   # 最終利用からこの日数を過ぎたら削除
 
 class Config(BaseModel):
     api_id: int
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+# 共起行列の正規化方法（ビューアの選択肢）
+NORMALIZATIONS = ("count", "pmi", "lift")
+
+
+def doc_term_matrix(doc_ids: Sequence[int], tokens: Sequence[str],
+                    vocab: Sequence[str]) -> Tuple[sparse.csr_matrix, int]:
+    """
+    postings（文書 id とトークンの並列配列）から 文書×語彙 の 0/1 CSR 行列を作る。
+    doc_ids は整数（DataFrame なら groupby(...).ngroup() など）。vocab に無いトークンは捨てる。
+    戻り値は (X, 文書数)。文書数は vocab 外の語だけを持つ文書も含む。
+    """
+    col_of: Dict[str, int] = {w: i for i, w in enumerate(vocab)}
+    _, rows = np.unique(np.asarray(doc_ids, dtype=np.int64), return_inverse=True)
+    cols = np.fromiter((col_of.get(t, -1) for t in tokens), dtype=np.int64, count=len(rows))
+    n_docs = int(rows.max()) + 1 if len(rows) else 0
+    keep = cols >= 0
+    X = sparse.csr_matrix(
+        (np.ones(int(keep.sum()), dtype=np.int32), (rows[keep], cols[keep])),
+        shape=(n_docs, len(vocab)),
+    )
+    # COO→CSR で重複 postings は合算されるので、同じ文書・同じ語は1に潰す
+    X.sum_duplicates()
+    X.data[:] = 1
+    return X, n_docs
+
+
+def cooccurrence(X: sparse.csr_matrix) -> np.ndarray:
+    """C[i, j] = 語 i と語 j を両方含む文書数（対角は文書頻度）。X.T @ X の1回の積。"""
+    return np.asarray((X.T @ X).todense(), dtype=np.int64)
+
+
+def normalize(C: np.ndarray, n_docs: int, method: str = "count") -> np.ndarray:
+    """
+    count: そのまま（対角は 0）
+    pmi:   log( P(i,j) / (P(i) P(j)) )。共起 0 は 0
+    lift:  P(i,j) / (P(i) P(j))
+    """
+    out = C.astype(float)
+    if method != "count" and n_docs > 0:
+        dfreq = np.diag(C).astype(float)
+        expected = np.outer(dfreq, dfreq) / float(n_docs)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lift = np.where((C > 0) & (expected > 0), C / expected, 0.0)
+        if method == "pmi":
+            with np.errstate(divide="ignore"):
+                out = np.where(lift > 0, np.log(lift), 0.0)
+        else:
+            out = lift
+    np.fill_diagonal(out, 0.0)
+    return out
+
+
+def cooccurrence_loop(docs: Iterable[Iterable[str]], vocab: Sequence[str]) -> np.ndarray:
+    """従来のビューアと同じ二重ループ版（ベンチマークの比較用）。"""
+    idx = {w: i for i, w in enumerate(vocab)}
+    mat = np.zeros((len(vocab), len(vocab)), dtype=int)
+    for toks in docs:
+        present = [w for w in set(toks) if w in idx]
+        for i in range(len(present)):
+            for j in range(i + 1, len(present)):
+                a, b = idx[present[i]], idx[present[j]]
+                mat[a, b] += 1
+                mat[b, a] += 1
+    return mat
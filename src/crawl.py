@@ -1,15 +1,25 @@
 from __future__ import annotations
+import asyncio
 import time, heapq, re
+import sqlite3
+from collections import Counter
 from dataclasses import dataclass, field
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 from telethon import types, functions
+from telethon.errors import FloodWaitError
 from config import Config
-from discovery import get_entity_safe, passes_channel_filters
+from db import (
+    load_crawl_frontier, push_crawl_frontier, pop_crawl_frontier,
+    get_crawl_probe, put_crawl_probe, fresh_crawl_found, prune_crawl_state,
+    crawl_hit_rates, load_crawl_edges, upsert_crawl_edges
+)
+from discovery import cached_dialog, get_entity_safe, passes_channel_filters, remember_dialog, resolve_entity
 from discovery_guard import (
-    probe_channel_quality, pass_quality_gates,
+    MessageWindow, ProbeResult, WindowCache, fetch_message_window, window_head, probe_channel_quality, pass_quality_gates,
     mark_low_quality, is_low_quality_blocked
 )
-from scoring import extract_text
+from graph import MentionGraph, top_nodes
+from ratelimit import RateLimiter
 from util_channels import is_blocked
 
 MENTION_RE  = re.compile(r"@([A-Za-z0-9_]{4,32})")
@@ -22,6 +32,22 @@ def extract_candidates_from_text(text: str) -> List[str]:
     links_norm = [f"https://t.me/{l}" for l in links]
     return sorted(set(users + links_norm))
 
+def mentions_from_window(window: MessageWindow, blocklist_keywords: List[str]) -> Dict[str, int]:
+    """
+    ウィンドウの本文から次に辿る候補と、それを含むメッセージ数を集める
+    （blocklist_keywords を含む本文は除く）。
+    """
+    blocks = [b.lower() for b in (blocklist_keywords or []) if b]
+    out: Counter[str] = Counter()
+    for _, text, lower in window:
+        if any(b in lower for b in blocks):
+            continue
+        out.update(extract_candidates_from_text(text))
+    return dict(out)
+
+def neighbors_from_window(window: MessageWindow, blocklist_keywords: List[str]) -> List[str]:
+    return sorted(mentions_from_window(window, blocklist_keywords))
+
 def _extract_username(ref: str) -> str:
     if ref.startswith("@"):
         return ref[1:]
@@ -36,20 +62,35 @@ class PQItem:
     depth: int
     ref: str = field(compare=False)
     seed: bool = field(compare=False)
-    # 評価結果を覚えておきたいなら以下を追加
-    # hit_rate: float = field(default=0.0, compare=False)
+    # グラフ由来の項を除いた優先度（グラフの再計算時に priority を付け直すため）
+    base: float = field(default=0.0, compare=False)
 
 def compute_priority(*, hit_rate: float, depth: int, seed: bool, recent_bonus: float,
-                     w_hit_rate: float, w_depth: float, w_seed_bonus: float, w_recent_bonus: float) -> float:
+                     w_hit_rate: float, w_depth: float, w_seed_bonus: float, w_recent_bonus: float,
+                     pagerank: float = 0.0, hit_indegree: float = 0.0,
+                     w_pagerank: float = 0.0, w_hit_indegree: float = 0.0) -> float:
     """小さいほど先に処理される。良い指標には負の重みをかける。"""
     pr = 0.0
     pr += w_hit_rate * hit_rate
     pr += w_depth * depth
     pr += w_seed_bonus * (1.0 if seed else 0.0)
     pr += w_recent_bonus * recent_bonus
+    pr += w_pagerank * pagerank
+    pr += w_hit_indegree * hit_indegree
     return pr
 
+async def _join_entity(client, ent) -> None:
+    if ent and isinstance(ent, (types.Channel, types.Chat)):
+        try:
+            await client(functions.channels.JoinChannelRequest(ent))
+            remember_dialog(ent)
+        except FloodWaitError:
+            raise
+        except Exception:
+            pass
+
 async def ensure_join(client, ref: str, cfg: Config, debug=False):
+    """ref に参加する。失敗は無視するが、FloodWaitError は上げる（待ち方は呼び出し側が決める）。"""
     try:
         ref = ref.strip()
         if ref.startswith("http") and "t.me/" in ref:
@@ -58,92 +99,200 @@ async def ensure_join(client, ref: str, cfg: Config, debug=False):
                 invite_hash = tail.lstrip("+")
                 try:
                     await client(functions.messages.ImportChatInviteRequest(hash=invite_hash))
+                except FloodWaitError:
+                    raise
                 except Exception:
                     pass
                 return
             username = tail.split("/", 1)[0]
             if username:
                 ent = await get_entity_safe(client, f"@{username}", cfg, debug=debug)
-                if ent and isinstance(ent, (types.Channel, types.Chat)):
-                    try:
-                        await client(functions.channels.JoinChannelRequest(ent))
-                    except Exception:
-                        pass
+                await _join_entity(client, ent)
                 return
         else:
             ent = await get_entity_safe(client, ref, cfg, debug=debug)
-            if ent and isinstance(ent, (types.Channel, types.Chat)):
-                try:
-                    await client(functions.channels.JoinChannelRequest(ent))
-                except Exception:
-                    pass
+            await _join_entity(client, ent)
+    except FloodWaitError:
+        raise
     except Exception:
         pass
 
-async def discover_by_crawl(client, cfg: Config, seeds: List[str], debug=False) -> List[str]:
+def crawl_key(ref: str) -> str:
+    """frontier / 評価結果のキー。@name と https://t.me/name を同じチャンネルとして扱う。"""
+    return (_extract_username(ref) or ref).lower()
+
+def _probe_stats(probe: ProbeResult) -> tuple:
+    return (probe.total, probe.hit, probe.negative, probe.target_lang_hits, probe.avg_len)
+
+async def discover_by_crawl(client, cfg: Config, seeds: List[str], debug=False,
+                            conn: Optional[sqlite3.Connection] = None,
+                            limiter: Optional[RateLimiter] = None) -> List[str]:
+    """
+    seeds から @mention / t.me リンクを優先度順に辿る。
+    conn を渡すと crawl_frontier / crawl_probes / crawl_cooldowns に状態を残し、次回はその続きから始める。
+    - probe_ttl_s 以内に評価済みのチャンネルは API を呼ばずに飛ばす（合格なら結果に含める）
+    - max_channels は今回新たに評価して合格した数で数える
+    - concurrency 本のワーカーが frontier を共有し、API 呼び出しは limiter で全体の流量を抑える
+      （FloodWait を受けたら limiter.pause() で全ワーカーを止め、そのチャンネルを frontier に戻す）
+    - join_accepted_only なら参加せずに解決・プローブする（公開チャンネルの履歴は参加せずに読める）。
+      参加は呼び出し側が合格したチャンネルだけに行う（join_targets）
+    """
     if not cfg.discovery.crawl.enabled:
         return []
 
     start = time.monotonic()
+    now = int(time.time())
+    fresh_after = now - max(0, int(cfg.discovery.crawl.probe_ttl_s))
+    frontier_max = max(0, int(cfg.discovery.crawl.frontier_max_rows))
     visited: set[str] = set()
     found: set[str]   = set()
 
+    # 言及グラフ（crawl_edges）とヒット率から、frontier の優先度に PageRank / ヒット元入次数の項を足す
+    use_graph = cfg.discovery.crawl.graph_priority
+    edge_after = now - max(0, int(cfg.discovery.crawl.graph_edge_max_age_s))
+    graph = MentionGraph(load_crawl_edges(conn, edge_after) if conn is not None and use_graph else None)
+    hit_rates: Dict[str, float] = crawl_hit_rates(conn) if conn is not None and use_graph else {}
+    graph_scores: Dict[str, Tuple[float, float]] = {}
+    seed_keys = {crawl_key(s) for s in (seeds or [])}
+    w_pagerank = cfg.discovery.crawl.w_pagerank
+    w_hit_indegree = cfg.discovery.crawl.w_hit_indegree
+    refresh_every = max(1, int(cfg.discovery.crawl.graph_refresh_every))
+    updates_since_refresh = 0
+
     pq: List[PQItem] = []
+    pending: List[tuple] = []  # crawl_frontier に書く (key, ref, priority, depth, seed, added_at)
+
+    def graph_term(key: str) -> float:
+        pr, hi = graph_scores.get(key, (0.0, 0.0))
+        return compute_priority(hit_rate=0.0, depth=0, seed=False, recent_bonus=0.0,
+                                w_hit_rate=0.0, w_depth=0.0, w_seed_bonus=0.0, w_recent_bonus=0.0,
+                                pagerank=pr, hit_indegree=hi,
+                                w_pagerank=w_pagerank, w_hit_indegree=w_hit_indegree)
+
+    def refresh_graph() -> None:
+        nonlocal graph_scores, updates_since_refresh
+        updates_since_refresh = 0
+        if not use_graph or not len(graph):
+            return
+        graph_scores = graph.scores(seed_keys, hit_rates, alpha=cfg.discovery.crawl.pagerank_alpha)
+        for it in pq:
+            it.priority = it.base + graph_term(crawl_key(it.ref))
+        heapq.heapify(pq)
+        if debug:
+            top = ", ".join(f"{k}({p:.2f}/{h:.2f})" for k, p, h in top_nodes(graph_scores, 5))
+            print(f"[crawl] graph {len(graph_scores)} nodes {len(graph)} edges; top: {top}")
+
+    def push(ref: str, priority: float, depth: int, seed: bool) -> None:
+        heapq.heappush(pq, PQItem(priority=priority + graph_term(crawl_key(ref)), depth=depth,
+                                  ref=ref, seed=seed, base=priority))
+        if conn is not None:
+            pending.append((crawl_key(ref), ref, priority, depth, int(seed), now))
+
+    def save() -> None:
+        if conn is not None:
+            push_crawl_frontier(conn, pending)
+            conn.commit()
+        pending.clear()
+
+    if conn is not None:
+        # frontier には グラフの項を除いた優先度を保存している
+        for ref, pr, depth, seed in load_crawl_frontier(conn, frontier_max or -1):
+            heapq.heappush(pq, PQItem(priority=pr, depth=depth, ref=ref, seed=seed, base=pr))
+        if debug and pq:
+            print(f"[crawl] resume frontier: {len(pq)} refs")
+    refresh_graph()
+
     seed_set = set(seeds or [])
     for s in sorted(set(seeds or [])):
-        heapq.heappush(pq, PQItem(
-            priority=compute_priority(
+        push(s, compute_priority(
                 hit_rate=0.0, depth=0, seed=True, recent_bonus=0.0,
                 w_hit_rate=getattr(cfg.discovery.crawl, "w_hit_rate", -1.0),
                 w_depth=getattr(cfg.discovery.crawl, "w_depth", 0.3),
                 w_seed_bonus=getattr(cfg.discovery.crawl, "w_seed_bonus", -0.5),
                 w_recent_bonus=getattr(cfg.discovery.crawl, "w_recent_bonus", -0.2),
-            ),
-            depth=0, ref=s, seed=True
-        ))
+            ), 0, True)
+    save()
 
     max_depth = max(0, cfg.discovery.crawl.max_depth)
     max_channels = max(1, cfg.discovery.crawl.max_channels)
     allow_types = set([t.lower() for t in cfg.discovery.crawl.allow_types])
     sample_n = getattr(cfg.discovery.crawl, "sample_messages", 50)
+    neighbor_n = getattr(cfg.discovery.crawl, "neighbor_messages", 200)
+    # 履歴ウィンドウはこの実行の中だけで使い回す（次のメンテ周期には持ち越さない）
+    window_cache = WindowCache(getattr(cfg.discovery.crawl, "window_cache_size", 256))
     per_channel_timeout = getattr(cfg.discovery.crawl, "per_channel_time_limit_s", 20)
     cooldown_s = getattr(cfg.discovery.crawl, "low_quality_cooldown_s", 86400)
 
-    while pq and len(found) < max_channels:
-        # グローバル時間制限
-        if (time.monotonic() - start) > cfg.discovery.crawl.global_time_limit_s:
-            if debug:
-                print(f"[crawl] reached global time limit {cfg.discovery.crawl.global_time_limit_s}s")
-            break
+    def done(key: str) -> None:
+        """結果が確定した ref を frontier から外す（一時的な失敗で抜けたものは残して次回やり直す）。"""
+        if conn is not None:
+            pop_crawl_frontier(conn, key)
+            conn.commit()
 
-        item = heapq.heappop(pq)
-        ref, depth, is_seed = item.ref, item.depth, item.seed
+    def record(key: str, entity, probe: Optional[ProbeResult], ok: bool, reason: str) -> None:
+        if conn is None:
+            return
+        put_crawl_probe(conn, key, getattr(entity, "id", None), getattr(entity, "username", None),
+                        _probe_stats(probe or ProbeResult()), ok, reason, int(time.time()))
+        pop_crawl_frontier(conn, key)
+        conn.commit()
 
-        if ref in visited:
-            continue
-        visited.add(ref)
+    join_accepted_only = cfg.discovery.crawl.join_accepted_only
+    concurrency = max(1, int(cfg.discovery.crawl.concurrency))
+    if limiter is None:
+        limiter = RateLimiter(cfg.collect.rate_per_sec, cfg.collect.rate_burst)
+
+    async def visit(item: PQItem) -> None:
+        nonlocal updates_since_refresh
+        ref, depth = item.ref, item.depth
+        key = crawl_key(ref)
+
+        if key in visited:
+            return
+        visited.add(key)
         uname0 = _extract_username(ref)
         if is_blocked(uname0, cfg):
             if debug:
                 print(f"[crawl] skip @{uname0}: block_channels (pre-join)")
-            continue
+            done(key)
+            return
+
+        if conn is not None:
+            prev = get_crawl_probe(conn, key, fresh_after)
+            if prev is not None:
+                if debug:
+                    print(f"[crawl] skip {ref}: probed {now - prev[2]}s ago -> {prev[0]} ({prev[1]})")
+                done(key)
+                return
 
-        await ensure_join(client, ref, cfg, debug=debug)
-        entity = await get_entity_safe(client, ref, cfg, debug=debug)
+        if not join_accepted_only:
+            await limiter.acquire()
+            await ensure_join(client, ref, cfg, debug=debug)
+        elif uname0.startswith("+"):
+            # 招待リンクは参加しないと中身を見られないので辿らない
+            record(key, None, None, False, "invite")
+            return
+        if cached_dialog(ref) is None:
+            await limiter.acquire()
+        # 一時的な失敗は例外で抜け（worker が処理）、frontier に残す。記録するのは確定した「存在しない」だけ
+        entity = await resolve_entity(client, ref, debug=debug)
         if not entity:
-            continue
+            record(key, None, None, False, "unresolved")
+            return
 
         uname = getattr(entity, "username", "") or ""
         if is_blocked(uname, cfg):
             if debug:
                 print(f"[crawl] skip @{uname}: block_channels (post-resolve)")
-            continue
+            done(key)
+            return
 
         chat_id = getattr(entity, "id", None)
-        if chat_id is not None and is_low_quality_blocked(chat_id):
+        if chat_id is not None and is_low_quality_blocked(chat_id, conn):
             if debug:
                 print(f"[crawl] skip low-quality cooled-down entity {ref}")
-            continue
+            done(key)
+            return
 
         etype = entity.__class__.__name__.lower()
         if "channel" in etype:
@@ -151,12 +300,17 @@ async def discover_by_crawl(client, cfg: Config, seeds: List[str], debug=False)
         elif "megagroup" in etype or "supergroup" in etype or "chat" in etype:
             etype = "supergroup"
         if allow_types and etype not in allow_types:
-            continue
-        if not await passes_channel_filters(client, cfg, entity, debug=debug):
-            continue
+            record(key, entity, None, False, f"type({etype})")
+            return
+        if not await passes_channel_filters(client, cfg, entity, debug=debug, conn=conn, limiter=limiter):
+            record(key, entity, None, False, "filters")
+            return
 
         t0 = time.monotonic()
-        probe = await probe_channel_quality(client, cfg, entity, sample_messages=sample_n)
+        # プローブと近傍展開で同じ履歴を使う（1チャンネル1回の iter_messages）
+        window_n = max(sample_n, neighbor_n) if depth < max_depth else sample_n
+        window = await fetch_message_window(client, entity, window_n, cache=window_cache, limiter=limiter)
+        probe = await probe_channel_quality(client, cfg, entity, sample_messages=sample_n, window=window)
         ok, reason = pass_quality_gates(probe, cfg)
         if debug:
             name = getattr(entity, "username", "") or getattr(entity, "title", "")
@@ -165,11 +319,27 @@ async def discover_by_crawl(client, cfg: Config, seeds: List[str], debug=False)
                   f"langT={probe.target_lang_rate:.2f} avglen={probe.avg_len:.1f} -> {ok} ({reason})")
 
         recent_bonus = 1.0 if probe.total > 0 else 0.0
+        record(key, entity, probe, ok, reason)
+
+        # 不合格のチャンネルも、取得済みウィンドウの言及は辺として残す（追加の API 呼び出しは無い）
+        mentions = mentions_from_window(window_head(window, neighbor_n), cfg.discovery.crawl.blocklist_keywords)
+        if use_graph:
+            hit_rates[key] = probe.hit_rate
+            counts: Counter[str] = Counter()
+            for nr, c in mentions.items():
+                counts[crawl_key(nr)] += c
+            rows = graph.update(key, counts, int(time.time()))
+            if conn is not None:
+                upsert_crawl_edges(conn, rows)
+                conn.commit()
+            updates_since_refresh += 1
+            if updates_since_refresh >= refresh_every:
+                refresh_graph()
 
         if not ok:
             if chat_id is not None:
-                mark_low_quality(chat_id, cooldown_s)
-            continue
+                mark_low_quality(chat_id, cooldown_s, conn)
+            return
 
         if getattr(entity, "username", None):
             found.add(f"@{entity.username}")
@@ -177,27 +347,13 @@ async def discover_by_crawl(client, cfg: Config, seeds: List[str], debug=False)
         if (time.monotonic() - t0) > per_channel_timeout:
             if debug:
                 print(f"[probe] timeout on {ref}, skip expanding neighbors")
-            continue
+            return
 
         if depth >= max_depth:
-            continue
-
-        try:
-            next_refs: list[str] = []
-            async for msg in client.iter_messages(entity, limit=200):
-                text = extract_text(msg)
-                if not text:
-                    continue
-                # blocklist_keywords でノイズ除去
-                if any(b.lower() in text.lower() for b in (cfg.discovery.crawl.blocklist_keywords or [])):
-                    continue
-                next_refs.extend(extract_candidates_from_text(text))
-            next_refs = sorted(set(next_refs))
-        except Exception:
-            next_refs = []
+            return
 
-        for nr in next_refs:
-            if nr in visited:
+        for nr in sorted(mentions):
+            if crawl_key(nr) in visited:
                 continue
             nu = _extract_username(nr)
             if is_blocked(nu, cfg):
@@ -215,6 +371,59 @@ async def discover_by_crawl(client, cfg: Config, seeds: List[str], debug=False)
                 w_seed_bonus=getattr(cfg.discovery.crawl, "w_seed_bonus", -0.5),
                 w_recent_bonus=getattr(cfg.discovery.crawl, "w_recent_bonus", -0.2),
             )
-            heapq.heappush(pq, PQItem(priority=pr, depth=depth + 1, ref=nr, seed=(nr in seed_set)))
+            push(nr, pr, depth + 1, nr in seed_set)
+        save()
+
+    wake = asyncio.Condition()
+    in_flight = 0
+
+    def timed_out() -> bool:
+        return (time.monotonic() - start) > cfg.discovery.crawl.global_time_limit_s
+
+    def requeue_after_flood(item: PQItem, e: FloodWaitError) -> None:
+        wait_s = int(e.seconds)
+        if wait_s > cfg.discovery.crawl.max_wait_on_flood_s:
+            if debug:
+                print(f"[crawl] skip {item.ref} due to huge FloodWait {wait_s}s")
+            return
+        if debug:
+            print(f"[crawl] floodwait {wait_s}s on {item.ref}, pausing all workers")
+        limiter.pause(wait_s + cfg.discovery.crawl.floodwait_padding_s)
+        visited.discard(crawl_key(item.ref))
+        push(item.ref, item.base, item.depth, item.seed)
+        save()
+
+    async def worker() -> None:
+        nonlocal in_flight
+        while True:
+            async with wake:
+                # frontier が空でも、処理中の他ワーカーが近傍を足すかもしれないので待つ
+                await wake.wait_for(lambda: pq or in_flight == 0)
+                if not pq or len(found) >= max_channels or timed_out():
+                    wake.notify_all()
+                    return
+                item = heapq.heappop(pq)
+                in_flight += 1
+            try:
+                await visit(item)
+            except FloodWaitError as e:
+                requeue_after_flood(item, e)
+            except Exception as e:
+                if debug:
+                    print(f"[crawl] err on {item.ref}: {e}")
+            finally:
+                async with wake:
+                    in_flight -= 1
+                    wake.notify_all()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    if debug and timed_out():
+        print(f"[crawl] reached global time limit {cfg.discovery.crawl.global_time_limit_s}s")
 
+    if conn is None:
+        return sorted(found)
+    prune_crawl_state(conn, int(time.time()), frontier_max, edge_after)
+    conn.commit()
+    # 今回飛ばした評価済みチャンネルも、TTL 内に合格していれば対象に含める
+    found.update(f"@{u}" for u in fresh_crawl_found(conn, fresh_after))
     return sorted(found)
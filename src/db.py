@@ -1,5 +1,8 @@
 from __future__ import annotations
+import datetime as dt
+import json
 import sqlite3
+from typing import Any, Dict, Iterable, List, Set
 
 SQL_CREATE = """
 CREATE TABLE IF NOT EXISTS messages (
@@ -14,25 +17,211 @@ CREATE TABLE IF NOT EXISTS messages (
     matched_keywords TEXT,
     score INTEGER,
     url TEXT,
-    text_ja TEXT
+    text_ja TEXT,
+    ts INTEGER
 );
 CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_chat_msg ON messages(chat_id, message_id);
 
 CREATE TABLE IF NOT EXISTS state (
     chat_id INTEGER PRIMARY KEY,
     last_msg_id INTEGER,
-    last_date TEXT
+    last_date TEXT,
+    scan_msg_id INTEGER
 );
+
+CREATE TABLE IF NOT EXISTS translations (
+    key TEXT PRIMARY KEY,
+    provider TEXT,
+    target_lang TEXT,
+    text_ja TEXT,
+    created_at INTEGER,
+    last_used INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_translations_last_used ON translations(last_used);
+
+-- チャンネルのメタデータ（discovery の min_members 判定用。GetFullChannelRequest を毎回呼ばない）
+CREATE TABLE IF NOT EXISTS channel_meta (
+    chat_id INTEGER PRIMARY KEY,
+    username TEXT,
+    title TEXT,
+    members INTEGER,
+    fetched_at INTEGER
+);
+
+-- クロールの状態（メンテ周期・再起動をまたいで続きから再開する）。key は小文字の username（招待リンクは ref そのもの）
+CREATE TABLE IF NOT EXISTS crawl_frontier (
+    key TEXT PRIMARY KEY,
+    ref TEXT,
+    priority REAL,
+    depth INTEGER,
+    seed INTEGER,
+    added_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_crawl_frontier_priority ON crawl_frontier(priority);
+
+CREATE TABLE IF NOT EXISTS crawl_probes (
+    key TEXT PRIMARY KEY,
+    chat_id INTEGER,
+    username TEXT,
+    total INTEGER,
+    hit INTEGER,
+    negative INTEGER,
+    target_lang_hits INTEGER,
+    avg_len REAL,
+    ok INTEGER,
+    reason TEXT,
+    probed_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_crawl_probes_ok_at ON crawl_probes(ok, probed_at);
+
+-- チャンネル→言及先チャンネルの辺（count は直近ウィンドウ内の言及メッセージ数）
+CREATE TABLE IF NOT EXISTS crawl_edges (
+    src TEXT,
+    dst TEXT,
+    count INTEGER,
+    last_seen INTEGER,
+    PRIMARY KEY (src, dst)
+);
+CREATE INDEX IF NOT EXISTS idx_crawl_edges_last_seen ON crawl_edges(last_seen);
+
+CREATE TABLE IF NOT EXISTS crawl_cooldowns (
+    chat_id INTEGER PRIMARY KEY,
+    until INTEGER
+);
+
+-- matched_keywords（JSON 文字列）を1キーワード1行に展開したもの。集計・キーワード別推移用
+CREATE TABLE IF NOT EXISTS message_keywords (
+    chat_id INTEGER,
+    message_id INTEGER,
+    keyword TEXT,
+    ts INTEGER,
+    lang TEXT,
+    PRIMARY KEY (chat_id, message_id, keyword)
+);
+CREATE INDEX IF NOT EXISTS idx_message_keywords_kw_ts ON message_keywords(keyword, ts);
+CREATE INDEX IF NOT EXISTS idx_message_keywords_ts ON message_keywords(ts);
+
+-- text_ja のトークン（postings）。tf はそのメッセージ内の出現回数
+CREATE TABLE IF NOT EXISTS message_tokens (
+    chat_id INTEGER,
+    message_id INTEGER,
+    token TEXT,
+    tf INTEGER,
+    ts INTEGER,
+    PRIMARY KEY (chat_id, message_id, token)
+);
+CREATE INDEX IF NOT EXISTS idx_message_tokens_ts ON message_tokens(ts);
+CREATE INDEX IF NOT EXISTS idx_message_tokens_token_ts ON message_tokens(token, ts);
+"""
+
+# ビューアの期間/スコア/チャネル絞り込み + ORDER BY ts DESC 用（ts 列の追加後に作る）
+SQL_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_messages_ts ON messages(ts);
+CREATE INDEX IF NOT EXISTS idx_messages_score_ts ON messages(score, ts);
+CREATE INDEX IF NOT EXISTS idx_messages_chat_ts ON messages(chat_username, ts);
 """
 
+# ダッシュボード用の日次集計（日付はビューアと同じ JST）。messages / message_keywords のトリガで
+# 同じトランザクション内に増減させる。score を軸に持つのはスコアしきい値での絞り込み用。
+ROLLUP_UTC_OFFSET_SEC = 9 * 3600
+
+SQL_ROLLUP = f"""
+CREATE TABLE IF NOT EXISTS rollup_daily (
+    day TEXT,
+    chat_id INTEGER,
+    lang TEXT,
+    score INTEGER,
+    hits INTEGER,
+    chat_label TEXT,
+    PRIMARY KEY (day, chat_id, lang, score)
+);
+CREATE TABLE IF NOT EXISTS rollup_daily_kw (
+    day TEXT,
+    keyword TEXT,
+    chat_id INTEGER,
+    lang TEXT,
+    hits INTEGER,
+    PRIMARY KEY (day, keyword, chat_id, lang)
+);
+CREATE TRIGGER IF NOT EXISTS rollup_daily_ai AFTER INSERT ON messages WHEN new.ts IS NOT NULL BEGIN
+  INSERT INTO rollup_daily(day, chat_id, lang, score, hits, chat_label)
+  VALUES (DATE(new.ts + {ROLLUP_UTC_OFFSET_SEC}, 'unixepoch'), new.chat_id, COALESCE(new.lang, ''),
+          COALESCE(new.score, 0), 1, COALESCE(NULLIF(new.chat_username, ''), new.chat_title))
+  ON CONFLICT(day, chat_id, lang, score) DO UPDATE SET
+    hits = hits + 1, chat_label = excluded.chat_label;
+END;
+CREATE TRIGGER IF NOT EXISTS rollup_daily_ad AFTER DELETE ON messages WHEN old.ts IS NOT NULL BEGIN
+  UPDATE rollup_daily SET hits = hits - 1
+  WHERE day = DATE(old.ts + {ROLLUP_UTC_OFFSET_SEC}, 'unixepoch') AND chat_id = old.chat_id
+    AND lang = COALESCE(old.lang, '') AND score = COALESCE(old.score, 0);
+END;
+CREATE TRIGGER IF NOT EXISTS rollup_daily_au AFTER UPDATE ON messages
+WHEN old.ts IS NOT new.ts OR old.lang IS NOT new.lang OR old.score IS NOT new.score
+  OR old.chat_id IS NOT new.chat_id
+BEGIN
+  UPDATE rollup_daily SET hits = hits - 1
+  WHERE old.ts IS NOT NULL AND day = DATE(old.ts + {ROLLUP_UTC_OFFSET_SEC}, 'unixepoch')
+    AND chat_id = old.chat_id AND lang = COALESCE(old.lang, '') AND score = COALESCE(old.score, 0);
+  INSERT INTO rollup_daily(day, chat_id, lang, score, hits, chat_label)
+  SELECT DATE(new.ts + {ROLLUP_UTC_OFFSET_SEC}, 'unixepoch'), new.chat_id, COALESCE(new.lang, ''),
+         COALESCE(new.score, 0), 1, COALESCE(NULLIF(new.chat_username, ''), new.chat_title)
+  WHERE new.ts IS NOT NULL
+  ON CONFLICT(day, chat_id, lang, score) DO UPDATE SET
+    hits = hits + 1, chat_label = excluded.chat_label;
+END;
+CREATE TRIGGER IF NOT EXISTS rollup_daily_kw_ai AFTER INSERT ON message_keywords WHEN new.ts IS NOT NULL BEGIN
+  INSERT INTO rollup_daily_kw(day, keyword, chat_id, lang, hits)
+  VALUES (DATE(new.ts + {ROLLUP_UTC_OFFSET_SEC}, 'unixepoch'), new.keyword, new.chat_id, COALESCE(new.lang, ''), 1)
+  ON CONFLICT(day, keyword, chat_id, lang) DO UPDATE SET hits = hits + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS rollup_daily_kw_ad AFTER DELETE ON message_keywords WHEN old.ts IS NOT NULL BEGIN
+  UPDATE rollup_daily_kw SET hits = hits - 1
+  WHERE day = DATE(old.ts + {ROLLUP_UTC_OFFSET_SEC}, 'unixepoch') AND keyword = old.keyword
+    AND chat_id = old.chat_id AND lang = COALESCE(old.lang, '');
+END;
+"""
+
+# 本文/訳/キーワード/チャネル名の全文検索（trigram なので日本語・中国語も部分一致で引ける）
+# messages を外部コンテンツとし、トリガで同期する。
+SQL_FTS = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    text, text_ja, matched_keywords, chat_title, chat_username,
+    content='messages', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+  INSERT INTO messages_fts(rowid, text, text_ja, matched_keywords, chat_title, chat_username)
+  VALUES (new.id, new.text, new.text_ja, new.matched_keywords, new.chat_title, new.chat_username);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+  INSERT INTO messages_fts(messages_fts, rowid, text, text_ja, matched_keywords, chat_title, chat_username)
+  VALUES ('delete', old.id, old.text, old.text_ja, old.matched_keywords, old.chat_title, old.chat_username);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE ON messages
+WHEN old.text IS NOT new.text OR old.text_ja IS NOT new.text_ja
+  OR old.matched_keywords IS NOT new.matched_keywords
+  OR old.chat_title IS NOT new.chat_title OR old.chat_username IS NOT new.chat_username
+BEGIN
+  INSERT INTO messages_fts(messages_fts, rowid, text, text_ja, matched_keywords, chat_title, chat_username)
+  VALUES ('delete', old.id, old.text, old.text_ja, old.matched_keywords, old.chat_title, old.chat_username);
+  INSERT INTO messages_fts(rowid, text, text_ja, matched_keywords, chat_title, chat_username)
+  VALUES (new.id, new.text, new.text_ja, new.matched_keywords, new.chat_title, new.chat_username);
+END;
+"""
+
+# trigram は3文字未満を引けないので、それより短い語は LIKE に回す
+FTS_MIN_CHARS = 3
+
+# id（rowid）は SQLite に採番させ、衝突判定は (chat_id, message_id) の一意索引で行う。
+# 以前の hash((chat_id, msg_id)) & 0x7fffffff は31bitで、件数が増えると別チャットの行を上書きしていた。
 UPSERT_MSG_SQL = """
 INSERT INTO messages(
-  id, chat_id, chat_title, chat_username, date, message_id, text, lang, matched_keywords, score, url, text_ja
+  chat_id, chat_title, chat_username, date, message_id, text, lang, matched_keywords, score, url, text_ja, ts
 ) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-ON CONFLICT(id) DO UPDATE SET
+ON CONFLICT(chat_id, message_id) DO UPDATE SET
   chat_title       = excluded.chat_title,
   chat_username    = excluded.chat_username,
   date             = excluded.date,
+  ts               = excluded.ts,
   text             = excluded.text,
   lang             = excluded.lang,
   matched_keywords = excluded.matched_keywords,
@@ -55,19 +244,249 @@ ON CONFLICT(chat_id) DO UPDATE SET
                      THEN excluded.last_date   ELSE state.last_date   END;
 """
 
+DELETE_KEYWORDS_SQL = "DELETE FROM message_keywords WHERE chat_id = ? AND message_id = ?"
+INSERT_KEYWORD_SQL = """
+INSERT OR IGNORE INTO message_keywords(chat_id, message_id, keyword, ts, lang) VALUES (?, ?, ?, ?, ?)
+"""
+
+DELETE_TOKENS_SQL = "DELETE FROM message_tokens WHERE chat_id = ? AND message_id = ?"
+INSERT_TOKEN_SQL = "INSERT OR IGNORE INTO message_tokens(chat_id, message_id, token, tf, ts) VALUES (?, ?, ?, ?, ?)"
+
+# ヒット有無に関係なく「走査済み」の最大 message_id（new_only バックフィルの起点）
+UPSERT_SCAN_SQL = """
+INSERT INTO state(chat_id, scan_msg_id)
+VALUES (?, ?)
+ON CONFLICT(chat_id) DO UPDATE SET
+  scan_msg_id = CASE WHEN excluded.scan_msg_id > state.scan_msg_id OR state.scan_msg_id IS NULL
+                     THEN excluded.scan_msg_id ELSE state.scan_msg_id END;
+"""
+
 def _column_exists(conn: sqlite3.Connection, table: str, col: str) -> bool:
     cur = conn.execute(f"PRAGMA table_info({table})")
     return any(r[1] == col for r in cur.fetchall())
 
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    cur = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,))
+    return cur.fetchone() is not None
+
+def _ensure_fts(conn: sqlite3.Connection) -> None:
+    """FTS5/trigram が使えない SQLite（3.34 未満など）では何もしない。"""
+    created = not _table_exists(conn, "messages_fts")
+    try:
+        conn.executescript(SQL_FTS)
+    except sqlite3.OperationalError as e:
+        print(f"[db] full-text index disabled: {e}")
+        return
+    if created:
+        # 既存 DB は一度だけ全件から索引を作る
+        conn.execute("INSERT INTO messages_fts(messages_fts) VALUES('rebuild')")
+        conn.commit()
+
+def fts_available(conn: sqlite3.Connection) -> bool:
+    return _table_exists(conn, "messages_fts")
+
+def fts_phrase(term: str) -> str | None:
+    """MATCH 用のフレーズ（FTS5 構文の記号は無効化）。短すぎて trigram で引けなければ None。"""
+    term = (term or "").strip()
+    if len(term) < FTS_MIN_CHARS:
+        return None
+    return '"' + term.replace('"', '""') + '"'
+
+def to_epoch(date_str: str | None) -> int | None:
+    """ISO 日時（オフセット付き/Z/なし=UTC）→ UNIX 秒。読めなければ None。"""
+    if not date_str:
+        return None
+    try:
+        d = dt.datetime.fromisoformat(str(date_str).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if d.tzinfo is None:
+        d = d.replace(tzinfo=dt.timezone.utc)
+    return int(d.timestamp())
+
+def _migrate_ts(conn: sqlite3.Connection) -> None:
+    """ts 列を追加し、既存行を date から埋める（strftime('%s') はオフセットを UTC に正規化する）。"""
+    if _column_exists(conn, "messages", "ts"):
+        return
+    conn.execute("ALTER TABLE messages ADD COLUMN ts INTEGER;")
+    conn.execute("UPDATE messages SET ts = CAST(strftime('%s', date) AS INTEGER) WHERE date IS NOT NULL AND date <> '';")
+    conn.commit()
+
+def _backfill_keywords(conn: sqlite3.Connection, batch: int = 10000) -> None:
+    """message_keywords 新設時に既存行の matched_keywords から埋める（小文字化は keywords_of と揃える）。"""
+    cur = conn.execute("SELECT chat_id, message_id, matched_keywords, ts, lang FROM messages")
+    while True:
+        rows = cur.fetchmany(batch)
+        if not rows:
+            break
+        conn.executemany(INSERT_KEYWORD_SQL, [
+            (c, m, kw, ts, lang) for c, m, mk, ts, lang in rows for kw in keywords_of(mk)
+        ])
+    conn.commit()
+
+def keywords_of(matched_keywords_json: str | None) -> List[str]:
+    """matched_to_json の JSON → 小文字・重複なしのキーワード列（読めなければ空）。"""
+    try:
+        kws = json.loads(matched_keywords_json or "[]")
+    except ValueError:
+        return []
+    if not isinstance(kws, list):
+        return []
+    return list(dict.fromkeys(str(k).lower() for k in kws if k))
+
+def _persist_keywords(conn: sqlite3.Connection, rows: List[tuple]) -> None:
+    """rows: (chat_id, message_id, matched_keywords_json, ts, lang)。再 upsert 時は入れ替える。"""
+    conn.executemany(DELETE_KEYWORDS_SQL, [(c, m) for c, m, _, _, _ in rows])
+    conn.executemany(INSERT_KEYWORD_SQL, [
+        (c, m, kw, ts, lang) for c, m, mk, ts, lang in rows for kw in keywords_of(mk)
+    ])
+
+def rebuild_rollups(conn: sqlite3.Connection) -> None:
+    """rollup_daily / rollup_daily_kw を messages / message_keywords から作り直す。"""
+    off = ROLLUP_UTC_OFFSET_SEC
+    conn.execute("DELETE FROM rollup_daily")
+    conn.execute("DELETE FROM rollup_daily_kw")
+    conn.execute(
+        f"""
+        INSERT INTO rollup_daily(day, chat_id, lang, score, hits, chat_label)
+        SELECT DATE(ts + {off}, 'unixepoch'), chat_id, COALESCE(lang, ''), COALESCE(score, 0), COUNT(*),
+               MAX(COALESCE(NULLIF(chat_username, ''), chat_title))
+        FROM messages WHERE ts IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+        """
+    )
+    conn.execute(
+        f"""
+        INSERT INTO rollup_daily_kw(day, keyword, chat_id, lang, hits)
+        SELECT DATE(ts + {off}, 'unixepoch'), keyword, chat_id, COALESCE(lang, ''), COUNT(*)
+        FROM message_keywords WHERE ts IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+        """
+    )
+    conn.commit()
+
+def message_filters(conn: sqlite3.Connection, dt_from: str | None, dt_to: str | None, min_score: int,
+                    chat_query: str | None, text_query: str | None,
+                    langs: List[str] | None) -> tuple[str, list]:
+    """
+    ビューア/エクスポート共通の messages の WHERE 句（列名は非修飾）とパラメータ。
+    chat_query / text_query は FTS5 が使えて3文字以上なら MATCH、それ以外は LIKE。
+    """
+    where = ["1=1"]
+    params: list = []
+    use_fts = fts_available(conn)
+
+    # 期間は正規化済みの ts（UNIX 秒）で絞る（idx_messages_ts / idx_messages_score_ts）
+    if dt_from:
+        where.append("ts >= ?")
+        params.append(to_epoch(dt_from))
+    if dt_to:
+        where.append("ts <= ?")
+        params.append(to_epoch(dt_to))
+    if min_score:
+        where.append("score >= ?")
+        params.append(min_score)
+    if chat_query:
+        phrase = fts_phrase(chat_query) if use_fts else None
+        if phrase:
+            where.append("id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)")
+            params.append("{chat_title chat_username}: " + phrase)
+        else:
+            where.append("(LOWER(chat_title) LIKE ? OR LOWER(chat_username) LIKE ?)")
+            like = f"%{chat_query.lower()}%"
+            params += [like, like]
+    if text_query:
+        phrase = fts_phrase(text_query) if use_fts else None
+        if phrase:
+            where.append("id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)")
+            params.append("{text text_ja matched_keywords}: " + phrase)
+        else:
+            where.append("(LOWER(text) LIKE ? OR LOWER(text_ja) LIKE ? OR LOWER(matched_keywords) LIKE ?)")
+            like = f"%{text_query.lower()}%"
+            params += [like, like, like]
+    if langs:
+        where.append(f"lang IN ({','.join('?' * len(langs))})")
+        params += list(langs)
+    return " AND ".join(where), params
+
+# ビューアの一覧に出す列
+MESSAGE_COLUMNS = ("id, ts, date, chat_id, chat_title, chat_username, message_id, "
+                   "text, text_ja, lang, matched_keywords, score, url")
+
+def _selective_scores(conn: sqlite3.Connection, min_score: int, ts_from: int | None,
+                      ts_to: int | None, limit: int) -> List[int] | None:
+    """
+    score >= min_score を期間内で満たす行が limit の2倍以下なら、その score の値の一覧を返す。
+    idx_messages_score_ts を (score=? AND ts 範囲) で引く候補数を、同じ索引（covering）で数えて見積もる。
+    """
+    if min_score <= 1:
+        return None  # 保存済みはすべて score >= 1
+    row = conn.execute("SELECT MAX(score) FROM messages").fetchone()
+    values = list(range(min_score, int(row[0] or 0) + 1))
+    if not values:
+        return [min_score]
+    where = [f"score IN ({','.join('?' * len(values))})"]
+    params: list = list(values)
+    if ts_from is not None:
+        where.append("ts >= ?"); params.append(ts_from)
+    if ts_to is not None:
+        where.append("ts <= ?"); params.append(ts_to)
+    cap = 2 * limit
+    n = conn.execute(
+        f"SELECT COUNT(*) FROM (SELECT 1 FROM messages WHERE {' AND '.join(where)} LIMIT ?)",
+        params + [cap + 1],
+    ).fetchone()[0]
+    return values if n <= cap else None
+
+def message_rows_query(conn: sqlite3.Connection, limit: int, dt_from: str | None, dt_to: str | None,
+                       min_score: int, chat_query: str | None, text_query: str | None,
+                       langs: List[str] | None, after_id: int | None = None) -> tuple[str, list]:
+    """
+    ビューアの一覧（新しい順に limit 件）の SQL とパラメータ。
+    - 通常は idx_messages_ts を ts の降順に辿り、他の条件は行ごとに判定する
+    - スコアしきい値で候補が十分少ないときは score IN (...) にして idx_messages_score_ts を値ごとに
+      (score=? AND ts 範囲) で引き、候補だけを並べ替える（ORDER BY +ts で ts 索引の順序を使わせない）
+    - after_id を渡すと id（rowid）がそれより大きい行を id 順に読む（差分読み込み）。
+      NOT INDEXED で ts/score の索引を使わせず rowid の範囲で引く
+    """
+    if after_id is not None:
+        where, params = message_filters(conn, dt_from, dt_to, min_score, chat_query, text_query, langs)
+        q = f"SELECT {MESSAGE_COLUMNS} FROM messages NOT INDEXED WHERE {where} AND id > ? ORDER BY id LIMIT ?"
+        return q, params + [after_id, limit]
+    ts_from, ts_to = to_epoch(dt_from), to_epoch(dt_to)
+    scores = _selective_scores(conn, min_score, ts_from, ts_to, limit) if min_score else None
+    where, params = message_filters(conn, dt_from, dt_to, 0 if scores else min_score,
+                                    chat_query, text_query, langs)
+    order = "ts"
+    if scores:
+        where += f" AND score IN ({','.join('?' * len(scores))})"
+        params += scores
+        order = "+ts"
+    q = f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE {where} ORDER BY {order} DESC LIMIT ?"
+    return q, params + [limit]
+
 def open_db(path: str) -> sqlite3.Connection:
     conn = sqlite3.connect(path)
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute("PRAGMA synchronous=NORMAL;")
     conn.execute("PRAGMA temp_store=MEMORY;")
     conn.execute("PRAGMA cache_size=-20000;")
+    kw_created = not _table_exists(conn, "message_keywords")
+    rollup_created = not _table_exists(conn, "rollup_daily")
     conn.executescript(SQL_CREATE)
     if not _column_exists(conn, "messages", "text_ja"):
         conn.execute("ALTER TABLE messages ADD COLUMN text_ja TEXT;")
+    if not _column_exists(conn, "state", "scan_msg_id"):
+        conn.execute("ALTER TABLE state ADD COLUMN scan_msg_id INTEGER;")
+    _migrate_ts(conn)
+    conn.executescript(SQL_INDEXES)
+    if kw_created:
+        _backfill_keywords(conn)
+    conn.executescript(SQL_ROLLUP)
+    if rollup_created:
+        # 既存 DB は一度だけ全件から集計する（以降はトリガで追従）
+        rebuild_rollups(conn)
+    _ensure_fts(conn)
     return conn
 
 def get_last_seen(conn: sqlite3.Connection, chat_id: int) -> int:
@@ -75,6 +494,14 @@ def get_last_seen(conn: sqlite3.Connection, chat_id: int) -> int:
     row = cur.fetchone()
     return int(row[0]) if row and row[0] is not None else 0
 
+def get_scan_watermark(conn: sqlite3.Connection, chat_id: int) -> int:
+    """走査済みの最大 message_id。古い DB で scan_msg_id が無い chat は last_msg_id を使う。"""
+    cur = conn.execute("SELECT last_msg_id, scan_msg_id FROM state WHERE chat_id = ?", (chat_id,))
+    row = cur.fetchone()
+    if not row:
+        return 0
+    return max(int(row[0] or 0), int(row[1] or 0))
+
 def is_already_scored(conn: sqlite3.Connection, chat_id: int, message_id: int) -> bool:
     cur = conn.execute(
         "SELECT 1 FROM messages WHERE chat_id = ? AND message_id = ? LIMIT 1",
@@ -82,12 +509,226 @@ def is_already_scored(conn: sqlite3.Connection, chat_id: int, message_id: int) -
     )
     return cur.fetchone() is not None
 
+def scored_ids_in_range(conn: sqlite3.Connection, chat_id: int, min_id: int, max_id: int) -> Set[int]:
+    """(chat_id, min_id..max_id) に既に保存済みの message_id 集合（idx_messages_chat_msg の範囲走査）。"""
+    cur = conn.execute(
+        "SELECT message_id FROM messages WHERE chat_id = ? AND message_id BETWEEN ? AND ?",
+        (chat_id, min_id, max_id),
+    )
+    return {r[0] for r in cur.fetchall()}
+
 def persist_message(conn: sqlite3.Connection, chat_id: int, title: str, username: str,
                     msg_id: int, date_utc: str, text: str, lang: str,
                     matched_keywords_json: str, score: int, url: str, text_ja: str) -> None:
-    pk = (hash((chat_id, msg_id)) & 0x7fffffff)
+    ts = to_epoch(date_utc)
     conn.execute(UPSERT_MSG_SQL, (
-        pk, chat_id, title, username, date_utc, msg_id, text,
-        lang, matched_keywords_json, score, url, text_ja
+        chat_id, title, username, date_utc, msg_id, text,
+        lang, matched_keywords_json, score, url, text_ja, ts
     ))
+    _persist_keywords(conn, [(chat_id, msg_id, matched_keywords_json, ts, lang)])
     conn.execute(UPSERT_STATE_SQL, (chat_id, msg_id, date_utc))
+
+def persist_messages(conn: sqlite3.Connection, rows: List[Dict[str, Any]]) -> None:
+    """
+    persist_message の一括版（rows は persist_message のキーワード引数の dict）。
+    - messages は executemany で1回
+    - message_keywords も同じトランザクションで入れ替え（rollup_* はトリガで追従）
+    - state は chat ごとに最大 msg_id の1行にまとめて upsert
+    コミットは呼び出し側。
+    """
+    if not rows:
+        return
+    ts = [to_epoch(r["date_utc"]) for r in rows]
+    conn.executemany(UPSERT_MSG_SQL, [
+        (r["chat_id"], r["title"], r["username"],
+         r["date_utc"], r["msg_id"], r["text"], r["lang"], r["matched_keywords_json"],
+         r["score"], r["url"], r.get("text_ja", ""), t)
+        for r, t in zip(rows, ts)
+    ])
+    _persist_keywords(conn, [
+        (r["chat_id"], r["msg_id"], r["matched_keywords_json"], t, r["lang"]) for r, t in zip(rows, ts)
+    ])
+    latest: Dict[int, tuple] = {}
+    for r in rows:
+        cur = latest.get(r["chat_id"])
+        if cur is None or r["msg_id"] > cur[1]:
+            latest[r["chat_id"]] = (r["chat_id"], r["msg_id"], r["date_utc"])
+    conn.executemany(UPSERT_STATE_SQL, list(latest.values()))
+
+def persist_tokens(conn: sqlite3.Connection, rows: List[tuple]) -> None:
+    """
+    rows: (chat_id, message_id, ts, [(token, tf), ...])。メッセージ単位で postings を入れ替える。
+    コミットは呼び出し側。
+    """
+    if not rows:
+        return
+    conn.executemany(DELETE_TOKENS_SQL, [(c, m) for c, m, _, _ in rows])
+    conn.executemany(INSERT_TOKEN_SQL, [
+        (c, m, tok, tf, ts) for c, m, ts, toks in rows for tok, tf in toks
+    ])
+
+def mark_scanned(conn: sqlite3.Connection, scanned: Dict[int, int]) -> None:
+    """{chat_id: 走査した最大 message_id} で scan_msg_id を前進させる（後退はしない）。"""
+    if scanned:
+        conn.executemany(UPSERT_SCAN_SQL, list(scanned.items()))
+
+def get_cached_translation(conn: sqlite3.Connection, key: str) -> str | None:
+    """読むだけ（last_used の更新は touch_translations でまとめて行う）。"""
+    row = conn.execute("SELECT text_ja FROM translations WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def touch_translations(conn: sqlite3.Connection, keys: Iterable[str], now: int) -> None:
+    """ヒットした key の last_used を1回の executemany で更新。コミットは呼び出し側。"""
+    conn.executemany("UPDATE translations SET last_used = ? WHERE key = ?", [(now, k) for k in keys])
+
+def put_cached_translation(conn: sqlite3.Connection, key: str, provider: str, target_lang: str,
+                           text_ja: str, now: int) -> None:
+    conn.execute(
+        """
+        INSERT INTO translations(key, provider, target_lang, text_ja, created_at, last_used)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET text_ja = excluded.text_ja, last_used = excluded.last_used
+        """,
+        (key, provider, target_lang, text_ja, now, now),
+    )
+
+def evict_translations(conn: sqlite3.Connection, max_rows: int, min_last_used: int) -> int:
+    """last_used が min_last_used より古い行と、max_rows を超えた古い順の行を削除。"""
+    cur = conn.execute("DELETE FROM translations WHERE last_used < ?", (min_last_used,))
+    removed = cur.rowcount
+    if max_rows > 0:
+        cur = conn.execute(
+            """
+            DELETE FROM translations WHERE key IN (
+              SELECT key FROM translations ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (max_rows,),
+        )
+        removed += cur.rowcount
+    return removed
+
+def get_channel_meta(conn: sqlite3.Connection, chat_id: int, min_fetched_at: int) -> tuple | None:
+    """min_fetched_at 以降に取得していれば (username, title, members)。"""
+    row = conn.execute(
+        "SELECT username, title, members FROM channel_meta WHERE chat_id = ? AND fetched_at >= ?",
+        (chat_id, min_fetched_at),
+    ).fetchone()
+    return (row[0], row[1], row[2]) if row else None
+
+def put_channel_meta(conn: sqlite3.Connection, rows: List[tuple]) -> None:
+    """rows: (chat_id, username, title, members, fetched_at)。コミットは呼び出し側。"""
+    if rows:
+        conn.executemany(
+            """
+            INSERT INTO channel_meta(chat_id, username, title, members, fetched_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(chat_id) DO UPDATE SET
+              username = excluded.username, title = excluded.title,
+              members = excluded.members, fetched_at = excluded.fetched_at
+            """,
+            rows,
+        )
+
+def load_crawl_frontier(conn: sqlite3.Connection, limit: int) -> List[tuple]:
+    """優先度の高い（値の小さい）順に (ref, priority, depth, seed) を limit 件。"""
+    cur = conn.execute(
+        "SELECT ref, priority, depth, seed FROM crawl_frontier ORDER BY priority LIMIT ?", (limit,)
+    )
+    return [(r, float(p), int(d), bool(s)) for r, p, d, s in cur.fetchall()]
+
+def push_crawl_frontier(conn: sqlite3.Connection, rows: List[tuple]) -> None:
+    """rows: (key, ref, priority, depth, seed, added_at)。既にあれば良い方の優先度・浅い方の深さを残す。"""
+    if rows:
+        conn.executemany(
+            """
+            INSERT INTO crawl_frontier(key, ref, priority, depth, seed, added_at) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+              priority = MIN(priority, excluded.priority),
+              depth = MIN(depth, excluded.depth),
+              seed = MAX(seed, excluded.seed)
+            """,
+            rows,
+        )
+
+def pop_crawl_frontier(conn: sqlite3.Connection, key: str) -> None:
+    conn.execute("DELETE FROM crawl_frontier WHERE key = ?", (key,))
+
+def get_crawl_probe(conn: sqlite3.Connection, key: str, min_probed_at: int) -> tuple | None:
+    """min_probed_at 以降に評価済みなら (ok, reason, probed_at)。"""
+    row = conn.execute(
+        "SELECT ok, reason, probed_at FROM crawl_probes WHERE key = ? AND probed_at >= ?",
+        (key, min_probed_at),
+    ).fetchone()
+    return (bool(row[0]), row[1], int(row[2])) if row else None
+
+def put_crawl_probe(conn: sqlite3.Connection, key: str, chat_id: int | None, username: str | None,
+                    stats: tuple, ok: bool, reason: str, now: int) -> None:
+    """stats: (total, hit, negative, target_lang_hits, avg_len)。解決できなかった ref も記録して再試行を抑える。"""
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO crawl_probes(key, chat_id, username, total, hit, negative,
+                                            target_lang_hits, avg_len, ok, reason, probed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (key, chat_id, username, *stats, int(ok), reason, now),
+    )
+
+def fresh_crawl_found(conn: sqlite3.Connection, min_probed_at: int) -> List[str]:
+    """min_probed_at 以降に品質ゲートを通った username。"""
+    cur = conn.execute(
+        "SELECT username FROM crawl_probes WHERE ok = 1 AND probed_at >= ? AND username IS NOT NULL AND username <> ''",
+        (min_probed_at,),
+    )
+    return [r[0] for r in cur.fetchall()]
+
+def crawl_hit_rates(conn: sqlite3.Connection) -> Dict[str, float]:
+    """評価済みチャンネルのヒット率（key -> hit / total）。"""
+    cur = conn.execute("SELECT key, CAST(hit AS REAL) / total FROM crawl_probes WHERE total > 0")
+    return {k: float(r) for k, r in cur.fetchall()}
+
+def load_crawl_edges(conn: sqlite3.Connection, min_last_seen: int) -> Dict[tuple, tuple]:
+    """min_last_seen 以降に観測した辺 {(src, dst): (count, last_seen)}。"""
+    cur = conn.execute(
+        "SELECT src, dst, count, last_seen FROM crawl_edges WHERE last_seen >= ?", (min_last_seen,)
+    )
+    return {(s, d): (int(c), int(t)) for s, d, c, t in cur.fetchall()}
+
+def upsert_crawl_edges(conn: sqlite3.Connection, rows: List[tuple]) -> None:
+    """rows: (src, dst, count, last_seen)。コミットは呼び出し側。"""
+    if rows:
+        conn.executemany(
+            """
+            INSERT INTO crawl_edges(src, dst, count, last_seen) VALUES (?, ?, ?, ?)
+            ON CONFLICT(src, dst) DO UPDATE SET count = excluded.count, last_seen = excluded.last_seen
+            """,
+            rows,
+        )
+
+def get_crawl_cooldown(conn: sqlite3.Connection, chat_id: int) -> int:
+    row = conn.execute("SELECT until FROM crawl_cooldowns WHERE chat_id = ?", (chat_id,)).fetchone()
+    return int(row[0]) if row else 0
+
+def set_crawl_cooldown(conn: sqlite3.Connection, chat_id: int, until: int) -> None:
+    conn.execute(
+        "INSERT INTO crawl_cooldowns(chat_id, until) VALUES (?, ?) "
+        "ON CONFLICT(chat_id) DO UPDATE SET until = excluded.until",
+        (chat_id, until),
+    )
+
+def prune_crawl_state(conn: sqlite3.Connection, now: int, frontier_max_rows: int,
+                      edge_min_last_seen: int = 0) -> None:
+    """
+    期限切れのクールダウン、edge_min_last_seen より古い辺、frontier の優先度下位（frontier_max_rows 超）を削除。
+    コミットは呼び出し側。
+    """
+    conn.execute("DELETE FROM crawl_cooldowns WHERE until <= ?", (now,))
+    conn.execute("DELETE FROM crawl_edges WHERE last_seen < ?", (edge_min_last_seen,))
+    if frontier_max_rows > 0:
+        conn.execute(
+            """
+            DELETE FROM crawl_frontier WHERE key IN (
+              SELECT key FROM crawl_frontier ORDER BY priority LIMIT -1 OFFSET ?
+            )
+            """,
+            (frontier_max_rows,),
+        )
@@ -1,9 +1,17 @@
 from __future__ import annotations
 import asyncio
-from typing import List
+import re
+import sqlite3
+import time
+from typing import Dict, List, Optional
 from telethon import functions, types
-from telethon.errors import FloodWaitError
+from telethon.errors import (
+    FloodWaitError, InviteHashExpiredError, InviteHashInvalidError, UsernameInvalidError,
+    UsernameNotOccupiedError,
+)
 from config import Config
+from db import get_channel_meta, put_channel_meta
+from ratelimit import RateLimiter
 from util_channels import is_blocked
 
 DIALOG_CACHE: dict[str, object] = {}
@@ -20,43 +28,85 @@ async def build_dialog_cache(client, debug=False) -> None:
     if debug:
         print(f"[cache] dialogs cached: {count}")
 
-async def get_entity_safe(client, ref: str, cfg: Config, debug=False):
-    key = None
+def _dialog_key(ref: str):
     if ref.startswith("@"):
-        key = ref[1:].lower()
-    elif ref.startswith("http") and "t.me/" in ref:
+        return ref[1:].lower()
+    if ref.startswith("http") and "t.me/" in ref:
         tail = ref.split("t.me/", 1)[1].strip("/")
         if tail and not tail.startswith("+"):
-            key = tail.split("/", 1)[0].lower()
-    if key and key in DIALOG_CACHE:
-        return DIALOG_CACHE[key]
+            return tail.split("/", 1)[0].lower()
+    return None
+
+def cached_dialog(ref: str):
+    """参加済み（ダイアログにある）なら entity。API は呼ばない。"""
+    key = _dialog_key(ref)
+    return DIALOG_CACHE.get(key) if key else None
+
+def remember_dialog(ent) -> None:
+    uname = getattr(ent, "username", None)
+    if uname:
+        DIALOG_CACHE[uname.lower()] = ent
 
+# 時間をおいても解決できないことが確定するエラー（username が無い・不正、招待リンクが無効）。
+# get_entity は該当するユーザ/チャンネルが無い username に ValueError を上げる
+UNRESOLVABLE_ERRORS = (
+    ValueError, UsernameNotOccupiedError, UsernameInvalidError, InviteHashInvalidError, InviteHashExpiredError,
+)
+
+async def resolve_entity(client, ref: str, debug=False):
+    """
+    get_entity（参加済みならダイアログのキャッシュ）。解決できないことが確定したときだけ None を返し、
+    FloodWait・通信・サーバ側の一時的な失敗は例外のまま上げる。
+    """
+    ent = cached_dialog(ref)
+    if ent is not None:
+        return ent
     try:
         return await client.get_entity(ref)
-    except FloodWaitError as e:
-        wait_s = int(e.seconds)
-        if wait_s <= cfg.discovery.crawl.max_wait_on_flood_s:
-            if debug:
-                print(f"[entity] floodwait {wait_s}s on {ref}")
-            await asyncio.sleep(wait_s + cfg.discovery.crawl.floodwait_padding_s)
-            try:
-                return await client.get_entity(ref)
-            except Exception:
-                return None
-        else:
-            if debug:
-                print(f"[entity] SKIP {ref} due to huge FloodWait {wait_s}s")
-            return None
-    except Exception:
+    except UNRESOLVABLE_ERRORS as e:
+        if debug:
+            print(f"[entity] unresolvable {ref}: {e.__class__.__name__}")
         return None
 
-async def passes_channel_filters(client, cfg: Config, entity, debug=False) -> bool:
+async def get_entity_safe(client, ref: str, cfg: Config, debug=False):
+    """
+    resolve_entity の一時的な失敗も None にしたもの。
+    FloodWaitError は上げる（ここで眠らず、呼び出し側が limiter.pause で全タスクを止めてやり直す）。
+    """
+    try:
+        return await resolve_entity(client, ref, debug=debug)
+    except FloodWaitError:
+        raise
+    except Exception as e:
+        if debug:
+            print(f"[entity] failed {ref}: {e}")
+        return None
+
+async def pause_for_flood(cfg: Config, e: FloodWaitError, limiter: Optional[RateLimiter],
+                          what: str, tag: str) -> bool:
+    """
+    FloodWait を受けたとき、待てる長さ（max_wait_on_flood_s 以下）なら limiter.pause で全タスクを止めて True。
+    長すぎるなら諦めて False。limiter が無ければその場で眠る。
+    """
+    wait_s = int(e.seconds)
+    if wait_s > cfg.discovery.crawl.max_wait_on_flood_s:
+        print(f"[{tag}] skip {what} due to floodwait {wait_s}s")
+        return False
+    print(f"[{tag}] floodwait {wait_s}s on {what}")
+    if limiter is not None:
+        limiter.pause(wait_s + cfg.discovery.crawl.floodwait_padding_s)
+    else:
+        await asyncio.sleep(wait_s + cfg.discovery.crawl.floodwait_padding_s)
+    return True
+
+def passes_name_filters(cfg: Config, username: str, title: str, debug=False) -> bool:
+    """username / title だけで決まる絞り込み（API は呼ばない）。"""
     f = cfg.discovery.filters
-    title = (getattr(entity, 'title', '') or '').lower()
-    uname = (getattr(entity, 'username', '') or '').lower()
+    title = (title or '').lower()
+    uname = (username or '').lower()
     if not uname:
         return False
-    
+
     if is_blocked(uname, cfg):
         if debug:
             print(f"[discover] block @{uname}")
@@ -66,58 +116,125 @@ async def passes_channel_filters(client, cfg: Config, entity, debug=False) -> bo
         if not any(s.lower() in title or s.lower() in uname for s in f.name_must_include):
             return False
 
-    import re
     for pat in f.username_block_patterns or []:
         try:
             if re.search(pat, uname or ""):
                 return False
         except re.error:
             pass
+    return True
 
-    if f.min_members:
+async def member_count(client, cfg: Config, entity, conn: Optional[sqlite3.Connection] = None,
+                       limiter: Optional[RateLimiter] = None) -> Optional[int]:
+    """
+    参加者数。次の順に引き、API を呼ぶのは最後だけ。
+    1. entity.participants_count（検索結果の Channel には入っていることが多い）
+    2. channel_meta（discovery.meta_ttl_s 以内に取得したもの）
+    3. GetFullChannelRequest
+    1 と 3 で得た値は channel_meta に保存する。取れなければ None。
+    FloodWaitError は上げる（None にすると min_members を素通りしてしまうため）。
+    """
+    chat_id = getattr(entity, "id", None)
+    members = getattr(entity, "participants_count", None)
+    now = int(time.time())
+    if members is None and conn is not None and chat_id is not None:
+        hit = get_channel_meta(conn, chat_id, now - max(0, int(cfg.discovery.meta_ttl_s)))
+        if hit is not None and hit[2] is not None:
+            return int(hit[2])
+    if members is None:
         try:
+            if limiter is not None:
+                await limiter.acquire()
             full = await client(functions.channels.GetFullChannelRequest(entity))
-            members = getattr(full.full_chat, "participants_count", 0)
-            if members < int(f.min_members):
-                return False
+            members = getattr(full.full_chat, "participants_count", None)
+        except FloodWaitError:
+            raise
         except Exception:
-            pass
+            return None
+    if conn is not None and chat_id is not None and members is not None:
+        put_channel_meta(conn, [(chat_id, getattr(entity, "username", None), getattr(entity, "title", None),
+                                 int(members), now)])
+        conn.commit()
+    return members
+
+async def passes_channel_filters(client, cfg: Config, entity, debug=False,
+                                 conn: Optional[sqlite3.Connection] = None,
+                                 limiter: Optional[RateLimiter] = None) -> bool:
+    f = cfg.discovery.filters
+    if not passes_name_filters(cfg, getattr(entity, 'username', ''), getattr(entity, 'title', ''), debug=debug):
+        return False
+
+    if f.min_members:
+        members = await member_count(client, cfg, entity, conn=conn, limiter=limiter)
+        # 取れなかったときは従来どおり通す
+        if members is not None and members < int(f.min_members):
+            return False
 
     return True
 
-async def discover_public_channels(client, cfg: Config) -> List[str]:
-    found_usernames: List[str] = []
-    total = len(cfg.discovery.queries)
-    for i, q in enumerate(cfg.discovery.queries, 1):
+async def _search(client, cfg: Config, q: str, limiter: Optional[RateLimiter]) -> List[object]:
+    """1クエリの検索結果のうち username のある Channel。FloodWait は待てる長さなら全体を止めて1回だけやり直す。"""
+    for attempt in range(2):
         try:
+            if limiter is not None:
+                await limiter.acquire()
             res = await asyncio.wait_for(
                 client(functions.contacts.SearchRequest(q=q, limit=cfg.discovery.limit_per_query)),
                 timeout=15
             )
-            for c in list(res.chats) + list(res.users):
-                if isinstance(c, types.Channel) and getattr(c, 'username', None):
-                    ent = await get_entity_safe(client, f"@{c.username}", cfg)
-                    if not ent:
-                        continue
-                    ok = await passes_channel_filters(client, cfg, ent)
-                    if not ok:
-                        continue
-                    found_usernames.append(f"@{c.username}")
-            print(f"[discover] {i}/{total} done: '{q}' -> {len(found_usernames)} total")
-        except asyncio.TimeoutError:
-            print(f"[discover] {i}/{total} timeout on '{q}', skip")
-            continue
+            return [c for c in res.chats if isinstance(c, types.Channel) and getattr(c, 'username', None)]
         except FloodWaitError as e:
-            wait_s = int(e.seconds)
-            if wait_s <= cfg.discovery.crawl.max_wait_on_flood_s:
-                print(f"[discover] floodwait {wait_s}s on '{q}'")
-                await asyncio.sleep(wait_s + cfg.discovery.crawl.floodwait_padding_s)
-            else:
-                print(f"[discover] skip '{q}' due to huge floodwait {wait_s}s")
-            continue
-        except Exception as ex:
-            print(f"[discover] {i}/{total} err on '{q}': {ex}")
-            continue
+            if attempt or not await pause_for_flood(cfg, e, limiter, f"'{q}'", "discover"):
+                return []
+    return []
+
+async def discover_public_channels(client, cfg: Config, conn: Optional[sqlite3.Connection] = None,
+                                   limiter: Optional[RateLimiter] = None) -> List[str]:
+    """
+    cfg.discovery.queries を search_concurrency 本並列で検索し、フィルタを通った公開チャンネルを返す。
+    - 複数のクエリに出てきたチャンネルも評価は1回（chat_id で重複を除く）
+    - 検索結果の Channel をそのまま使う（username の解決はしない）
+    - min_members は member_count()（検索結果 → channel_meta → GetFullChannelRequest の順）で判定
+    """
+    queries = list(cfg.discovery.queries)
+    total = len(queries)
+    sem = asyncio.Semaphore(max(1, int(cfg.discovery.search_concurrency)))
+    seen: Dict[int, object] = {}
+    found_usernames: List[str] = []
+    done = 0
+
+    async def _passes_filters(c) -> bool:
+        # 参加者数の取得で FloodWait を受けたら全体を止めて1回だけやり直す（諦めたら通さない）
+        for attempt in range(2):
+            try:
+                return await passes_channel_filters(client, cfg, c, conn=conn, limiter=limiter)
+            except FloodWaitError as e:
+                if attempt or not await pause_for_flood(cfg, e, limiter, f"@{c.username}", "discover"):
+                    return False
+        return False
+
+    async def _one(q: str) -> None:
+        nonlocal done
+        async with sem:
+            try:
+                chats = await _search(client, cfg, q, limiter)
+            except asyncio.TimeoutError:
+                print(f"[discover] timeout on '{q}', skip")
+                chats = []
+            except Exception as ex:
+                print(f"[discover] err on '{q}': {ex}")
+                chats = []
+            fresh = [c for c in chats if c.id not in seen]
+            for c in fresh:
+                seen[c.id] = c
+            for c in fresh:
+                if await _passes_filters(c):
+                    found_usernames.append(f"@{c.username}")
+            done += 1
+            print(f"[discover] {done}/{total} done: '{q}' -> {len(found_usernames)} total "
+                  f"({len(chats)} results, {len(fresh)} new)")
+
+    await asyncio.gather(*(_one(q) for q in queries))
     return sorted(set(found_usernames))
 
 
@@ -1,20 +1,33 @@
 from __future__ import annotations
+import sqlite3
 import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Optional
-from telethon.tl.custom import Message
+from typing import List, Optional, Tuple
+
+from telethon.errors import FloodWaitError
 
 from config import Config
+from db import get_crawl_cooldown, set_crawl_cooldown
+from ratelimit import RateLimiter
 from scoring import extract_text, score_text, detect_lang_safe
 
 
-_LOW_QUALITY_UNTIL: dict[int, float] = {}  # chat_id -> unblock_epoch
+_LOW_QUALITY_UNTIL: dict[int, float] = {}  # chat_id -> unblock_epoch（conn があれば crawl_cooldowns にも保存）
 
-def mark_low_quality(chat_id: int, cooldown_s: int) -> None:
-    _LOW_QUALITY_UNTIL[chat_id] = time.time() + max(0, int(cooldown_s))
+def mark_low_quality(chat_id: int, cooldown_s: int, conn: Optional[sqlite3.Connection] = None) -> None:
+    until = time.time() + max(0, int(cooldown_s))
+    _LOW_QUALITY_UNTIL[chat_id] = until
+    if conn is not None:
+        set_crawl_cooldown(conn, chat_id, int(until))
 
-def is_low_quality_blocked(chat_id: int) -> bool:
+def is_low_quality_blocked(chat_id: int, conn: Optional[sqlite3.Connection] = None) -> bool:
     until = _LOW_QUALITY_UNTIL.get(chat_id)
+    if not until and conn is not None:
+        # 再起動後はメモリに無いので DB から引く
+        until = get_crawl_cooldown(conn, chat_id)
+        if until:
+            _LOW_QUALITY_UNTIL[chat_id] = until
     if not until:
         return False
     if time.time() >= until:
@@ -47,42 +60,120 @@ class ProbeResult:
 # 必要に応じて対象言語を追加
 TARGET_LANGS = {"ja", "en", "zh", "ru", "ar", "es"}  
 
-async def probe_channel_quality(client, cfg: Config, entity, sample_messages: int = 50) -> ProbeResult:
+# (新しい順の位置, 本文, 小文字化した本文) の列。本文の無いメッセージは位置だけ進める
+MessageWindow = List[Tuple[int, str, str]]
+
+WINDOW_CACHE_SIZE = 256
+WINDOW_PAGE_SIZE = 100  # iter_messages が1リクエストで取る件数
+
+
+class WindowCache:
+    """
+    chat_id -> (取得 limit, window) の LRU。1回のクロール実行（discover_by_crawl）の中だけで使い、
+    実行をまたいで古い履歴を持ち越さない。
+    """
+    def __init__(self, size: int = WINDOW_CACHE_SIZE):
+        self.size = max(0, int(size))
+        self._items: "OrderedDict[int, Tuple[int, MessageWindow]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: int, limit: int) -> Optional[MessageWindow]:
+        hit = self._items.get(key)
+        if hit is None or hit[0] < limit:
+            return None
+        self._items.move_to_end(key)
+        return hit[1]
+
+    def put(self, key: int, limit: int, window: MessageWindow) -> None:
+        if not self.size:
+            return
+        self._items[key] = (limit, window)
+        self._items.move_to_end(key)
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+
+async def fetch_message_window(client, entity, limit: int, cache: Optional[WindowCache] = None,
+                               limiter: Optional[RateLimiter] = None) -> MessageWindow:
+    """
+    直近 limit 件のメッセージを1回の iter_messages で取り、cache があれば chat_id ごとに覚える。
+    プローブと近傍展開は同じウィンドウを使う（limit は両者の大きい方を渡す）。
+    同じチャンネルを limit 以上で取得済みなら API は呼ばない。
+    - limiter があれば履歴の1ページ（WINDOW_PAGE_SIZE 件）ごとにトークンを取る
+    - FloodWaitError はそのまま上げる（待ち方は呼び出し側が決める）
+    """
+    limit = max(1, int(limit))
+    key = getattr(entity, "id", None)
+    if key is not None and cache is not None:
+        hit = cache.get(key, limit)
+        if hit is not None:
+            return hit
+    window: MessageWindow = []
+    try:
+        pos = 0
+        if limiter is not None:
+            await limiter.acquire()
+        async for msg in client.iter_messages(entity, limit=limit):
+            text = extract_text(msg)
+            if text:
+                window.append((pos, text, text.lower()))
+            pos += 1
+            if limiter is not None and pos % WINDOW_PAGE_SIZE == 0 and pos < limit:
+                await limiter.acquire()
+    except FloodWaitError:
+        raise
+    except Exception:
+        # 途中で失敗したウィンドウは覚えない（次回取り直す）
+        return window
+    if key is not None and cache is not None:
+        cache.put(key, limit, window)
+    return window
+
+
+def window_head(window: MessageWindow, n: int) -> MessageWindow:
+    """直近 n 件のメッセージ分に切り詰める。"""
+    n = max(1, int(n))
+    return [w for w in window if w[0] < n]
+
+
+def probe_window(cfg: Config, window: MessageWindow, sample_messages: int = 50) -> ProbeResult:
     """
-    指定チャンネルから直近 sample_messages を取り、簡易統計を返す。
+    ウィンドウのうち直近 sample_messages 件のメッセージから簡易統計を作る。
     - score_text() と cfg.score_threshold でヒット判定
     - cfg.negatives に含まれる単語が本文にあれば negative++
     - 言語は detect_lang_safe()
     """
     pr = ProbeResult()
-    try:
-        async for msg in client.iter_messages(entity, limit=max(1, int(sample_messages))):
-            if not isinstance(msg, Message):
-                pass
-            text = extract_text(msg)
-            if not text:
-                continue
-            pr.total += 1
+    negatives = [(n or "").lower() for n in (cfg.negatives or [])]
+    for _, text, lower in window_head(window, sample_messages):
+        pr.total += 1
 
-            s = score_text(text, cfg.keywords, cfg.negatives)
-            if s.score >= max(0, int(cfg.score_threshold)):
-                pr.hit += 1
+        s = score_text(text, cfg.keywords, cfg.negatives)
+        if s.score >= max(0, int(cfg.score_threshold)):
+            pr.hit += 1
 
-            lower = text.lower()
-            if any((n or "").lower() in lower for n in (cfg.negatives or [])):
-                pr.negative += 1
+        if any(n in lower for n in negatives):
+            pr.negative += 1
 
-            lang = detect_lang_safe(text)
-            if lang in TARGET_LANGS:
-                pr.target_lang_hits += 1
+        lang = detect_lang_safe(text)
+        if lang in TARGET_LANGS:
+            pr.target_lang_hits += 1
 
-            ln = len(text)
-            pr.avg_len += (ln - pr.avg_len) / pr.total 
+        ln = len(text)
+        pr.avg_len += (ln - pr.avg_len) / pr.total
+    return pr
 
-    except Exception:
-        pass
 
-    return pr
+async def probe_channel_quality(client, cfg: Config, entity, sample_messages: int = 50,
+                                window: Optional[MessageWindow] = None) -> ProbeResult:
+    """
+    指定チャンネルの直近 sample_messages を評価する。window を渡せば API は呼ばない。
+    """
+    if window is None:
+        window = await fetch_message_window(client, entity, sample_messages)
+    return probe_window(cfg, window, sample_messages)
 
 
 def pass_quality_gates(probe: ProbeResult, cfg: Config) -> tuple[bool, str]:
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import sqlite3
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Iterator, List, Optional, Sequence, Tuple
+
+from db import message_filters
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    _ARROW_AVAILABLE = True
+except Exception:
+    pa = None
+    pq = None
+    _ARROW_AVAILABLE = False
+
+EXPORT_FORMATS = ("csv", "ndjson", "parquet")
+EXPORT_CHUNK_ROWS = 5000
+
+EXPORT_COLUMNS = [
+    "date", "chat_id", "chat_title", "chat_username", "message_id",
+    "text", "text_ja", "lang", "matched_keywords", "score", "url",
+]
+
+
+@dataclass
+class ExportFilters:
+    """ビューアのサイドバーと同じ絞り込み（db.message_filters に渡す）。"""
+    dt_from: Optional[str] = None
+    dt_to: Optional[str] = None
+    min_score: int = 0
+    chat_query: Optional[str] = None
+    text_query: Optional[str] = None
+    langs: List[str] = field(default_factory=list)
+
+
+def format_for(path: str | Path, fmt: str = "auto") -> str:
+    if fmt != "auto":
+        return fmt
+    p = str(path).lower()
+    if p.endswith(".parquet"):
+        return "parquet"
+    if p.endswith(".jsonl") or p.endswith(".ndjson"):
+        return "ndjson"
+    return "csv"
+
+
+def iter_chunks(conn: sqlite3.Connection, filters: ExportFilters,
+                chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[List[Tuple]]:
+    """絞り込み結果を ts の新しい順に chunk_rows 行ずつ返す（全件をメモリに載せない）。"""
+    where, params = message_filters(conn, filters.dt_from, filters.dt_to, filters.min_score,
+                                    filters.chat_query, filters.text_query, filters.langs or None)
+    cur = conn.cursor()
+    cur.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM messages WHERE {where} ORDER BY ts DESC", params)
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            return
+        yield rows
+
+
+def write_csv(chunks: Iterator[List[Tuple]], fh: IO[bytes]) -> int:
+    # Excel でも文字化けしないよう BOM 付き UTF-8
+    out = io.TextIOWrapper(fh, encoding="utf-8-sig", newline="", write_through=True)
+    n = 0
+    try:
+        w = csv.writer(out)
+        w.writerow(EXPORT_COLUMNS)
+        for rows in chunks:
+            w.writerows(rows)
+            n += len(rows)
+        out.flush()
+    finally:
+        out.detach()
+    return n
+
+
+def write_ndjson(chunks: Iterator[List[Tuple]], fh: IO[bytes]) -> int:
+    n = 0
+    for rows in chunks:
+        fh.write("".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, r)), ensure_ascii=False) + "\n" for r in rows
+        ).encode("utf-8"))
+        n += len(rows)
+    return n
+
+
+def _arrow_schema():
+    return pa.schema([
+        ("date", pa.string()), ("chat_id", pa.int64()), ("chat_title", pa.string()),
+        ("chat_username", pa.string()), ("message_id", pa.int64()), ("text", pa.string()),
+        ("text_ja", pa.string()), ("lang", pa.string()), ("matched_keywords", pa.string()),
+        ("score", pa.int64()), ("url", pa.string()),
+    ])
+
+
+def write_parquet(chunks: Iterator[List[Tuple]], fh: IO[bytes]) -> int:
+    """チャンクごとに1つの row group として書く。"""
+    if not _ARROW_AVAILABLE:
+        raise RuntimeError("parquet export requires pyarrow (pip install pyarrow)")
+    schema = _arrow_schema()
+    n = 0
+    with pq.ParquetWriter(fh, schema, compression="zstd") as w:
+        for rows in chunks:
+            cols = list(zip(*rows))
+            w.write_batch(pa.record_batch([pa.array(c, type=f.type) for c, f in zip(cols, schema)], schema=schema))
+            n += len(rows)
+    return n
+
+
+_WRITERS = {"csv": write_csv, "ndjson": write_ndjson, "parquet": write_parquet}
+
+
+def export_messages(conn: sqlite3.Connection, out: str | Path | IO[bytes], fmt: str = "auto",
+                    filters: Optional[ExportFilters] = None,
+                    chunk_rows: int = EXPORT_CHUNK_ROWS) -> int:
+    """
+    messages を絞り込んで CSV / NDJSON / Parquet にストリーム出力する。out はパスかバイナリファイル。
+    戻り値は書き出した行数。
+    """
+    fmt = format_for(out if isinstance(out, (str, Path)) else "", fmt)
+    if fmt not in _WRITERS:
+        raise ValueError(f"unknown export format: {fmt}")
+    chunks = iter_chunks(conn, filters or ExportFilters(), chunk_rows)
+    if isinstance(out, (str, Path)):
+        with open(out, "wb") as fh:
+            return _WRITERS[fmt](chunks, fh)
+    return _WRITERS[fmt](chunks, out)
+
+
+def export_mime(fmt: str) -> str:
+    return {"csv": "text/csv", "ndjson": "application/x-ndjson",
+            "parquet": "application/vnd.apache.parquet"}.get(fmt, "application/octet-stream")
+
+
+def available_formats() -> Sequence[str]:
+    return EXPORT_FORMATS if _ARROW_AVAILABLE else tuple(f for f in EXPORT_FORMATS if f != "parquet")
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+# (src, dst) -> (count, last_seen)。キーは crawl_key（小文字の username）
+Edges = Dict[Tuple[str, str], Tuple[int, int]]
+
+
+def pagerank(A: sparse.csr_matrix, personalization: np.ndarray, alpha: float = 0.85,
+             max_iter: int = 100, tol: float = 1e-9) -> np.ndarray:
+    """
+    重み付き有向グラフ A（A[s, d] = s→d の重み）の personalized PageRank（べき乗法）。
+    出辺の無いノードの質量と (1 - alpha) は personalization に戻す。
+    """
+    n = A.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    p = personalization / personalization.sum()
+    out_w = np.asarray(A.sum(axis=1)).ravel()
+    dangling = out_w == 0
+    inv = np.where(dangling, 0.0, 1.0 / np.where(dangling, 1.0, out_w))
+    # 行正規化した遷移行列の転置（r_next = P^T r）
+    PT = (sparse.diags(inv) @ A).T.tocsr()
+    r = p.copy()
+    for _ in range(max_iter):
+        r_next = alpha * (PT @ r + r[dangling].sum() * p) + (1.0 - alpha) * p
+        if np.abs(r_next - r).sum() < tol:
+            return r_next
+        r = r_next
+    return r
+
+
+def _scaled(v: np.ndarray) -> np.ndarray:
+    top = v.max() if len(v) else 0.0
+    return v / top if top > 0 else np.zeros_like(v)
+
+
+class MentionGraph:
+    """
+    チャンネル→言及先チャンネルの重み付き有向グラフ。
+    - count は直近に取得したウィンドウ内で言及していたメッセージ数（取り直したら置き換える）
+    - crawl_edges テーブルとの読み書きは db 側の関数で行い、ここはメモリ上の辺だけを持つ
+    """
+    def __init__(self, edges: Edges | None = None):
+        self.edges: Edges = dict(edges or {})
+
+    def __len__(self) -> int:
+        return len(self.edges)
+
+    def update(self, src: str, counts: Dict[str, int], now: int) -> List[tuple]:
+        """src の言及先を更新し、保存用の (src, dst, count, last_seen) を返す。自己ループは捨てる。"""
+        rows = []
+        for dst, c in counts.items():
+            if dst == src or c <= 0:
+                continue
+            self.edges[(src, dst)] = (int(c), now)
+            rows.append((src, dst, int(c), now))
+        return rows
+
+    def matrix(self) -> Tuple[List[str], sparse.csr_matrix]:
+        nodes = sorted({k for e in self.edges for k in e})
+        idx = {k: i for i, k in enumerate(nodes)}
+        if not self.edges:
+            return nodes, sparse.csr_matrix((0, 0))
+        src = np.fromiter((idx[s] for s, _ in self.edges), dtype=np.int64, count=len(self.edges))
+        dst = np.fromiter((idx[d] for _, d in self.edges), dtype=np.int64, count=len(self.edges))
+        w = np.fromiter((c for c, _ in self.edges.values()), dtype=float, count=len(self.edges))
+        return nodes, sparse.csr_matrix((w, (src, dst)), shape=(len(nodes), len(nodes)))
+
+    def scores(self, seeds: Iterable[str], hit_rates: Dict[str, float],
+               alpha: float = 0.85) -> Dict[str, Tuple[float, float]]:
+        """
+        ノードごとの (pagerank, hit_indegree)。どちらも最大値で割って 0..1 にそろえる。
+        - pagerank:     seeds を起点にした personalized PageRank（seeds がグラフに無ければ一様）
+        - hit_indegree: 言及元のヒット率で重み付けした入次数 Σ hit_rate(s) * log1p(count(s→d))
+        """
+        nodes, A = self.matrix()
+        if not nodes:
+            return {}
+        idx = {k: i for i, k in enumerate(nodes)}
+        p = np.zeros(len(nodes))
+        for s in seeds:
+            if s in idx:
+                p[idx[s]] = 1.0
+        if p.sum() == 0:
+            p[:] = 1.0
+        pr = _scaled(pagerank(A, p, alpha=alpha))
+
+        hr = np.array([hit_rates.get(k, 0.0) for k in nodes])
+        logA = A.copy()
+        logA.data = np.log1p(logA.data)
+        hit_in = _scaled(np.asarray(logA.T @ hr).ravel())
+        return {k: (float(pr[i]), float(hit_in[i])) for i, k in enumerate(nodes)}
+
+
+def top_nodes(scores: Dict[str, Tuple[float, float]], n: int = 20,
+              by: int = 0) -> Sequence[Tuple[str, float, float]]:
+    """デバッグ表示用。by=0 で pagerank 順、1 で hit_indegree 順。"""
+    ranked = sorted(scores.items(), key=lambda kv: kv[1][by], reverse=True)[:n]
+    return [(k, pr, hi) for k, (pr, hi) in ranked]
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import datetime as dt
+import json
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import scorepool
+from config import Config
+from scoring import Scored, matched_to_json
+from writer import MessageWriter
+
+# Telegram Desktop の result.json を先頭から少しずつ読むためのパターン
+_MESSAGES_KEY_RE = re.compile(r'(?<!\\)"messages"\s*:\s*\[')
+_HDR_NAME_RE = re.compile(r'"name"\s*:\s*("(?:[^"\\]|\\.)*")')
+_HDR_ID_RE = re.compile(r'"id"\s*:\s*(-?\d+)')
+_WS = " \t\r\n"
+
+READ_CHUNK = 1 << 20
+HEADER_TAIL = 64 * 1024
+
+
+@dataclass
+class IngestStats:
+    files: int = 0
+    total: int = 0
+    hits: int = 0
+    elapsed: float = 0.0
+
+
+def parse_naive_tz(name: str) -> Optional[dt.tzinfo]:
+    """--ingest-tz の値。"local" はこの端末のローカル時刻（None で表す）、それ以外は UTC / IANA 名。"""
+    if not name or name.lower() == "local":
+        return None
+    if name.upper() == "UTC":
+        return dt.timezone.utc
+    from zoneinfo import ZoneInfo
+    return ZoneInfo(name)
+
+
+def _to_utc_iso(value: Any, naive_tz: Optional[dt.tzinfo] = dt.timezone.utc) -> str:
+    """
+    unix 秒 / ISO 文字列を stream/backfill と同じ UTC ISO 形式に。
+    tz なしの日時は naive_tz の時刻とみなす（None ならこの端末のローカル時刻）。
+    """
+    if value is None or value == "":
+        return ""
+    try:
+        if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+            return dt.datetime.fromtimestamp(int(value), tz=dt.timezone.utc).isoformat()
+        d = dt.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return ""
+    if d.tzinfo is None:
+        d = d.astimezone() if naive_tz is None else d.replace(tzinfo=naive_tz)
+    return d.astimezone(dt.timezone.utc).isoformat()
+
+
+def _tdesktop_text(value: Any) -> str:
+    """result.json の text は文字列か、文字列と {"type":..,"text":..} の混在リスト。"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "".join(p if isinstance(p, str) else str((p or {}).get("text", "")) for p in value)
+    return ""
+
+
+def iter_tdesktop_export(path: str | Path, naive_tz: Optional[dt.tzinfo] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Telegram Desktop の JSON エクスポート（単一チャット / 全データ）を逐次パースする。
+    ファイル全体は読み込まず、"messages": [...] の要素を1つずつ raw_decode で取り出す。
+    チャット名と id は直前のヘッダ部分（"name", "id"）から拾う。
+    date_unixtime がない古いエクスポートの date はエクスポートした端末のローカル時刻（tz なし）なので、
+    naive_tz（既定: この端末のローカル時刻）で解釈する。
+    """
+    dec = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buf = ""
+        eof = False
+
+        def _fill() -> None:
+            nonlocal buf, eof
+            data = f.read(READ_CHUNK)
+            if not data:
+                eof = True
+            buf += data
+
+        while True:
+            m = _MESSAGES_KEY_RE.search(buf)
+            if not m:
+                if eof:
+                    return
+                buf = buf[-HEADER_TAIL:]
+                _fill()
+                continue
+
+            header = buf[:m.start()]
+            names = _HDR_NAME_RE.findall(header)
+            ids = _HDR_ID_RE.findall(header)
+            title = json.loads(names[-1]) if names else ""
+            chat_id = int(ids[-1]) if ids else 0
+
+            pos = m.end()
+            while True:
+                while pos < len(buf) and buf[pos] in _WS:
+                    pos += 1
+                if pos >= len(buf):
+                    if eof:
+                        return
+                    buf, pos = buf[pos:], 0
+                    _fill()
+                    continue
+                ch = buf[pos]
+                if ch == ",":
+                    pos += 1
+                    continue
+                if ch == "]":
+                    pos += 1
+                    break
+                try:
+                    obj, end = dec.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    buf, pos = buf[pos:], 0
+                    _fill()
+                    continue
+                pos = end
+                if not isinstance(obj, dict) or obj.get("type", "message") != "message":
+                    continue
+                yield {
+                    "chat_id": chat_id,
+                    "title": title,
+                    "username": "",
+                    "msg_id": int(obj.get("id") or 0),
+                    "date_utc": _to_utc_iso(obj.get("date_unixtime") or obj.get("date"), naive_tz),
+                    "text": _tdesktop_text(obj.get("text")),
+                }
+            buf = buf[pos:]
+
+
+def _peer_id(value: Any) -> int:
+    # Telethon の Message.to_dict() 形式: {"_": "PeerChannel", "channel_id": ...}
+    if isinstance(value, dict):
+        for k in ("channel_id", "chat_id", "user_id"):
+            if value.get(k) is not None:
+                return int(value[k])
+        return 0
+    return int(value or 0)
+
+
+def iter_jsonl(path: str | Path) -> Iterator[Dict[str, Any]]:
+    """
+    1行1メッセージの JSONL ダンプ。キー名は多少の揺れを吸収する:
+    chat_id/peer_id, message_id/id, chat_title/title, chat_username/username, text/message/raw_text, date
+    Telethon 由来の date は UTC なので、tz なしでも UTC とみなす。
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(obj, dict):
+                continue
+            text = obj.get("text")
+            if text is None:
+                text = obj.get("message") or obj.get("raw_text") or ""
+            yield {
+                "chat_id": _peer_id(obj.get("chat_id", obj.get("peer_id"))),
+                "title": obj.get("chat_title") or obj.get("title") or "",
+                "username": (obj.get("chat_username") or obj.get("username") or "").lstrip("@"),
+                "msg_id": int(obj.get("message_id", obj.get("id")) or 0),
+                "date_utc": _to_utc_iso(obj.get("date")),
+                "text": _tdesktop_text(text),
+            }
+
+
+def detect_format(path: str | Path) -> str:
+    p = str(path).lower()
+    if p.endswith(".jsonl") or p.endswith(".ndjson"):
+        return "jsonl"
+    return "tdesktop"
+
+
+def iter_records(path: str | Path, fmt: str = "auto",
+                 naive_tz: Optional[dt.tzinfo] = None) -> Iterator[Dict[str, Any]]:
+    fmt = detect_format(path) if fmt == "auto" else fmt
+    if fmt == "jsonl":
+        return iter_jsonl(path)
+    if fmt == "tdesktop":
+        return iter_tdesktop_export(path, naive_tz)
+    raise ValueError(f"unknown ingest format: {fmt}")
+
+
+def _score_chunk(records: List[Dict[str, Any]]) -> Tuple[int, List[Dict[str, Any]]]:
+    """score_texts にかけ、ヒット行だけを persist_message 形式で返す（ワーカープロセス側）。"""
+    todo = []
+    for r in records:
+        text = r["text"] or ""
+        if text:
+            todo.append((r, text))
+    hits: List[Dict[str, Any]] = []
+    threshold = scorepool.worker_threshold()
+    for (r, text), (score, matched, lang) in zip(todo, scorepool.score_texts([t for _, t in todo])):
+        if score < threshold:
+            continue
+        username = r["username"]
+        hits.append({
+            **r,
+            "text": text,
+            "lang": lang,
+            "matched_keywords_json": matched_to_json(Scored(score=score, matched=matched)),
+            "score": score,
+            "url": f"https://t.me/{username}/{r['msg_id']}" if username else "",
+        })
+    return len(records), hits
+
+
+def _chunked(it: Iterable[Dict[str, Any]], n: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk: List[Dict[str, Any]] = []
+    for x in it:
+        chunk.append(x)
+        if len(chunk) >= n:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ingest_files(cfg: Config, conn: sqlite3.Connection, paths: List[str], fmt: str = "auto",
+                 workers: Optional[int] = None, chunk_size: int = 2000,
+                 naive_tz: Optional[dt.tzinfo] = None, debug: bool = False) -> IngestStats:
+    """
+    エクスポート/ダンプを live/backfill と同じスコアリングに通して保存する（Telegram 接続不要）。
+    - パースは逐次、スコアリングは workers プロセスで並列（1 ならこのプロセス内）
+    - 処理中のチャンク数は workers*2 までに抑えてメモリを一定に保つ
+    - 書き込みは MessageWriter でまとめて行う。翻訳はしない（text_ja は空のまま）
+    - naive_tz は tdesktop エクスポートの tz なし date の解釈（None ならローカル時刻）。JSONL は常に UTC
+    """
+    stats = IngestStats(files=len(paths))
+    t0 = time.monotonic()
+    writer = MessageWriter(conn, cfg, debug=debug)
+    init_args = scorepool.worker_args(cfg)
+    workers = max(1, int(workers or os.cpu_count() or 1))
+
+    def _consume(result: Tuple[int, List[Dict[str, Any]]]) -> None:
+        n, hits = result
+        stats.total += n
+        stats.hits += len(hits)
+        for row in hits:
+            writer.add(row)
+        if debug:
+            print(f"[ingest] scanned={stats.total} hits={stats.hits}")
+
+    chunks = _chunked((r for p in paths for r in iter_records(p, fmt, naive_tz)), max(1, chunk_size))
+    if workers == 1:
+        scorepool.init_worker(*init_args)
+        for chunk in chunks:
+            _consume(_score_chunk(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=scorepool.init_worker, initargs=init_args) as ex:
+            inflight = set()
+            for chunk in chunks:
+                inflight.add(ex.submit(_score_chunk, chunk))
+                if len(inflight) >= workers * 2:
+                    done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        _consume(fut.result())
+            for fut in inflight:
+                _consume(fut.result())
+
+    writer.flush()
+    stats.elapsed = time.monotonic() - t0
+    return stats
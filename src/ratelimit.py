@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+
+class RateLimiter:
+    """
+    全タスクで共有する Telegram API 用のトークンバケット。
+    - acquire() は1リクエスト分のトークンを待って取得（rate<=0 なら無制限）
+    - pause() は FloodWait を受けたときに全タスクをまとめて止める
+      （各タスクが個別に同じ FloodWait を踏み直さないように）
+    """
+    def __init__(self, rate_per_sec: float, burst: int = 1):
+        self.rate = float(rate_per_sec)
+        self.capacity = max(1, int(burst))
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self.acquired = 0
+        self.pauses = 0
+
+    @property
+    def paused_for(self) -> float:
+        return max(0.0, self._paused_until - time.monotonic())
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self.rate <= 0:
+                    break
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    break
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+        self.acquired += 1
+
+    def pause(self, seconds: float) -> None:
+        until = time.monotonic() + max(0.0, float(seconds))
+        if until > self._paused_until:
+            self._paused_until = until
+            self.pauses += 1
+        # 再開直後にバーストしないよう空にしておく
+        self._tokens = 0.0
+        self._last = max(self._last, until)
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from config import Config, Keywords
+from scoring import Scored, detect_lang_safe, init_keywords_fast_pattern, score_text
+
+# (score, matched, lang)。lang は閾値以上のときだけ判定し、それ以外は ""
+ScoreTuple = Tuple[int, List[str], str]
+
+# ---- ワーカープロセス側 ----
+_W_KWS: Optional[Keywords] = None
+_W_NEG: List[str] = []
+_W_THRESHOLD = 1
+
+
+def init_worker(keywords: Dict[str, List[str]], negatives: List[str], threshold: int) -> None:
+    global _W_KWS, _W_NEG, _W_THRESHOLD
+    _W_KWS = Keywords(**keywords)
+    _W_NEG = list(negatives)
+    _W_THRESHOLD = int(threshold)
+    init_keywords_fast_pattern(_W_KWS)
+
+
+def worker_threshold() -> int:
+    return _W_THRESHOLD
+
+
+def _lang(text: str) -> str:
+    try:
+        return detect_lang_safe(text)
+    except Exception:
+        return "und"
+
+
+def score_texts(texts: List[str]) -> List[ScoreTuple]:
+    """score_text → (閾値以上なら) detect_lang_safe。init_worker 済みのプロセスで呼ぶ。"""
+    out: List[ScoreTuple] = []
+    for t in texts:
+        s = score_text(t, _W_KWS, _W_NEG)
+        out.append((s.score, s.matched, _lang(t) if s.score >= _W_THRESHOLD else ""))
+    return out
+
+
+def worker_args(cfg: Config) -> tuple:
+    return (cfg.keywords.model_dump(), list(cfg.negatives or []), cfg.score_threshold)
+
+
+# ---- イベントループ側 ----
+class ScoringPool:
+    """
+    score_text と言語判定を asyncio ループの外（プロセスプール）で実行する。
+    - score() は呼び出しをマイクロバッチ（scoring_batch_size 件 or scoring_batch_ms）にまとめて投げる
+      （live の並行ハンドラ向け）
+    - score_many() は backfill のページ単位でまとめて投げる
+    - workers=0 ならプールを使わずその場で計算（従来どおり）
+    """
+    def __init__(self, cfg: Config, workers: Optional[int] = None):
+        self.cfg = cfg
+        self.workers = max(0, int(cfg.collect.scoring_workers if workers is None else workers))
+        self.batch_size = max(1, int(cfg.collect.scoring_batch_size))
+        self.batch_wait = max(0, int(cfg.collect.scoring_batch_ms)) / 1000.0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def start(self) -> None:
+        if self.workers > 0 and self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                             initargs=worker_args(self.cfg))
+
+    def _inline(self, text: str) -> Tuple[Scored, str]:
+        s = score_text(text, self.cfg.keywords, self.cfg.negatives)
+        return s, (_lang(text) if s.score >= self.cfg.score_threshold else "")
+
+    async def score(self, text: str) -> Tuple[Scored, str]:
+        if self.workers <= 0:
+            return self._inline(text)
+        self.start()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((text, fut))
+        if len(self._pending) >= self.batch_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.batch_wait, self._dispatch)
+        return await fut
+
+    async def score_many(self, texts: List[str]) -> List[Tuple[Scored, str]]:
+        if self.workers <= 0:
+            return [self._inline(t) for t in texts]
+        self.start()
+        loop = asyncio.get_running_loop()
+        chunks = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        parts = await asyncio.gather(*(loop.run_in_executor(self._pool, score_texts, c) for c in chunks))
+        return [(Scored(score=sc, matched=m), lang) for part in parts for sc, m, lang in part]
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        fut = asyncio.get_running_loop().run_in_executor(self._pool, score_texts, [t for t, _ in batch])
+
+        def _done(f: asyncio.Future) -> None:
+            exc = asyncio.CancelledError() if f.cancelled() else f.exception()
+            for i, (_, waiter) in enumerate(batch):
+                if waiter.done():
+                    continue
+                if exc is not None:
+                    waiter.set_exception(exc)
+                else:
+                    sc, m, lang = f.result()[i]
+                    waiter.set_result((Scored(score=sc, matched=m), lang))
+
+        fut.add_done_callback(_done)
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
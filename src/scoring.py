@@ -1,11 +1,17 @@
 from __future__ import annotations
 import re
 import json
+import hashlib
+import weakref
+from collections import OrderedDict, deque
 from dataclasses import dataclass
-from typing import List, Optional
-from langdetect import detect, LangDetectException
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from langdetect import DetectorFactory, detect, LangDetectException
 from config import Keywords
 
+# langdetect は既定だと実行ごとに結果が揺れるので固定
+DetectorFactory.seed = 0
+
 HASHTAG_RE  = re.compile(r"(#\S+)", re.UNICODE)
 MENTION_RE  = re.compile(r"@([A-Za-z0-9_]{4,32})")
 TME_RE      = re.compile(r"https?://t\.me/([A-Za-z0-9_+]{4,64})(?:/\d+)?")
@@ -15,26 +21,176 @@ class Scored:
     score: int
     matched: List[str]
 
-KW_FAST: Optional[re.Pattern] = None
+class KeywordMatcher:
+    """
+    Aho-Corasick によるキーワード一括照合器。
+    - casefold 済みキーワードからオートマトンを一度だけ構築
+    - find_all() は本文を1パス走査し、ヒットした元キーワード集合を返す
+    - 1メッセージあたりのコストはキーワード数に依存しない
+    """
+    __slots__ = ("_goto", "_fail", "_out", "_words")
+
+    def __init__(self, words: Iterable[str]):
+        # casefold 後のパターン -> 元キーワード（表記ゆれは全て保持）
+        by_pattern: Dict[str, List[str]] = {}
+        for w in words:
+            if not w:
+                continue
+            by_pattern.setdefault(w.casefold(), []).append(w)
+
+        goto: List[Dict[str, int]] = [{}]
+        out: List[Tuple[str, ...]] = [()]
+        for pat, originals in by_pattern.items():
+            node = 0
+            for ch in pat:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append(())
+                node = nxt
+            out[node] = out[node] + tuple(originals)
+
+        # BFS で失敗リンクを張り、出力を失敗先とマージしておく
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                cand = goto[f].get(ch, 0)
+                fail[nxt] = cand if cand != nxt else 0
+                if out[fail[nxt]]:
+                    out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+        self._words = len(by_pattern)
+
+    def __len__(self) -> int:
+        return self._words
+
+    def find_all(self, body: str) -> Set[str]:
+        """body は casefold 済みであること。"""
+        goto, fail, out = self._goto, self._fail, self._out
+        hits: Set[str] = set()
+        node = 0
+        for ch in body:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                hits.update(out[node])
+        return hits
+
 
-def init_keywords_fast_pattern(kws: Keywords) -> None:
-    global KW_FAST
-    words = set([w.casefold() for w in (kws.ja + kws.en + kws.zh + kws.ru + kws.ar)])
-    words = [w for w in words if w]
-    if not words:
-        KW_FAST = None
-        return
-    KW_FAST = re.compile("|".join(map(re.escape, sorted(words, key=len, reverse=True))),
-                         re.IGNORECASE)
+# Keywords インスタンスごとの照合器。Keywords は unhashable なので id をキーにし、
+# weakref で同一性を確かめる（インスタンスが回収されたらエントリも消す）
+_MATCHERS: Dict[int, Tuple["weakref.ref[Keywords]", Optional[KeywordMatcher]]] = {}
+
+def init_keywords_fast_pattern(kws: Keywords) -> Optional[KeywordMatcher]:
+    """kws の照合器を構築してキャッシュする（設定ロード時に呼んでおく）。"""
+    key = id(kws)
+    entry = _MATCHERS.get(key)
+    words = [w for w in (kws.ja + kws.en + kws.zh + kws.ru + kws.ar) if w]
+    matcher = KeywordMatcher(words) if words else None
+    _MATCHERS[key] = (weakref.ref(kws), matcher)
+    if entry is None or entry[0]() is not kws:
+        weakref.finalize(kws, _MATCHERS.pop, key, None)
+    return matcher
+
+def _matcher_for(kws: Keywords) -> Optional[KeywordMatcher]:
+    # 構築済みの Keywords はそのまま使い、初めて見るインスタンスのときだけ作る
+    entry = _MATCHERS.get(id(kws))
+    if entry is not None and entry[0]() is kws:
+        return entry[1]
+    return init_keywords_fast_pattern(kws)
 
 def extract_text(msg) -> str:
     return getattr(msg, "raw_text", None) or getattr(msg, "message", "") or ""
 
+# 文字種で言語がほぼ確定するもの（かな/ハングル/アラビア/キリル/漢字…）は langdetect を呼ばない
+_SCRIPT_RES = {
+    "kana":   re.compile(r"[\u3040-\u30ff\u31f0-\u31ff\uff66-\uff9f]"),
+    "han":    re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]"),
+    "hangul": re.compile(r"[\u1100-\u11ff\u3130-\u318f\uac00-\ud7af]"),
+    "arabic": re.compile(r"[\u0600-\u06ff\u0750-\u077f\u08a0-\u08ff\ufb50-\ufdff\ufe70-\ufeff]"),
+    "cyr":    re.compile(r"[\u0400-\u052f]"),
+    "greek":  re.compile(r"[\u0370-\u03ff]"),
+    "hebrew": re.compile(r"[\u0590-\u05ff]"),
+    "thai":   re.compile(r"[\u0e00-\u0e7f]"),
+    "latin":  re.compile(r"[A-Za-z\u00c0-\u024f]"),
+}
+_SCRIPT_LANG = {"hangul": "ko", "greek": "el", "hebrew": "he", "thai": "th"}
+# ペルシア語/ウルドゥー語、ウクライナ語/セルビア語などに固有の字があれば langdetect に任せる
+_NON_AR_RE = re.compile(r"[\u067e\u0686\u0698\u06af\u06a9\u06cc\u0679\u0688\u0691\u06ba\u06d2]")
+_RU_ONLY_RE = re.compile(r"[ыэёЫЭЁ]")
+_NON_RU_RE = re.compile(r"[іїєґђћџљњјІЇЄҐЂЋЏЉЊЈ]")
+# 簡体字/繁体字にしか現れない頻出字
+_ZH_CN_RE = re.compile(r"[这们个为发说时国会来对过后么经动没还进现问开关应实长东马门见头学网络击数据黑客软报号]")
+_ZH_TW_RE = re.compile(r"[這們個為發說時國會來對過後麼經動沒還進現問開關應實長東馬門見頭學網絡擊數據駭軟報號]")
+
+SCRIPT_SAMPLE_CHARS = 2000
+SCRIPT_MIN_LETTERS = 3
+SCRIPT_DOMINANT = 0.6
+LANG_CACHE_SIZE = 10000
+_LANG_CACHE: "OrderedDict[bytes, str]" = OrderedDict()
+
+def script_lang(text: str) -> Optional[str]:
+    """文字種の集計だけで決まる場合の言語コード（langdetect と同じ表記）。曖昧なら None。"""
+    sample = text[:SCRIPT_SAMPLE_CHARS]
+    counts = {k: len(rx.findall(sample)) for k, rx in _SCRIPT_RES.items()}
+    letters = sum(counts.values())
+    if letters < SCRIPT_MIN_LETTERS:
+        return None
+
+    kana, cjk = counts["kana"], counts["kana"] + counts["han"]
+    if kana >= 2 and kana * 20 >= cjk and cjk * 2 >= letters:
+        return "ja"
+
+    script, n = max(counts.items(), key=lambda kv: kv[1])
+    if n < letters * SCRIPT_DOMINANT:
+        return None
+    if script == "han" and kana == 0:
+        cn, tw = len(_ZH_CN_RE.findall(sample)), len(_ZH_TW_RE.findall(sample))
+        if cn > tw:
+            return "zh-cn"
+        if tw > cn:
+            return "zh-tw"
+        return None
+    if script == "arabic":
+        return None if _NON_AR_RE.search(sample) else "ar"
+    if script == "cyr":
+        if _RU_ONLY_RE.search(sample) and not _NON_RU_RE.search(sample):
+            return "ru"
+        return None
+    return _SCRIPT_LANG.get(script)
+
 def detect_lang_safe(text: str) -> str:
-    try:
-        return detect(text)
-    except LangDetectException:
-        return "und"
+    """
+    文字種での判定を優先し、決まらないとき（ラテン文字など）だけ langdetect。
+    結果は本文のハッシュで LANG_CACHE_SIZE 件までメモ化。
+    """
+    key = hashlib.blake2b((text or "").encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    hit = _LANG_CACHE.get(key)
+    if hit is not None:
+        _LANG_CACHE.move_to_end(key)
+        return hit
+    lang = script_lang(text or "")
+    if lang is None:
+        try:
+            lang = detect(text)
+        except LangDetectException:
+            lang = "und"
+    _LANG_CACHE[key] = lang
+    if len(_LANG_CACHE) > LANG_CACHE_SIZE:
+        _LANG_CACHE.popitem(last=False)
+    return lang
 
 def extract_candidates_from_text(text: str) -> List[str]:
     t = (text or "")
@@ -50,16 +206,10 @@ def score_text(text: str, kws: Keywords, negatives: List[str]) -> Scored:
         return Scored(score=0, matched=[])
     if any((n or "").casefold() in body for n in negatives):
         return Scored(score=0, matched=[])
-    if KW_FAST is not None and not KW_FAST.search(body):
+    matcher = _matcher_for(kws)
+    if matcher is None:
         return Scored(score=0, matched=[])
-    candidates = kws.ja + kws.en + kws.zh + kws.ru + kws.ar
-    hits: List[str] = []
-    for w in candidates:
-        if not w:
-            continue
-        if re.search(re.escape(w.casefold()), body):
-            hits.append(w)
-    uniq = sorted(set(hits))
+    uniq = sorted(matcher.find_all(body))
     return Scored(score=len(uniq), matched=uniq)
 
 def matched_to_json(s: Scored) -> str:
@@ -7,11 +7,13 @@ from typing import List, Optional
 from telethon import events
 
 from config import Config
-from db import persist_message, is_already_scored
-from scoring import extract_text, score_text, detect_lang_safe, matched_to_json
-from translate import translate_to_ja
+from db import is_already_scored
+from scoring import extract_text, matched_to_json
+from scorepool import ScoringPool
+from translate import TranslationWorker, translate_to_ja
 # from alerts import slack_notify 
 from util_channels import is_blocked
+from writer import MessageWriter
 
 import asyncio
 
@@ -23,6 +25,9 @@ class LiveStream:
     - negatives / score_threshold 適用
     - is_blocked(username) でチャンネル除外
     - 日本語訳は失敗しても空文字で継続
+    - translator があればヒットを text_ja 空で即保存し、翻訳は後から埋める
+    - 保存は MessageWriter にまとめて任せる（未指定なら自前で持つ）
+    - スコアリング/言語判定は scorer（プロセスプール可）に投げて await する
     """
     def __init__(
         self,
@@ -31,12 +36,19 @@ class LiveStream:
         conn: sqlite3.Connection,
         target_entities: Optional[List[object]] = None,
         debug: bool = False,
+        translator: Optional[TranslationWorker] = None,
+        writer: Optional[MessageWriter] = None,
+        scorer: Optional[ScoringPool] = None,
     ):
         self.client = client
         self.cfg = cfg
         self.conn = conn
         self.target_entities = target_entities
         self.debug = debug
+        self.translator = translator
+        self._own_writer = writer is None
+        self.writer = writer or MessageWriter(conn, cfg, debug=debug)
+        self.scorer = scorer or ScoringPool(cfg, workers=0)
 
         self._stop_evt = asyncio.Event()
         self._handler_ref = None
@@ -55,7 +67,7 @@ class LiveStream:
             if not text:
                 return
 
-            s = score_text(text, self.cfg.keywords, self.cfg.negatives)
+            s, lang_hint = await self.scorer.score(text)
             if s.score < self.cfg.score_threshold:
                 if self.debug:
                     print(f"[skip-live] low score {s.score} chat_id={chat.id} id={msg.id}")
@@ -72,34 +84,30 @@ class LiveStream:
             url = f"https://t.me/{username}/{msg.id}" if username else ""
             date_utc = msg.date.replace(tzinfo=dt.timezone.utc).isoformat()
 
-            try:
-                lang_hint = detect_lang_safe(text)
-            except Exception:
-                lang_hint = "und"
-
-            try:
-                text_ja = translate_to_ja(text, lang_hint, self.cfg)
-            except Exception:
-                text_ja = ""
-
-            try:
-                persist_message(
-                    self.conn,
-                    chat_id=chat.id,
-                    title=title,
-                    username=username,
-                    msg_id=msg.id,
-                    date_utc=date_utc,
-                    text=text,
-                    lang=lang_hint,
-                    matched_keywords_json=matched_to_json(s),
-                    score=s.score,
-                    url=url,
-                    text_ja=text_ja,
-                )
-                self.conn.commit()
-            except sqlite3.IntegrityError:
-                pass
+            row = dict(
+                chat_id=chat.id,
+                title=title,
+                username=username,
+                msg_id=msg.id,
+                date_utc=date_utc,
+                text=text,
+                lang=lang_hint,
+                matched_keywords_json=matched_to_json(s),
+                score=s.score,
+                url=url,
+            )
+
+            text_ja = ""
+            if self.translator is None:
+                try:
+                    text_ja = await asyncio.to_thread(translate_to_ja, text, lang_hint, self.cfg)
+                except Exception:
+                    text_ja = ""
+
+            self.writer.add(row, text_ja)
+
+            if self.translator is not None:
+                await self.translator.submit(row, wait=False)
 
             if self.debug:
                 print(f"[LIVE-HIT] score={s.score} kw={s.matched} chat={title} id={msg.id} url={url}")
@@ -121,6 +129,8 @@ class LiveStream:
     async def start(self):
         """ハンドラを登録し、停止要求が来るまで待機します。"""
         self._handler_ref = self._handler
+        if self._own_writer:
+            self.writer.start()
 
         if self.target_entities:
             self.client.add_event_handler(self._handler_ref, events.NewMessage(chats=self.target_entities))
@@ -137,6 +147,8 @@ class LiveStream:
                 except Exception:
                     pass
                 self._handler_ref = None
+            if self._own_writer:
+                await self.writer.stop()
             self._stop_evt.clear()
 
     async def stop(self):
@@ -150,6 +162,10 @@ async def run_stream(
     conn: sqlite3.Connection,
     target_entities: Optional[List[object]] = None,
     debug: bool = False,
+    translator: Optional[TranslationWorker] = None,
+    writer: Optional[MessageWriter] = None,
+    scorer: Optional[ScoringPool] = None,
 ) -> None:
-    live = LiveStream(client, cfg, conn, target_entities=target_entities, debug=debug)
+    live = LiveStream(client, cfg, conn, target_entities=target_entities, debug=debug,
+                      translator=translator, writer=writer, scorer=scorer)
     await live.start()
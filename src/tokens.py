@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import asyncio
+import re
+import sqlite3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Tuple
+
+from config import Config
+from db import persist_tokens, to_epoch
+
+# 保存時は1文字語も残し、最小文字数はビューア側（LENGTH(token)）で絞る
+TOKEN_MIN_LEN = 1
+
+_JA_TOKEN_RE = re.compile(r"[一-龥々〆ヵヶぁ-んァ-ヴーｦ-ﾟーA-Za-z0-9]+")
+
+DEFAULT_STOPWORDS = {
+    "の","に","は","を","が","と","て","で","も","や","から","まで","より","へ",
+    "です","ます","でした","だ","な","ない","いる","ある","する","なる","できる",
+    "こと","これ","それ","あれ","ため","よう","さん","など","そして","しかし","また",
+    "として","について","により","に対して","または","および","及び","もの","ために",
+    "下さい","ください","すること","でき","できた","した","しています","している","して"
+}
+
+_ALLOWED_POS = {
+    "名詞", "固有名詞", "動詞", "形容詞", "外来語"
+}
+
+# Sudachi は辞書の読み込みが重いので初回利用時に作る（無ければ正規表現にフォールバック）
+_SUDACHI = None
+_SPLIT_MODE = None
+_SUDACHI_TRIED = False
+
+
+def _sudachi():
+    global _SUDACHI, _SPLIT_MODE, _SUDACHI_TRIED
+    if not _SUDACHI_TRIED:
+        _SUDACHI_TRIED = True
+        try:
+            from sudachipy import dictionary as _dict
+            from sudachipy import tokenizer as _tok
+            _SUDACHI = _dict.Dictionary().create()
+            _SPLIT_MODE = _tok.Tokenizer.SplitMode.B  # A:短, B:中, C:長
+        except Exception:
+            _SUDACHI = None
+    return _SUDACHI
+
+
+def sudachi_available() -> bool:
+    return _sudachi() is not None
+
+
+def _tokenize_ja_sudachi(text: str, stopwords: set[str], min_len: int) -> List[str]:
+    tokens = []
+    for m in _SUDACHI.tokenize(text, _SPLIT_MODE):
+        surf = m.surface().strip().lower()
+        if len(surf) < min_len:
+            continue
+        pos = m.part_of_speech()[0] if m.part_of_speech() else ""
+        if pos not in _ALLOWED_POS:
+            continue
+        if surf in stopwords:
+            continue
+        tokens.append(surf)
+    return tokens
+
+
+def _tokenize_ja_fallback(text: str, stopwords: set[str], min_len: int) -> List[str]:
+    out = []
+    for t in _JA_TOKEN_RE.findall(text):
+        t = t.strip().lower()
+        if len(t) < min_len:
+            continue
+        if t in stopwords:
+            continue
+        out.append(t)
+    return out
+
+
+def tokenize_ja(text: str, stopwords: set[str] = DEFAULT_STOPWORDS, min_len: int = 2) -> List[str]:
+    if not isinstance(text, str) or not text:
+        return []
+    if _sudachi() is not None:
+        return _tokenize_ja_sudachi(text, stopwords, min_len)
+    return _tokenize_ja_fallback(text, stopwords, min_len)
+
+
+def token_counts(text: str) -> List[Tuple[str, int]]:
+    """message_tokens に入れる (token, 出現回数) の列。"""
+    return list(Counter(tokenize_ja(text, min_len=TOKEN_MIN_LEN)).items())
+
+
+# (chat_id, message_id, ts, [(token, tf), ...])
+TokenRow = Tuple[int, int, Optional[int], List[Tuple[str, int]]]
+
+
+def _tokenize_batch(items: List[Tuple[int, int, Optional[int], str]]) -> List[TokenRow]:
+    return [(c, m, ts, token_counts(text)) for c, m, ts, text in items]
+
+
+def rebuild_tokens(conn: sqlite3.Connection, batch: int = 2000, debug: bool = False) -> int:
+    """text_ja のある全行を再トークン化して message_tokens を作り直す。"""
+    conn.execute("DELETE FROM message_tokens")
+    conn.commit()
+    cur = conn.cursor()
+    cur.execute("SELECT chat_id, message_id, ts, text_ja FROM messages WHERE text_ja IS NOT NULL AND text_ja <> ''")
+    done = 0
+    while True:
+        items = cur.fetchmany(batch)
+        if not items:
+            break
+        persist_tokens(conn, _tokenize_batch(items))
+        conn.commit()
+        done += len(items)
+        if debug:
+            print(f"[tokens] rebuilt {done} messages")
+    return done
+
+
+class TokenWorker:
+    """
+    保存された text_ja を asyncio ループの外（1スレッド）でトークン化し、writer 経由で message_tokens に書く。
+    - MessageWriter.add() が text_ja 付きの行を受けたときに submit() される
+    - キューが溢れたら捨てる（--rebuild-tokens で後から埋め直せる）
+    - token_batch_size 件ずつまとめてスレッドに渡す
+    Sudachi のトークナイザはスレッドセーフではないのでスレッドは1本に固定。
+    """
+    def __init__(self, cfg: Config, writer: Any, debug: bool = False):
+        self.writer = writer
+        self.debug = debug
+        self.batch_size = max(1, int(cfg.collect.token_batch_size))
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, int(cfg.collect.token_queue_size)))
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.done = 0
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tokens")
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, chat_id: int, msg_id: int, date_utc: str, text_ja: str) -> bool:
+        if self._task is None or not text_ja:
+            return False
+        try:
+            self._queue.put_nowait((chat_id, msg_id, to_epoch(date_utc), text_ja))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                rows = await loop.run_in_executor(self._pool, _tokenize_batch, items)
+                self.writer.add_tokens(rows)
+                self.done += len(rows)
+            except Exception as e:
+                if self.debug:
+                    print(f"[tokens] err batch={len(items)}: {e}")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            if self.debug:
+                print(f"[tokens] stop with {self.pending} pending")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
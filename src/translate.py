@@ -1,8 +1,211 @@
 from __future__ import annotations
+import asyncio
+import hashlib
 import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set
 import requests
 from config import Config
+from db import get_cached_translation, put_cached_translation, evict_translations, touch_translations
 from deep_translator import GoogleTranslator
+from writer import MessageWriter
+
+# DeepL /v2/translate は1リクエスト50テキスト・128KiB まで
+DEEPL_MAX_TEXTS = 50
+DEEPL_MAX_BYTES = 120 * 1024
+DEEPL_BATCH_STEP = 5
+DEEPL_SOURCE_LANGS = {
+    "AR", "BG", "CS", "DA", "DE", "EL", "EN", "ES", "ET", "FI", "FR", "HU", "ID", "IT",
+    "JA", "KO", "LT", "LV", "NB", "NL", "PL", "PT", "RO", "RU", "SK", "SL", "SV", "TR",
+    "UK", "ZH",
+}
+
+
+def needs_translation(text: str, src_lang_hint: str, cfg: Config) -> bool:
+    if not cfg.translation.enabled:
+        return False
+    if not text:
+        return False
+    if (src_lang_hint or "").lower().startswith("ja"):
+        return False
+    return True
+
+
+def _deepl_endpoint(cfg: Config) -> tuple[str, str]:
+    api_key = cfg.translation.deepl_api_key or os.environ.get("DEEPL_API_KEY", "")
+    api_url = (
+        cfg.translation.deepl_api_url
+        or os.environ.get("DEEPL_API_URL")
+        or "https://api-free.deepl.com/v2/translate"
+    )
+    return api_key, api_url
+
+
+def deepl_source_lang(lang_hint: str) -> Optional[str]:
+    """langdetect のコード（zh-cn 等）を DeepL の source_lang に。未対応なら None（自動判定）。"""
+    code = (lang_hint or "").split("-", 1)[0].upper()
+    return code if code in DEEPL_SOURCE_LANGS else None
+
+
+class DeepLError(Exception):
+    """DeepL の HTTP/通信エラー。status は HTTP ステータス（通信エラーは 0）。"""
+    def __init__(self, status: int, retry_after: Optional[float] = None, detail: str = ""):
+        super().__init__(f"deepl status={status} {detail}".strip())
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+def deepl_post(texts: List[str], source_lang: Optional[str], cfg: Config) -> List[str]:
+    """
+    複数の text を1リクエストで DeepL に送る。
+    成功時は texts と同じ長さのリスト、キー未設定・通信/HTTP エラーは DeepLError。
+    """
+    api_key, api_url = _deepl_endpoint(cfg)
+    if not api_key:
+        raise DeepLError(403, detail="no api key")
+    data: List[tuple[str, str]] = [("text", t) for t in texts]
+    data.append(("target_lang", "JA"))
+    if source_lang:
+        data.append(("source_lang", source_lang))
+    try:
+        r = requests.post(
+            api_url,
+            data=data,
+            headers={"Authorization": f"DeepL-Auth-Key {api_key}"},
+            timeout=cfg.translation.timeout_sec,
+        )
+    except requests.RequestException as e:
+        raise DeepLError(0, detail=str(e)) from e
+    if not r.ok:
+        raise DeepLError(r.status_code, _retry_after(r.headers.get("Retry-After")))
+    try:
+        tr = r.json().get("translations", []) or []
+    except ValueError as e:
+        raise DeepLError(r.status_code, detail="bad json") from e
+    out = [(t.get("text", "") or "") for t in tr[:len(texts)]]
+    return out + [""] * (len(texts) - len(out))
+
+
+def deepl_translate_batch(texts: List[str], source_lang: Optional[str], cfg: Config) -> Optional[List[str]]:
+    """deepl_post のエラーを None にしたもの（単発翻訳用）。"""
+    try:
+        return deepl_post(texts, source_lang, cfg)
+    except DeepLError:
+        return None
+
+
+class DeepLBatcher:
+    """
+    DeepL のバッチサイズを AIMD で調整する。複数の翻訳スレッドから同時に呼ばれる。
+    - 成功で上限に達していたバッチなら +step
+    - 413/400（大きすぎる・不正なリクエスト）はサイズを半減し、バッチを半分に割って再送
+      （1件まで割っても駄目なら空文字）
+    - 429/5xx/通信エラーは Retry-After（無ければ指数バックオフ）だけ全スレッドで待って同じバッチを再送。
+      retry_max 回で諦めて空文字
+    - 456（文字数クォータ超過）/403（認証エラー）は stop_cooldown_s のあいだ送信を休み、その間は待たずに
+      空文字（未翻訳）を返す。休止の開始は1回だけ表示し、明けたら次のバッチで再開を試す
+    """
+    SPLIT_STATUS = {400, 413}
+    STOP_STATUS = {403, 456}
+
+    def __init__(self, cfg: Config):
+        self.cfg = cfg
+        self.size = max(1, min(DEEPL_MAX_TEXTS, int(cfg.translation.batch_size)))
+        self.requests = 0
+        self.failures = 0
+        self.paused: Optional[int] = None
+        self._paused_until = 0.0
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def _grow(self, n: int) -> None:
+        with self._lock:
+            if n >= self.size:
+                self.size = min(DEEPL_MAX_TEXTS, self.size + DEEPL_BATCH_STEP)
+
+    def _shrink(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.size = max(1, self.size // 2)
+
+    def _backoff(self, e: DeepLError, attempt: int) -> None:
+        delay = e.retry_after if e.retry_after is not None else 2.0 ** attempt
+        delay = min(delay, float(self.cfg.translation.retry_max_wait_s))
+        with self._lock:
+            self.failures += 1
+            self._resume_at = max(self._resume_at, time.monotonic() + delay)
+
+    def _pause(self, status: int) -> None:
+        cooldown = max(0, int(self.cfg.translation.stop_cooldown_s))
+        with self._lock:
+            self.failures += 1
+            first = self.paused is None
+            self.paused = status
+            self._paused_until = max(self._paused_until, time.monotonic() + cooldown)
+        if first:
+            print(f"[translate] DeepL returned {status}; pausing translation for {cooldown}s")
+
+    def _is_paused(self) -> bool:
+        with self._lock:
+            return self.paused is not None and time.monotonic() < self._paused_until
+
+    def _unpause(self) -> None:
+        with self._lock:
+            if self.paused is None:
+                return
+            self.paused = None
+        print("[translate] DeepL requests succeed again; translation resumed")
+
+    def _wait(self) -> None:
+        with self._lock:
+            remaining = self._resume_at - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def translate(self, texts: List[str], source_lang: Optional[str]) -> List[str]:
+        if not texts:
+            return []
+        for attempt in range(max(0, int(self.cfg.translation.retry_max)) + 1):
+            if self._is_paused():
+                break
+            self._wait()
+            with self._lock:
+                self.requests += 1
+            try:
+                res = deepl_post(texts, source_lang, self.cfg)
+            except DeepLError as e:
+                if e.status in self.SPLIT_STATUS:
+                    self._shrink()
+                    if len(texts) == 1:
+                        return [""]
+                    mid = len(texts) // 2
+                    return self.translate(texts[:mid], source_lang) + self.translate(texts[mid:], source_lang)
+                if e.status in self.STOP_STATUS:
+                    self._pause(e.status)
+                    break
+                if e.status == 429 or e.status >= 500 or e.status == 0:
+                    self._backoff(e, attempt)
+                    continue
+                # その他の 4xx は再送しても変わらない
+                with self._lock:
+                    self.failures += 1
+                break
+            self._unpause()
+            self._grow(len(texts))
+            return res
+        return [""] * len(texts)
 
 
 def translate_to_ja(text: str, src_lang_hint: str, cfg: Config) -> str:
@@ -11,37 +214,14 @@ def translate_to_ja(text: str, src_lang_hint: str, cfg: Config) -> str:
     provider: "deepl"（推奨） or "googletrans"
     エラーは空文字で返す（可視化側で未翻訳表示）。
     """
-    if not cfg.translation.enabled:
-        return ""
-    if not text:
-        return ""
-    if (src_lang_hint or "").lower().startswith("ja"):
+    if not needs_translation(text, src_lang_hint, cfg):
         return ""
 
     provider = (cfg.translation.provider or "deepl").lower()
 
     if provider == "deepl":
-        api_key = cfg.translation.deepl_api_key or os.environ.get("DEEPL_API_KEY", "")
-        api_url = (
-            cfg.translation.deepl_api_url
-            or os.environ.get("DEEPL_API_URL")
-            or "https://api-free.deepl.com/v2/translate"
-        )
-        if not api_key:
-            return ""
-        try:
-            r = requests.post(
-                api_url,
-                data={"text": text, "target_lang": "JA"},
-                headers={"Authorization": f"DeepL-Auth-Key {api_key}"},
-                timeout=cfg.translation.timeout_sec,
-            )
-            if r.ok:
-                data = r.json()
-                return (data.get("translations", [{}])[0].get("text", "") or "")
-        except Exception:
-            return ""
-        return ""
+        res = deepl_translate_batch([text], None, cfg)
+        return res[0] if res else ""
 
     if provider == "googletrans":
         try:
@@ -50,3 +230,256 @@ def translate_to_ja(text: str, src_lang_hint: str, cfg: Config) -> str:
             return ""
 
     return ""
+
+
+def translation_key(text: str, provider: str, target_lang: str = "JA") -> str:
+    """正規化（NFC・空白の畳み込み）した本文＋provider＋訳先言語の SHA-256。"""
+    norm = " ".join(unicodedata.normalize("NFC", text or "").split())
+    return hashlib.sha256(f"{provider}\x1f{target_lang}\x1f{norm}".encode("utf-8")).hexdigest()
+
+
+class TranslationCache:
+    """
+    翻訳結果のキャッシュ（プロセス内 LRU → translations テーブルの2段）。
+    - 転載/転送で同一本文が大量に来るチャンネル向けに、provider 呼び出し前に引く
+    - translations は last_used の古い順に件数上限と経過日数で間引く
+    - ヒット時の last_used 更新はメモリに溜め、put / evict / TOUCH_FLUSH 件ごとにまとめて書く
+      （読み取りのたびに書き込みトランザクションを開かない）
+    - conn はイベントループ側（ワーカーのコルーチン）からのみ触る
+    """
+    EVICT_EVERY = 1000
+    TOUCH_FLUSH = 1000
+
+    def __init__(self, conn: sqlite3.Connection, cfg: Config, target_lang: str = "JA"):
+        self.conn = conn
+        self.provider = (cfg.translation.provider or "deepl").lower()
+        self.target_lang = target_lang
+        self.mem_size = max(0, int(cfg.translation.cache_mem_size))
+        self.max_rows = max(0, int(cfg.translation.cache_max_rows))
+        self.max_age_s = max(0, int(cfg.translation.cache_max_age_days)) * 86400
+        self._mem: OrderedDict[str, str] = OrderedDict()
+        self._puts = 0
+        self._touched: Set[str] = set()
+        self.mem_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, text_ja: str) -> None:
+        if not self.mem_size:
+            return
+        self._mem[key] = text_ja
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.mem_size:
+            self._mem.popitem(last=False)
+
+    def get(self, text: str) -> Optional[str]:
+        key = translation_key(text, self.provider, self.target_lang)
+        hit = self._mem.get(key)
+        if hit is not None:
+            self._mem.move_to_end(key)
+            self.mem_hits += 1
+            self._touch(key)
+            return hit
+        hit = get_cached_translation(self.conn, key)
+        if hit is not None:
+            self._remember(key, hit)
+            self.db_hits += 1
+            self._touch(key)
+            return hit
+        self.misses += 1
+        return None
+
+    def _touch(self, key: str) -> None:
+        self._touched.add(key)
+        if len(self._touched) >= self.TOUCH_FLUSH:
+            self.flush_touches()
+
+    def flush_touches(self) -> None:
+        """溜めた last_used 更新を書く（コミットは writer 側のトランザクションに乗る）。"""
+        if self._touched:
+            touch_translations(self.conn, self._touched, int(time.time()))
+            self._touched.clear()
+
+    def put(self, text: str, text_ja: str) -> None:
+        if not text_ja:
+            return
+        key = translation_key(text, self.provider, self.target_lang)
+        self._remember(key, text_ja)
+        self.flush_touches()
+        put_cached_translation(self.conn, key, self.provider, self.target_lang, text_ja, int(time.time()))
+        self._puts += 1
+        if self._puts % self.EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        self.flush_touches()
+        min_last_used = int(time.time()) - self.max_age_s if self.max_age_s else 0
+        return evict_translations(self.conn, self.max_rows, min_last_used)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "mem_hits": self.mem_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "mem_size": len(self._mem),
+        }
+
+
+class TranslationWorker:
+    """
+    翻訳を asyncio ループから切り離すためのキュー＋ワーカープール。
+    - ヒットは text_ja 空で先に保存し、persist_message の引数一式を submit() する
+    - ワーカーはスレッドプールで translate_to_ja を実行し、
+      同じ行を writer 経由の UPSERT_MSG_SQL で再保存して text_ja を埋める（空なら既存値を維持）
+    - キューは有界。live 側は wait=False で溢れた分を諦め、backfill 側は待つ
+    - provider=deepl ではキューから batch_wait_ms まで溜めて言語ごとに1リクエストで送る
+    - provider 呼び出しの前に TranslationCache を引き、同一本文は再翻訳しない
+    """
+    def __init__(self, cfg: Config, conn: sqlite3.Connection, debug: bool = False,
+                 writer: Optional[MessageWriter] = None):
+        self.cfg = cfg
+        self.conn = conn
+        self.debug = debug
+        self._own_writer = writer is None
+        self.writer = writer or MessageWriter(conn, cfg, debug=debug)
+        self.workers = max(1, int(cfg.translation.workers))
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, int(cfg.translation.queue_size)))
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+        self.dropped = 0
+        self.done = 0
+        self.batched = (cfg.translation.provider or "deepl").lower() == "deepl"
+        self.batcher = DeepLBatcher(cfg)
+        self.cache = TranslationCache(conn, cfg)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        if self._own_writer:
+            self.writer.start()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="translate")
+        run = self._run_batched if self.batched else self._run
+        self._tasks = [asyncio.create_task(run()) for _ in range(self.workers)]
+
+    async def submit(self, row: Dict[str, Any], wait: bool = True) -> bool:
+        """row は persist_message のキーワード引数（conn/text_ja を除く）。"""
+        if not needs_translation(row.get("text", ""), row.get("lang", ""), self.cfg):
+            return False
+        if not self._tasks:
+            self.start()
+        if wait:
+            await self._queue.put(row)
+            return True
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.debug:
+                print(f"[translate] queue full, drop chat_id={row.get('chat_id')} id={row.get('msg_id')}")
+            return False
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            row = await self._queue.get()
+            try:
+                text_ja = self.cache.get(row["text"])
+                if text_ja is None:
+                    text_ja = await loop.run_in_executor(
+                        self._pool, translate_to_ja, row["text"], row["lang"], self.cfg
+                    )
+                    self.cache.put(row["text"], text_ja)
+                if text_ja:
+                    self.writer.add(row, text_ja)
+                    self.done += 1
+            except Exception as e:
+                if self.debug:
+                    print(f"[translate] err chat_id={row.get('chat_id')} id={row.get('msg_id')}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _collect_batch(self) -> List[Dict[str, Any]]:
+        """1件目を待ち、以降は件数/バイト上限か締め切りまでキューから集める。"""
+        loop = asyncio.get_running_loop()
+        rows = [await self._queue.get()]
+        nbytes = len(rows[0]["text"].encode("utf-8"))
+        deadline = loop.time() + max(0, self.cfg.translation.batch_wait_ms) / 1000.0
+        while len(rows) < self.batcher.size and nbytes < DEEPL_MAX_BYTES:
+            try:
+                row = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(min(remaining, 0.02))
+                continue
+            rows.append(row)
+            nbytes += len(row["text"].encode("utf-8"))
+        return rows
+
+    async def _run_batched(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            rows = await self._collect_batch()
+            try:
+                groups: Dict[Optional[str], List[Dict[str, Any]]] = {}
+                for row in rows:
+                    groups.setdefault(deepl_source_lang(row["lang"]), []).append(row)
+                for src, grp in groups.items():
+                    # キャッシュに無い本文だけを重複なしで送る
+                    resolved: Dict[str, str] = {}
+                    texts: List[str] = []
+                    for text in dict.fromkeys(r["text"] for r in grp):
+                        cached = self.cache.get(text)
+                        if cached is None:
+                            texts.append(text)
+                        else:
+                            resolved[text] = cached
+                    if texts:
+                        results = await loop.run_in_executor(self._pool, self.batcher.translate, texts, src)
+                        for text, text_ja in zip(texts, results):
+                            resolved[text] = text_ja
+                            self.cache.put(text, text_ja)
+                    for row in grp:
+                        text_ja = resolved.get(row["text"], "")
+                        if text_ja:
+                            self.writer.add(row, text_ja)
+                            self.done += 1
+                if self.debug:
+                    print(f"[translate] batch rows={len(rows)} groups={len(groups)} next_size={self.batcher.size}"
+                          f" paused={self.batcher.paused}")
+            except Exception as e:
+                if self.debug:
+                    print(f"[translate] batch err rows={len(rows)}: {e}")
+            finally:
+                for _ in rows:
+                    self._queue.task_done()
+
+    async def stop(self, drain_timeout: float = 30.0) -> None:
+        """残りのキューを drain_timeout 秒まで処理してからワーカーを止める。"""
+        if self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                if self.debug:
+                    print(f"[translate] stop with {self.pending} pending")
+            for t in self._tasks:
+                t.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+            try:
+                self.cache.evict()
+            except sqlite3.Error:
+                pass
+            if self._own_writer:
+                await self.writer.stop()
+            if self.debug:
+                print(f"[translate] done={self.done} dropped={self.dropped} cache={self.cache.stats()}")
+        if self._pool:
+            self._pool.shutdown(wait=False)
+            self._pool = None
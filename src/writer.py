@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+from config import Config
+from db import mark_scanned, persist_message, persist_messages, persist_tokens
+
+
+class MessageWriter:
+    """
+    ヒットをバッファし、1トランザクションでまとめて書き込むライター。
+    - add() は行を溜めるだけ。write_batch_size 件で即 flush
+    - start() 後は write_flush_ms ごとにバックグラウンドで flush
+    - state は flush ごとに chat 単位で1行に集約（persist_messages）
+    - mark_scanned() の走査ウォーターマークも同じトランザクションで反映
+    - text_ja 付きの行は tokenizer（TokenWorker）に回し、戻ってきた postings も add_tokens() で同様に書く
+    - stop() で残りを flush（TeleOsintApp.shutdown から呼ぶ）
+    """
+    def __init__(self, conn: sqlite3.Connection, cfg: Config, debug: bool = False):
+        self.conn = conn
+        self.debug = debug
+        self.batch_size = max(1, int(cfg.collect.write_batch_size))
+        self.flush_interval = max(0, int(cfg.collect.write_flush_ms)) / 1000.0
+        self._buf: List[Dict[str, Any]] = []
+        self._scanned: Dict[int, int] = {}
+        self._tokens: List[tuple] = []
+        self.tokenizer: Optional[Any] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.flushes = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._buf)
+
+    def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        if self.flush_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    def add(self, row: Dict[str, Any], text_ja: str = "") -> None:
+        """row は persist_message のキーワード引数（conn/text_ja を除く）。"""
+        self._buf.append({**row, "text_ja": text_ja})
+        if text_ja and self.tokenizer is not None:
+            self.tokenizer.submit(row["chat_id"], row["msg_id"], row["date_utc"], text_ja)
+        if len(self._buf) >= self.batch_size:
+            self.flush()
+
+    def add_tokens(self, rows: List[tuple]) -> None:
+        """rows は persist_tokens の形式（TokenWorker から）。"""
+        self._tokens.extend(rows)
+        if len(self._tokens) >= self.batch_size:
+            self.flush()
+
+    def mark_scanned(self, chat_id: int, msg_id: int) -> None:
+        """chat_id を msg_id まで走査し終えたことを記録（次の flush で state に反映）。"""
+        if msg_id > self._scanned.get(chat_id, 0):
+            self._scanned[chat_id] = msg_id
+
+    def flush(self) -> int:
+        rows, self._buf = self._buf, []
+        scanned, self._scanned = self._scanned, {}
+        tokens, self._tokens = self._tokens, []
+        if not rows and not scanned and not tokens:
+            # 翻訳キャッシュ等、同じ接続で開いたままの書き込みも拾ってコミットする
+            if self.conn.in_transaction:
+                self.conn.commit()
+            return 0
+        try:
+            persist_messages(self.conn, rows)
+            mark_scanned(self.conn, scanned)
+            persist_tokens(self.conn, tokens)
+            self.conn.commit()
+        except sqlite3.IntegrityError:
+            # まとめて失敗したら1件ずつ入れ直し、壊れた行だけ捨てる
+            self.conn.rollback()
+            for r in rows:
+                try:
+                    persist_message(self.conn, **r)
+                except sqlite3.IntegrityError:
+                    pass
+            mark_scanned(self.conn, scanned)
+            persist_tokens(self.conn, tokens)
+            self.conn.commit()
+        except sqlite3.OperationalError:
+            # ロック等の一時的な失敗は次回の flush に回す
+            self.conn.rollback()
+            self._buf = rows + self._buf
+            self._tokens = tokens + self._tokens
+            for chat_id, msg_id in scanned.items():
+                self.mark_scanned(chat_id, msg_id)
+            raise
+        self.written += len(rows)
+        self.flushes += 1
+        if self.debug and rows:
+            print(f"[writer] flushed {len(rows)} rows (total={self.written})")
+        return len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"[writer] flush error: {e}")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        self.flush()